@@ -6,7 +6,7 @@ export function initSettings() {
     const r = await window.api.settings.get()
     if (!r.ok) { window.setStatus('Failed to fetch settings: ' + (r.error || r.status), true); return }
     const s = r.data
-    const keys = ['CHAT_MODEL','EMBED_MODEL','CHUNK_SIZE','CHUNK_OVERLAP','REINDEX_DEBOUNCE_MS','SEARCH_THROTTLE_MS','MAX_CHUNKS_PER_QUERY']
+    const keys = ['CHAT_MODEL','EMBED_MODEL','CHUNK_SIZE','CHUNK_OVERLAP','CHUNKER','REINDEX_DEBOUNCE_MS','SEARCH_THROTTLE_MS','MAX_CHUNKS_PER_QUERY','RETRIEVAL_MODE','ANN_NPROBE']
     for (const k of keys) {
       const inp = document.getElementById('set_' + k)
       if (inp) inp.value = s[k]
@@ -20,7 +20,7 @@ export function initSettings() {
   if (save) save.onclick = async ()=>{
     const partial = {}
     function val(k) { const el = document.getElementById('set_' + k); if (!el) return undefined; const v = el.value; const n = Number(v); return isNaN(n) ? v : n }
-    for (const k of ['CHAT_MODEL','EMBED_MODEL','CHUNK_SIZE','CHUNK_OVERLAP','REINDEX_DEBOUNCE_MS','SEARCH_THROTTLE_MS','MAX_CHUNKS_PER_QUERY']) {
+    for (const k of ['CHAT_MODEL','EMBED_MODEL','CHUNK_SIZE','CHUNK_OVERLAP','CHUNKER','REINDEX_DEBOUNCE_MS','SEARCH_THROTTLE_MS','MAX_CHUNKS_PER_QUERY','RETRIEVAL_MODE','ANN_NPROBE']) {
       partial[k] = val(k)
     }
     const smEl = document.getElementById('set_SIMPLE_MODE'); if (smEl) partial.SIMPLE_MODE = smEl.checked
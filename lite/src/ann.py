@@ -0,0 +1,94 @@
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+from .storage.parquet_util import _fsync_dir
+
+
+# Below this many rows in scope exact scoring is already fast; the IVF is neither built nor used
+ANN_MIN_ROWS = 20000
+KMEANS_ITERS = 8
+# Training sample size per inverted list
+TRAIN_PER_LIST = 64
+# Retrain once the corpus has grown this many times past the size it was trained on
+RETRAIN_GROWTH = 4
+
+
+def nlist_for(n: int) -> int:
+    """Number of inverted lists for ``n`` rows (~sqrt(n), clamped)."""
+    return int(min(4096, max(8, round(np.sqrt(max(n, 1))))))
+
+
+def _unit(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (m / norms).astype(np.float32)
+
+
+def assign(x: np.ndarray, centroids: np.ndarray, batch: int = 65536) -> np.ndarray:
+    """Nearest centroid (by inner product) of every row of ``x``."""
+    out = np.empty(x.shape[0], dtype=np.int32)
+    ct = np.ascontiguousarray(centroids.T)
+    for lo in range(0, x.shape[0], batch):
+        out[lo:lo + batch] = np.argmax(x[lo:lo + batch] @ ct, axis=1)
+    return out
+
+
+def kmeans(x: np.ndarray, nlist: int, iters: int = KMEANS_ITERS, seed: int = 0) -> np.ndarray:
+    """Spherical k-means over unit rows ``x``; returns ``nlist`` unit centroids."""
+    rng = np.random.default_rng(seed)
+    n = x.shape[0]
+    nlist = max(1, min(nlist, n))
+    if n > nlist * TRAIN_PER_LIST:
+        x = x[np.sort(rng.choice(n, nlist * TRAIN_PER_LIST, replace=False))]
+        n = x.shape[0]
+    c = x[rng.choice(n, nlist, replace=False)].astype(np.float32)
+    for _ in range(iters):
+        a = assign(x, c)
+        order = np.argsort(a, kind="stable")
+        sa = a[order]
+        starts = np.flatnonzero(np.r_[True, sa[1:] != sa[:-1]])
+        sums = np.zeros_like(c)
+        sums[sa[starts]] = np.add.reduceat(x[order], starts, axis=0)
+        empty = np.ones(nlist, dtype=bool)
+        empty[sa[starts]] = False
+        if empty.any():
+            # reseed dead lists with random points
+            sums[empty] = x[rng.choice(n, int(empty.sum()), replace=False)]
+        c = _unit(sums)
+    return c
+
+
+def probe_order(centroids: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """List ids ordered by centroid similarity to ``q``, closest first."""
+    return np.argsort(-(centroids @ q), kind="stable")
+
+
+def save(path: str, centroids: np.ndarray, note_ids, chunk_index, updated_at, lists, trained_rows: int) -> None:
+    """Persist centroids plus the list of every row, keyed by (note_id, chunk_index, updated_at)."""
+    tmp = path + ".tmp.npz"
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            centroids=centroids,
+            note_ids=np.asarray(note_ids, dtype=str),
+            chunk_index=np.asarray(chunk_index, dtype=np.int64),
+            updated_at=np.asarray(updated_at, dtype=np.int64),
+            lists=np.asarray(lists, dtype=np.int32),
+            trained_rows=np.asarray([trained_rows], dtype=np.int64),
+        )
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+
+def load(path: str) -> Optional[Dict[str, np.ndarray]]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            return {k: data[k] for k in data.files}
+    except Exception:
+        return None
@@ -0,0 +1,80 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+
+from ..caches import index_generation, query_embeddings, retrieval_cache
+from ..storage.embed_cache import embed_cache
+
+
+router = APIRouter()
+
+
+@router.get("/index/embed_cache")
+def index_embed_cache():
+    return embed_cache().stats()
+
+
+@router.get("/index/caches")
+def index_caches():
+    return {
+        "query_embeddings": query_embeddings().stats(),
+        "retrieval": {**retrieval_cache().stats(), "generation": index_generation()},
+    }
+
+
+@router.get("/index/backend")
+def index_backend():
+    """Configured vector backend: stored chunks, dimension and memory/disk use."""
+    from ..vector_backends import vector_backend
+
+    return vector_backend().stats()
+
+
+@router.get("/index/status")
+def index_status():
+    """Reindex queue: depth, in-flight notes, throughput and recent errors."""
+    from ..reindex_queue import reindex_queue
+
+    return reindex_queue().status()
+
+
+class IndexRebuild(BaseModel):
+    workers: Optional[int] = None
+    # discard an interrupted rebuild instead of resuming it
+    restart: bool = False
+
+
+@router.post("/index/rebuild")
+def index_rebuild(body: IndexRebuild):
+    """Re-chunk and re-embed every note with the current settings in the background."""
+    from ..storage.rebuild import rebuild_status, start_rebuild
+
+    if not start_rebuild(body.workers, body.restart):
+        raise HTTPException(status_code=409, detail="A rebuild is already running")
+    return rebuild_status()
+
+
+@router.get("/index/rebuild/status")
+def index_rebuild_status():
+    from ..storage.rebuild import rebuild_status
+
+    return rebuild_status()
+
+
+@router.post("/index/maintenance")
+def index_maintenance():
+    """Run the nightly maintenance pass now, in the background."""
+    from ..storage.maintenance import maintenance_status, start_maintenance
+
+    if not start_maintenance():
+        raise HTTPException(status_code=409, detail="Maintenance is already running")
+    return maintenance_status()
+
+
+@router.get("/index/maintenance")
+def index_maintenance_status():
+    """Whether a pass is running and the report of the last one."""
+    from ..storage.maintenance import maintenance_status
+
+    return maintenance_status()
@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Literal, Optional, List
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
@@ -44,7 +44,8 @@ def notes_create(body: NoteCreate):
         from ..storage.indexing import reindex_note
 
         s = load_settings()
-        reindex_note(rec["id"], rec["title"], body.content or "", s["CHUNK_SIZE"], s["CHUNK_OVERLAP"])
+        reindex_note(rec["id"], rec["title"], body.content or "", s["CHUNK_SIZE"], s["CHUNK_OVERLAP"],
+                     s.get("CHUNKER", "fixed"))
     except Exception:
         pass
     return rec
@@ -68,18 +69,90 @@ def notes_update(body: NoteUpdate):
 def notes_delete(id: str):
     try:
         ok = notes_store.delete_note(id)
-        # also remove from vectorstore by metadata
-        from ..vectorstore import _collection
+        # also remove from vectorstore, embeddings table and retrieval cache
+        from ..storage.indexing import remove_note_index
 
-        try:
-            _collection.delete(where={"note_id": id})
-        except Exception:
-            pass
+        remove_note_index(id)
         return {"ok": ok}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+class BatchItem(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[str] = None
+    title: Optional[str] = None
+    content: Optional[str] = None
+
+
+class NotesBatch(BaseModel):
+    items: List[BatchItem]
+    reindex: bool = True
+    reindex_now: bool = False
+    # all-or-nothing: one invalid item rejects the whole batch
+    atomic: bool = False
+
+
+@router.post("/notes/batch")
+def notes_batch(body: NotesBatch):
+    """Apply many note edits with one metadata commit and one coalesced reindex."""
+    out = notes_store.apply_batch([it.model_dump() for it in body.items], atomic=body.atomic)
+    if not out["applied"]:
+        raise HTTPException(status_code=400, detail={"results": out["results"]})
+    if out["deleted"]:
+        try:
+            from ..storage.indexing import remove_notes_index
+
+            remove_notes_index(out["deleted"])
+        except Exception:
+            pass
+    if out["written"] and (body.reindex or body.reindex_now):
+        try:
+            from ..scheduler import schedule_reindex_many
+
+            schedule_reindex_many(list(out["written"]), immediate=bool(body.reindex_now))
+        except Exception:
+            pass
+    return {"results": out["results"]}
+
+
+class NotesImport(BaseModel):
+    path: str
+    workers: Optional[int] = None
+    reindex: bool = True
+
+
+@router.post("/notes/import")
+def notes_import(body: NotesImport):
+    """Bulk-import a markdown vault under ``VAULT_DIR`` in the background; poll /notes/import/status.
+
+    Without ``VAULT_DIR`` vaults are imported with ``python -m lite.src.storage.vault_import`` only.
+    """
+    import os
+
+    from ..storage.config import VAULT_DIR
+    from ..storage.vault_import import import_status, start_import, vault_path
+
+    if not VAULT_DIR:
+        raise HTTPException(status_code=403, detail="Set VAULT_DIR to import over HTTP, "
+                                                    "or run python -m lite.src.storage.vault_import")
+    path = vault_path(body.path)
+    if path is None:
+        raise HTTPException(status_code=403, detail=f"Not inside VAULT_DIR: {body.path}")
+    if not os.path.isdir(path):
+        raise HTTPException(status_code=400, detail=f"Not a directory: {body.path}")
+    if not start_import(path, body.workers, body.reindex):
+        raise HTTPException(status_code=409, detail="An import is already running")
+    return import_status()
+
+
+@router.get("/notes/import/status")
+def notes_import_status():
+    from ..storage.vault_import import import_status
+
+    return import_status()
+
+
 @router.get("/notes/search")
 def notes_search(q: str, note_ids: str | None = None):
     ids: List[str] = [x for x in (note_ids or "").split(",") if x]
@@ -1,6 +1,9 @@
+from typing import Literal
+
 from fastapi import APIRouter
 from pydantic import BaseModel
 
+from ..caches import bump_generation
 from ..storage.config import load_settings, save_settings
 
 
@@ -17,9 +20,13 @@ class SettingsUpdate(BaseModel):
     EMBED_MODEL: str | None = None
     CHUNK_SIZE: int | None = None
     CHUNK_OVERLAP: int | None = None
+    CHUNKER: Literal["fixed", "structured"] | None = None
     REINDEX_DEBOUNCE_MS: int | None = None
     SEARCH_THROTTLE_MS: int | None = None
     MAX_CHUNKS_PER_QUERY: int | None = None
+    RETRIEVAL_MODE: Literal["exact", "ann"] | None = None
+    ANN_NPROBE: int | None = None
+    QUANTIZATION: Literal["none", "int8", "binary"] | None = None
     SIMPLE_MODE: bool | None = None
 
 
@@ -27,4 +34,7 @@ class SettingsUpdate(BaseModel):
 def settings_update(body: SettingsUpdate):
     cur = load_settings()
     upd = {k: v for k, v in body.model_dump().items() if v is not None}
-    return save_settings({**cur, **upd})
+    saved = save_settings({**cur, **upd})
+    # retrieval depth, chunking and models feed cached results
+    bump_generation()
+    return saved
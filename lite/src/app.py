@@ -1,17 +1,26 @@
+import asyncio
+import json
 import os
 import uvicorn
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from .bootstrap import bootstrap, find_available_port
-from .vectorstore import add_documents, query
-from .ollama_client import chat
-from .storage.parquet_util import read_parquet_safe, table_path
+from .vectorstore import query_embedding
+from .ollama_client import achat, aembed_query, astream_chat
+from .caches import index_generation, normalize_query, retrieval_cache
+from .concurrency import run_cpu
+from .ingest import ingest_jobs
+from .storage.chunking import CHUNKERS
+from .storage.config import load_settings
 from .api.notes import router as notes_router
 from .api.groups import router as groups_router
 from .api.tabs import router as tabs_router
 from .api.settings import router as settings_router
+from .api.index import router as index_router
 from .scheduler import start_scheduler
 
 load_dotenv()
@@ -33,6 +42,7 @@ app.include_router(notes_router)
 app.include_router(groups_router)
 app.include_router(tabs_router)
 app.include_router(settings_router)
+app.include_router(index_router)
 
 
 class ChatIn(BaseModel):
@@ -42,6 +52,7 @@ class ChatIn(BaseModel):
     date_start: int | None = None
     date_end: int | None = None
     k: int = 6
+    mode: str = "vector"  # vector | hybrid (BM25 + vector, fused by RRF)
 
 
 @app.get("/health")
@@ -49,122 +60,71 @@ def health():
     return {"ok": True}
 
 
-@app.post("/chat")
-def chat_endpoint(body: ChatIn):
-    # Resolve allowed note ids from request
-    allowed: list[str] | None = None
-    if body.group_ids:
-        gm = read_parquet_safe(table_path("group_notes"))
-        if not gm.empty:
-            gids = [g for g in body.group_ids.split(",") if g]
-            allowed = gm[gm["group_id"].isin(gids)]["note_id"].dropna().unique().tolist()
-        else:
-            allowed = []
-    if body.note_ids:
-        ids = [x for x in body.note_ids.split(",") if x]
-        allowed = ids if allowed is None else [n for n in allowed if n in ids]
-    # Date filter on notes
-    note_filter: list[str] | None = None
-    if body.date_start or body.date_end:
-        df = read_parquet_safe(table_path("notes_index"))
-        if not df.empty:
-            if body.date_start:
-                df = df[df["updated_at"] >= int(body.date_start)]
-            if body.date_end:
-                df = df[df["updated_at"] <= int(body.date_end)]
-            note_filter = df["note_id"].tolist()
-    if note_filter is not None:
-        if allowed is None:
-            allowed = note_filter
-        else:
-            allowed = [n for n in allowed if n in note_filter]
+SEARCH_MODES = ("vector", "keyword", "hybrid")
+# Depth of each ranking fed into reciprocal rank fusion
+HYBRID_POOL = 20
 
-    # RAG using embeddings.parquet + MMR
-    from .ollama_client import embed_texts
-    import math
-    import pandas as pd
 
-    embs = read_parquet_safe(table_path("embeddings"))
-    if embs.empty:
-        # fallback: direct chat without context
-        msgs = [
-            {"role": "system", "content": "Use ONLY provided context; if not found, reply 'Not found in allowed scope'."},
-            {"role": "user", "content": body.prompt},
-        ]
-        answer = chat(msgs)
-        return {"answer": answer, "citations": []}
-
-    if allowed:
-        embs = embs[embs["note_id"].isin(allowed)]
-    if body.date_start or body.date_end:
-        embs = embs[(~embs["updated_at"].isna())]
-        if body.date_start:
-            embs = embs[embs["updated_at"] >= int(body.date_start)]
-        if body.date_end:
-            embs = embs[embs["updated_at"] <= int(body.date_end)]
-    if embs.empty:
-        return {"answer": "Not found in allowed scope", "citations": []}
-
-    qv = embed_texts([body.prompt])[0]
-
-    def norm(v):
-        n = math.sqrt(sum(x * x for x in v)) or 1.0
-        return [x / n for x in v]
-
-    qn = norm(qv)
-
-    def cos(a, b):
-        return sum(x * y for x, y in zip(a, b))
-
-    # Build candidate list
-    cand = []
-    for _, r in embs.iterrows():
-        try:
-            ev = r["embedding"]
-            if isinstance(ev, list):
-                en = norm(ev)
-                s = cos(qn, en)
-                cand.append((s, r["note_id"], int(r["chunk_index"]), r["text"]))
-        except Exception:
-            continue
-    cand.sort(key=lambda x: x[0], reverse=True)
+def _check_mode(mode: str, allowed=SEARCH_MODES) -> None:
+    if mode not in allowed:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(allowed)}")
+
+
+def _split_ids(s: str | None) -> list[str]:
+    return [x for x in (s or "").split(",") if x]
+
+
+def _resolve_scope(note_ids: str | None, group_ids: str | None, date_start: int | None,
+                   date_end: int | None):
+    """Bitmap over note ordinals of the notes in scope (None = unrestricted)."""
+    from .storage.scope import scope_resolver
+
+    return scope_resolver().resolve(_split_ids(note_ids), _split_ids(group_ids), date_start, date_end)
+
+
+def _scope_ids(allowed) -> list[str] | None:
+    from .storage.scope import ScopeResolver
+
+    return None if allowed is None else ScopeResolver.ids(allowed)
+
+
+def _chat_state(allowed) -> str:
+    """"empty" (nothing indexed), "out" (nothing in scope) or "ok"."""
+    from .vector_backends import vector_backend
+
+    backend = vector_backend()
+    if not backend.has_notes():
+        return "empty"
+    # the date range is part of ``allowed``: it filters on the note's updated_at, which
+    # chunks skipped as unchanged by a reindex do not carry
+    return "ok" if backend.in_scope(allowed) else "out"
+
+
+def _chat_context(body: ChatIn, allowed, qv) -> tuple[list[dict], list[dict]]:
+    """Nearest note chunks from the vector backend, diversified by MMR -> (messages, citations)."""
+    from .vector_backends import vector_backend
 
-    # MMR diversification
     K = max(1, int(body.k))
-    lambda_ = 0.7
-    selected: list[tuple] = []
-    selected_vecs: list[list[float]] = []
-    for score, nid, cidx, text in cand:
-        if len(selected) >= K:
-            break
-        # compute marginal relevance
-        # similarity to already selected chunks
-        if not selected:
-            selected.append((score, nid, cidx, text))
-            # store embedding vec for this text (re-read from embs)
-            try:
-                ev = embs[(embs["note_id"] == nid) & (embs["chunk_index"] == cidx)]["embedding"].iloc[0]
-                selected_vecs.append(norm(ev))
-            except Exception:
-                selected_vecs.append([])
-            continue
-        ev = embs[(embs["note_id"] == nid) & (embs["chunk_index"] == cidx)]["embedding"].iloc[0]
-        en = norm(ev) if isinstance(ev, list) else []
-        redundancy = max((cos(en, sv) for sv in selected_vecs if sv), default=0.0)
-        mmr = lambda_ * score - (1.0 - lambda_) * redundancy
-        # keep a running list of candidates with a threshold
-        # simple greedy: if mmr positive, accept
-        if mmr >= 0 or len(selected) < K:
-            selected.append((score, nid, cidx, text))
-            selected_vecs.append(en)
+    settings = load_settings()
+    candidates = int(settings.get("MAX_CHUNKS_PER_QUERY", 64))
+    nprobe = int(settings.get("ANN_NPROBE", 8)) if settings.get("RETRIEVAL_MODE") == "ann" else None
+    quantization = settings.get("QUANTIZATION", "none")
+    note_ranks = None
+    if body.mode == "hybrid":
+        from .storage.notes import search_ranked
+
+        kw = search_ranked(body.prompt, max(K, HYBRID_POOL), _scope_ids(allowed))
+        note_ranks = {h["id"]: i for i, h in enumerate(kw, start=1)}
+    selected = [
+        (h["score"], h["note_id"], h["chunk_index"], h["text"])
+        for h in vector_backend().search(qv, K, allowed, candidates=candidates,
+                                         lambda_=0.7, note_ranks=note_ranks, nprobe=nprobe, quantization=quantization)
+    ]
 
     # Build system prompt with context
-    # Fetch titles
-    idx = read_parquet_safe(table_path("notes_index"))
-    titles = {}
-    if not idx.empty:
-        for _, r in idx.iterrows():
-            titles[r["note_id"]] = r.get("title", "")
+    from .storage.notes import note_titles
+
+    titles = note_titles(list({nid for _, nid, _, _ in selected[:K]}))
     context_lines = []
     citations = []
     for s, nid, cidx, text in selected[:K]:
@@ -176,53 +136,204 @@ def chat_endpoint(body: ChatIn):
         {"role": "system", "content": sys},
         {"role": "user", "content": body.prompt},
     ]
-    answer = chat(msgs)
+    return msgs, citations
+
+
+def _retrieval_key(kind: str, q: str, note_ids: str | None, group_ids: str | None, date_start: int | None,
+                   date_end: int | None, k: int, mode: str) -> tuple:
+    def ids(s: str | None) -> tuple:
+        return tuple(sorted({x for x in (s or "").split(",") if x}))
+
+    # the generation is read before retrieval runs, so a result computed across
+    # an index change lands under a key that is already stale
+    return (kind, normalize_query(q), ids(note_ids), ids(group_ids), date_start or None, date_end or None,
+            int(k), mode, index_generation())
+
+
+async def _chat_prepare(body: ChatIn) -> tuple[list[dict] | None, list[dict], str | None]:
+    """(messages, citations, fixed answer); messages is None when the answer is fixed.
+
+    Served from the retrieval cache for a repeated prompt and scope at the same
+    index generation.
+    """
+    _check_mode(body.mode, ("vector", "hybrid"))
+    key = _retrieval_key("chat", body.prompt, body.note_ids, body.group_ids, body.date_start, body.date_end,
+                         body.k, body.mode)
+    out = retrieval_cache().get(key)
+    if out is None:
+        out = await _chat_retrieve(body)
+        retrieval_cache().put(key, out)
+    return out
+
+
+async def _chat_retrieve(body: ChatIn) -> tuple[list[dict] | None, list[dict], str | None]:
+    allowed = await run_cpu(_resolve_scope, body.note_ids, body.group_ids, body.date_start, body.date_end)
+    state = await run_cpu(_chat_state, allowed)
+    if state == "empty":
+        # fallback: direct chat without context
+        msgs = [
+            {"role": "system", "content": "Use ONLY provided context; if not found, reply 'Not found in allowed scope'."},
+            {"role": "user", "content": body.prompt},
+        ]
+        return msgs, [], None
+    if state == "out":
+        return None, [], "Not found in allowed scope"
+
+    # RAG over the resident embeddings cache + MMR
+    qv = await aembed_query(body.prompt)
+    msgs, citations = await run_cpu(_chat_context, body, allowed, qv)
+    return msgs, citations, None
+
+
+@app.post("/chat")
+async def chat_endpoint(body: ChatIn):
+    msgs, citations, fixed = await _chat_prepare(body)
+    answer = fixed if msgs is None else await achat(msgs)
     return {"answer": answer, "citations": citations}
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(body: ChatIn, request: Request):
+    """Server-Sent Events: one ``citations`` event, ``token`` events, then ``done`` (or ``error``)."""
+    msgs, citations, fixed = await _chat_prepare(body)
+
+    async def events():
+        yield _sse("citations", {"citations": citations})
+        if msgs is None:
+            yield _sse("token", {"text": fixed})
+            yield _sse("done", {})
+            return
+        tokens = astream_chat(msgs)
+        try:
+            async for tok in tokens:
+                if await request.is_disconnected():
+                    return
+                yield _sse("token", {"text": tok})
+            yield _sse("done", {})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            # stops the Ollama request if we left the loop early
+            await tokens.aclose()
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/ingest")
-async def ingest(file: UploadFile = File(...), chunk: int = Form(800), overlap: int = Form(100)):
-    raw = (await file.read()).decode("utf-8", errors="ignore")
-    chunks = []
-    i = 0
-    while i < len(raw):
-        j = min(len(raw), i + chunk)
-        text = raw[i:j]
-        cid = f"{file.filename}#{i}-{j}"
-        chunks.append({"id": cid, "text": text, "meta": {"source": file.filename}})
-        i = j - overlap if (j - overlap) > i else j
-    if chunks:
-        add_documents(chunks)
-    return {"added": len(chunks)}
+async def ingest(file: UploadFile = File(...), chunk: int = Form(800), overlap: int = Form(100),
+                 chunker: str | None = Form(None), wait: bool = Form(False)):
+    """Spool the upload and ingest it on the background worker; poll ``GET /ingest/{job_id}``.
 
+    With ``wait`` the response is sent once the job finished.
+    """
+    mode = chunker or load_settings().get("CHUNKER", "fixed")
+    if mode not in CHUNKERS:
+        raise HTTPException(status_code=400, detail=f"chunker must be one of {', '.join(CHUNKERS)}")
+    jobs = ingest_jobs()
+    job, part = await run_in_threadpool(jobs.create, file.filename, chunk, overlap, mode)
+    with open(part, "wb") as f:
+        while True:
+            data = await file.read(1 << 20)
+            if not data:
+                break
+            await run_in_threadpool(f.write, data)
+    fut = await run_in_threadpool(jobs.submit, job["job_id"])
+    if wait:
+        done = await asyncio.wrap_future(fut)
+        return {**done, "added": done["chunks"]}
+    return jobs.get(job["job_id"])
 
-@app.get("/search")
-def search(q: str, k: int = 5, note_ids: str | None = None, group_ids: str | None = None,
-           date_start: int | None = None, date_end: int | None = None):
-    # resolve allowed note ids from groups/date filters
-    allowed: list[str] | None = None
-    if group_ids:
-        gm = read_parquet_safe(table_path("group_notes"))
-        if not gm.empty:
-            gids = [g for g in group_ids.split(",") if g]
-            allowed = gm[gm["group_id"].isin(gids)]["note_id"].dropna().unique().tolist()
+
+@app.get("/ingest/jobs")
+def ingest_list():
+    return {"jobs": ingest_jobs().list()}
+
+
+@app.get("/ingest/{job_id}")
+def ingest_status(job_id: str):
+    job = ingest_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingest job")
+    return job
+
+
+@app.post("/ingest/{job_id}/retry")
+def ingest_retry(job_id: str):
+    jobs = ingest_jobs()
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingest job")
+    if job["status"] != "failed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    jobs.submit(job_id)
+    return jobs.get(job_id)
+
+
+def _keyword_hit(h: dict, score: float) -> dict:
+    from .storage.notes import get_note
+
+    try:
+        text = get_note(h["id"]).get("content", "")[:400]
+    except FileNotFoundError:
+        text = ""
+    return {"text": text, "meta": {"note_id": h["id"], "title": h.get("title")}, "distance": None, "score": score}
+
+
+def _hybrid_search(q: str, k: int, allowed: list[str] | None, qv: list) -> list[dict]:
+    from .retrieval import rrf
+    from .storage.notes import search_ranked
+
+    pool = max(k, HYBRID_POOL)
+    vec = query_embedding(qv, pool, allowed)
+    kw = search_ranked(q, pool, allowed or None)
+    # fuse at note level: a note's vector rank is that of its best chunk
+    best_hit: dict = {}
+    for i, hit in enumerate(vec):
+        key = (hit.get("meta") or {}).get("note_id") or f"#{i}"
+        best_hit.setdefault(key, hit)
+    kw_by_id = {h["id"]: h for h in kw}
+    out = []
+    for key, score in rrf([list(best_hit), list(kw_by_id)])[:k]:
+        if key in best_hit:
+            out.append({**best_hit[key], "score": score})
         else:
-            allowed = []
-    if note_ids:
-        ids = [x for x in note_ids.split(",") if x]
-        allowed = ids if allowed is None else [n for n in allowed if n in ids]
-    if date_start or date_end:
-        df = read_parquet_safe(table_path("notes_index"))
-        if not df.empty:
-            if date_start:
-                df = df[df["updated_at"] >= int(date_start)]
-            if date_end:
-                df = df[df["updated_at"] <= int(date_end)]
-            ids = df["note_id"].tolist()
-            allowed = ids if allowed is None else [n for n in allowed if n in ids]
+            out.append(_keyword_hit(kw_by_id[key], score))
+    return out
+
+
+def _keyword_search(q: str, k: int, allowed: list[str] | None) -> list[dict]:
+    from .storage.notes import search_ranked
+
+    return [_keyword_hit(h, h["score"]) for h in search_ranked(q, k, allowed or None)]
+
+
+@app.get("/search")
+async def search(q: str, k: int = 5, note_ids: str | None = None, group_ids: str | None = None,
+                 date_start: int | None = None, date_end: int | None = None, mode: str = "vector"):
+    _check_mode(mode)
+    key = _retrieval_key("search", q, note_ids, group_ids, date_start, date_end, k, mode)
+    results = retrieval_cache().get(key)
+    if results is None:
+        scope = await run_cpu(_resolve_scope, note_ids, group_ids, date_start, date_end)
+        allowed = _scope_ids(scope)
+        if allowed == []:
+            results = []
+        elif mode == "keyword":
+            results = await run_cpu(_keyword_search, q, k, allowed)
         else:
-            allowed = []
-    return {"results": query(q, k, allowed)}
+            qv = await aembed_query(q)
+            if mode == "hybrid":
+                results = await run_cpu(_hybrid_search, q, k, allowed, qv)
+            else:
+                results = await run_cpu(query_embedding, qv, k, allowed)
+        retrieval_cache().put(key, results)
+    return {"results": results}
 
 
 def run_api(auto_port: bool = True) -> int:
@@ -84,10 +84,31 @@ def bootstrap():
         validate_and_repair_metadata()
     except Exception:
         pass
+    try:
+        # VECTOR_BACKEND changed since the last start: copy the stored vectors over
+        from .vector_backends import auto_migrate as migrate_vectors
+
+        migrate_vectors()
+    except Exception:
+        pass
     try:
         seed_first_run_note()
     except Exception:
         pass
+    try:
+        # finish uploads interrupted by a crash
+        from .ingest import ingest_jobs
+
+        ingest_jobs().resume()
+    except Exception:
+        pass
+    try:
+        # notes queued for reindexing when the last run stopped
+        from .reindex_queue import reindex_queue
+
+        reindex_queue().resume()
+    except Exception:
+        pass
 
 
 def _now() -> int:
@@ -135,17 +156,18 @@ def validate_and_repair_metadata() -> None:
         except Exception:
             pass
 
+    # sqlite backend selected on a data dir that only has parquet tables: import them once
+    from .storage.migrate import auto_migrate
+
+    auto_migrate()
+
 
 def seed_first_run_note() -> None:
     # If no notes exist, create a seed note to onboard users
-    from .storage.parquet_util import read_parquet_safe, table_path
-    import pandas as pd
-    import os
+    from .storage.metadata import table
     from .storage import notes as notes_store
 
-    path = table_path("notes_index")
-    df = read_parquet_safe(path)
-    if df.empty or df.shape[0] == 0:
+    if not table("notes_index").rows({}, limit=1):
         title = "Welcome to Local Notes"
         content = (
             "# Welcome\n\n"
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """Thread-safe LRU cache whose entries also expire ``ttl`` seconds after insertion."""
+
+    def __init__(self, maxsize: int = 512, ttl: Optional[float] = None):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (self.ttl is None or time.monotonic() - item[1] < self.ttl):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+def normalize_query(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+# Query embeddings keyed by (embed model, normalized query)
+_query_embeddings = LRUCache(
+    maxsize=int(os.getenv("QUERY_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("QUERY_CACHE_TTL_S", "600")),
+)
+
+
+def query_embeddings() -> LRUCache:
+    return _query_embeddings
+
+
+# Bumped whenever indexed content, note metadata or group membership changes;
+# retrieval results cached under an older generation are never served again.
+_generation = 0
+_generation_lock = threading.Lock()
+
+_retrieval = LRUCache(maxsize=int(os.getenv("RETRIEVAL_CACHE_SIZE", "256")))
+
+
+def index_generation() -> int:
+    return _generation
+
+
+def bump_generation() -> int:
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        _retrieval.clear()
+        return _generation
+
+
+def retrieval_cache() -> LRUCache:
+    return _retrieval
@@ -0,0 +1,26 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+# Bounded pool for CPU-heavy request work (scoring, scope resolution, parquet reads)
+CPU_WORKERS = max(1, int(os.getenv("CPU_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def cpu_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+        return _executor
+
+
+async def run_cpu(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run ``fn`` on the CPU executor so the event loop stays free."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor(), partial(fn, *args, **kwargs))
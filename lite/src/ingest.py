@@ -0,0 +1,233 @@
+import codecs
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .caches import bump_generation
+from .storage.chunking import iter_chunks
+from .storage.config import META_DIR, _atomic_write
+
+
+INGEST_DIR = os.path.join(META_DIR, "ingest")
+# Chunks embedded and written to Chroma per step; progress is checkpointed after each
+INGEST_BATCH_CHUNKS = max(1, int(os.getenv("INGEST_BATCH_CHUNKS", "64")))
+# Bytes decoded per chunker step
+READ_BYTES = 1 << 16
+# Finished job records kept for the status endpoint
+KEEP_FINISHED = 100
+
+ACTIVE = ("queued", "running")
+
+
+class IngestJobs:
+    """Background ingestion of uploaded files.
+
+    An upload is spooled to ``<job_id>.src`` and a job record
+    ``<job_id>.json`` tracks it. One worker thread chunks the file as a
+    stream, embeds and writes the chunks in batches of
+    ``INGEST_BATCH_CHUNKS`` and checkpoints how many chunks are stored after
+    every batch. Jobs still queued or running when the process died are
+    picked up again by ``resume``: chunking restarts from the top, but the
+    chunks already stored are skipped without being embedded again.
+    """
+
+    def __init__(self, root: str = INGEST_DIR, add: Optional[Callable[[List[Dict]], int]] = None):
+        self.root = root
+        self._add = add
+        self._jobs: Dict[str, Dict] = {}
+        self._futures: Dict[str, Future] = {}
+        self._q: "queue.Queue[str]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._loaded = False
+
+    def _path(self, job_id: str, ext: str) -> str:
+        return os.path.join(self.root, f"{job_id}.{ext}")
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.root, name), "r", encoding="utf-8") as f:
+                    job = json.load(f)
+                self._jobs[job["job_id"]] = job
+            except Exception:
+                continue
+        self._loaded = True
+
+    def _save(self, job: Dict) -> None:
+        job["updated_at"] = int(time.time() * 1000)
+        _atomic_write(self._path(job["job_id"], "json"), json.dumps(job, ensure_ascii=False))
+
+    def create(self, filename: str, chunk: int, overlap: int, chunker: str) -> Tuple[Dict, str]:
+        """New job record plus the path the upload should be spooled to before ``submit``."""
+        with self._lock:
+            self._load()
+            ts = int(time.time() * 1000)
+            job = {
+                "job_id": uuid.uuid4().hex, "filename": filename, "chunk": int(chunk), "overlap": int(overlap),
+                "chunker": chunker, "status": "uploading", "bytes": 0, "bytes_read": 0, "chunks": 0,
+                "written": 0, "error": None, "created_at": ts, "updated_at": ts,
+            }
+            self._jobs[job["job_id"]] = job
+            return dict(job), self._path(job["job_id"], "part")
+
+    def submit(self, job_id: str) -> Future:
+        """Queue a job whose upload is spooled (or a failed one, to retry it)."""
+        with self._lock:
+            self._load()
+            job = self._jobs[job_id]
+            part = self._path(job_id, "part")
+            if os.path.exists(part):
+                os.replace(part, self._path(job_id, "src"))
+            src = self._path(job_id, "src")
+            job["bytes"] = os.path.getsize(src)
+            job["status"] = "queued"
+            job["error"] = None
+            self._save(job)
+            fut = self._futures.get(job_id)
+            if fut is None or fut.done():
+                fut = self._futures[job_id] = Future()
+            self._q.put(job_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ingest", daemon=True)
+                self._thread.start()
+            return fut
+
+    def resume(self) -> int:
+        """Requeue jobs interrupted by a crash or shutdown. Returns how many were requeued."""
+        with self._lock:
+            self._load()
+            for name in os.listdir(self.root):
+                if name.endswith(".part") and name[:-5] not in self._jobs:
+                    # upload cut off by a crash; the client never got its job id
+                    try:
+                        os.remove(os.path.join(self.root, name))
+                    except OSError:
+                        pass
+            pending = [j["job_id"] for j in sorted(self._jobs.values(), key=lambda j: j["created_at"])
+                       if j["status"] in ACTIVE and os.path.exists(self._path(j["job_id"], "src"))]
+        for job_id in pending:
+            self.submit(job_id)
+        return len(pending)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._load()
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            out = dict(job)
+        out["progress"] = 1.0 if out["status"] == "done" else (
+            min(1.0, out["bytes_read"] / out["bytes"]) if out["bytes"] else 0.0)
+        return out
+
+    def list(self) -> List[Dict]:
+        with self._lock:
+            self._load()
+            ids = sorted(self._jobs, key=lambda i: self._jobs[i]["created_at"], reverse=True)
+        return [j for j in (self.get(i) for i in ids) if j is not None]
+
+    # -- worker -------------------------------------------------------------
+    def _run(self) -> None:
+        while True:
+            job_id = self._q.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job["status"] != "queued":
+                    continue
+                job["status"] = "running"
+                self._save(job)
+            try:
+                self._process(job)
+                status, error = "done", None
+            except Exception as e:
+                status, error = "failed", str(e)
+            with self._lock:
+                job["status"] = status
+                job["error"] = error
+                self._save(job)
+                if status == "done":
+                    try:
+                        os.remove(self._path(job_id, "src"))
+                    except FileNotFoundError:
+                        pass
+                    self._prune()
+                fut = self._futures.pop(job_id, None)
+            if fut is not None and not fut.done():
+                fut.set_result(self.get(job_id))
+
+    def _pieces(self, job: Dict) -> Iterator[str]:
+        # incremental decode: a multi-byte character may straddle two reads
+        dec = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        with open(self._path(job["job_id"], "src"), "rb") as f:
+            while True:
+                data = f.read(READ_BYTES)
+                job["bytes_read"] = f.tell()
+                if not data:
+                    break
+                yield dec.decode(data)
+        yield dec.decode(b"", final=True)
+
+    def _process(self, job: Dict) -> None:
+        add = self._add
+        if add is None:
+            from .vectorstore import add_documents as add
+
+        stored = int(job["chunks"])
+        name = job["filename"]
+        n = 0
+        batch: List[Dict] = []
+        for i, j, text in iter_chunks(self._pieces(job), job["chunk"], job["overlap"], job["chunker"]):
+            n += 1
+            if n <= stored:
+                # written before the restart
+                continue
+            batch.append({"id": f"{name}#{i}-{j}", "text": text, "meta": {"source": name}})
+            if len(batch) >= INGEST_BATCH_CHUNKS:
+                self._flush(job, batch, add, n)
+                batch = []
+        self._flush(job, batch, add, n)
+        job["bytes_read"] = job["bytes"]
+
+    def _flush(self, job: Dict, batch: List[Dict], add: Callable[[List[Dict]], int], n: int) -> None:
+        # a batch cut short by a crash is retried; add_documents skips chunks the backend already holds
+        written = add(batch) if batch else 0
+        if written:
+            bump_generation()
+        with self._lock:
+            job["chunks"] = max(int(job["chunks"]), n)
+            job["written"] = int(job["written"]) + int(written or 0)
+            self._save(job)
+
+    def _prune(self) -> None:
+        done = sorted((j for j in self._jobs.values() if j["status"] not in ACTIVE + ("uploading",)),
+                      key=lambda j: j["updated_at"], reverse=True)
+        for job in done[KEEP_FINISHED:]:
+            self._jobs.pop(job["job_id"], None)
+            for ext in ("json", "json.bak", "src"):
+                try:
+                    os.remove(self._path(job["job_id"], ext))
+                except FileNotFoundError:
+                    pass
+
+
+_jobs: Optional[IngestJobs] = None
+_jobs_lock = threading.Lock()
+
+
+def ingest_jobs() -> IngestJobs:
+    global _jobs
+    with _jobs_lock:
+        if _jobs is None:
+            _jobs = IngestJobs()
+        return _jobs
@@ -1,7 +1,19 @@
+import asyncio
+import json
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import httpx
 import requests
 import math
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from .caches import normalize_query, query_embeddings
 
 load_dotenv()
 
@@ -10,11 +22,128 @@ CHAT_MODEL = os.getenv("CHAT_MODEL", "llama3.1")
 EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
 FAKE_LLM = os.getenv("FAKE_LLM", "0") == "1"
 FAKE_EMBED = os.getenv("FAKE_EMBED", "0") == "1"
+# Max texts per embedding request, and how long concurrent embed calls wait to share one
+EMBED_BATCH_SIZE = max(1, int(os.getenv("EMBED_BATCH_SIZE", "64")))
+EMBED_COALESCE_MS = max(0, int(os.getenv("EMBED_COALESCE_MS", "5")))
+OLLAMA_POOL_SIZE = max(1, int(os.getenv("OLLAMA_POOL_SIZE", "8")))
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def session() -> requests.Session:
+    """Process-wide keep-alive session to Ollama."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_POOL_SIZE)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            _session = s
+        return _session
+
+
+_aclient: Optional[httpx.AsyncClient] = None
+_aclient_loop = None
+
+
+def async_client() -> httpx.AsyncClient:
+    """Keep-alive httpx client bound to the running event loop."""
+    global _aclient, _aclient_loop
+    loop = asyncio.get_running_loop()
+    if _aclient is None or _aclient_loop is not loop:
+        _aclient = httpx.AsyncClient(
+            base_url=OLLAMA,
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            limits=httpx.Limits(max_connections=OLLAMA_POOL_SIZE, max_keepalive_connections=OLLAMA_POOL_SIZE),
+        )
+        _aclient_loop = loop
+    return _aclient
+
+
+class EmbedBatcher:
+    """Coalesces concurrent embed calls into shared micro-batches.
+
+    Callers enqueue their texts and block on a future. One flusher thread
+    takes the first waiting call, gathers whatever else arrives within
+    ``window_ms`` (or until ``batch_size`` texts are pending), and sends the
+    unique texts per model in requests of at most ``batch_size``.
+    """
+
+    def __init__(self, post: Callable[[List[str], str], List], batch_size: int = EMBED_BATCH_SIZE,
+                 window_ms: int = EMBED_COALESCE_MS):
+        self._post = post
+        self.batch_size = max(1, int(batch_size))
+        self.window = max(0, int(window_ms)) / 1000.0
+        self._q: "queue.Queue[Tuple[str, List[str], Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.calls = 0
+
+    def submit(self, texts: List[str], model: str) -> Future:
+        fut: Future = Future()
+        texts = list(texts)
+        if not texts:
+            fut.set_result([])
+            return fut
+        self._q.put((model, texts, fut))
+        with self._lock:
+            self.calls += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._thread.start()
+        return fut
+
+    def embed(self, texts: List[str], model: str) -> List:
+        return self.submit(texts, model).result()
+
+    def _run(self) -> None:
+        while True:
+            pending = [self._q.get()]
+            n = len(pending[0][1])
+            deadline = time.monotonic() + self.window
+            while n < self.batch_size:
+                rem = deadline - time.monotonic()
+                try:
+                    item = self._q.get(timeout=rem) if rem > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+                pending.append(item)
+                n += len(item[1])
+            by_model: Dict[str, List[Tuple[str, List[str], Future]]] = {}
+            for item in pending:
+                by_model.setdefault(item[0], []).append(item)
+            for model, items in by_model.items():
+                self._flush(model, items)
+
+    def _flush(self, model: str, items: List[Tuple[str, List[str], Future]]) -> None:
+        uniq: Dict[str, int] = {}
+        for _, texts, _ in items:
+            for t in texts:
+                uniq.setdefault(t, len(uniq))
+        flat = list(uniq)
+        try:
+            vecs: List = []
+            for i in range(0, len(flat), self.batch_size):
+                part = flat[i:i + self.batch_size]
+                got = self._post(part, model)
+                self.requests += 1
+                if len(got) != len(part):
+                    raise RuntimeError(f"Ollama returned {len(got)} embeddings for {len(part)} inputs")
+                vecs.extend(got)
+        except Exception as e:
+            for _, _, fut in items:
+                fut.set_exception(e)
+            return
+        for _, texts, fut in items:
+            fut.set_result([vecs[uniq[t]] for t in texts])
 
 
 def ensure_ollama_up():
     try:
-        r = requests.get(f"{OLLAMA}/api/tags", timeout=3)
+        r = session().get(f"{OLLAMA}/api/tags", timeout=3)
         r.raise_for_status()
     except Exception as e:
         raise RuntimeError(
@@ -25,47 +154,123 @@ def ensure_ollama_up():
 def pull_model(model: str):
     # Idempotent pull. If present, returns quickly; first pull may take minutes.
     try:
-        requests.post(f"{OLLAMA}/api/pull", json={"name": model}, timeout=600)
+        session().post(f"{OLLAMA}/api/pull", json={"name": model}, timeout=600)
     except requests.exceptions.ReadTimeout:
         # Some Ollama versions stream without final response; treat long pull as success path.
         pass
 
 
+def _fake_answer(messages) -> str:
+    # naive echo using last user prompt; respects guardrail prompt by checking for 'Context' substring
+    user = ""
+    for m in reversed(messages):
+        if m.get("role") == "user":
+            user = m.get("content", "")
+            break
+    return f"Answer: {user[:200]}"
+
+
 def chat(messages, model: str = CHAT_MODEL, stream: bool = False) -> str:
     if FAKE_LLM:
-        # naive echo using last user prompt; respects guardrail prompt by checking for 'Context' substring
-        user = ""
-        for m in reversed(messages):
-            if m.get("role") == "user":
-                user = m.get("content", "")
-                break
-        return f"Answer: {user[:200]}"
+        return _fake_answer(messages)
     payload = {"model": model, "messages": messages, "stream": stream}
-    r = requests.post(f"{OLLAMA}/api/chat", json=payload, timeout=300)
+    r = session().post(f"{OLLAMA}/api/chat", json=payload, timeout=300)
     r.raise_for_status()
     data = r.json()
     return data.get("message", {}).get("content", "")
 
 
+async def achat(messages, model: str = CHAT_MODEL) -> str:
+    """chat() for the event loop: waits on Ollama without holding a thread."""
+    if FAKE_LLM:
+        return _fake_answer(messages)
+    r = await async_client().post("/api/chat", json={"model": model, "messages": messages, "stream": False})
+    r.raise_for_status()
+    return r.json().get("message", {}).get("content", "")
+
+
+async def astream_chat(messages, model: str = CHAT_MODEL) -> AsyncIterator[str]:
+    """Yield answer tokens as Ollama produces them.
+
+    Closing the generator early (client went away) closes the HTTP response,
+    which makes Ollama abort the generation.
+    """
+    if FAKE_LLM:
+        for i, word in enumerate(_fake_answer(messages).split(" ")):
+            yield word if i == 0 else " " + word
+        return
+    payload = {"model": model, "messages": messages, "stream": True}
+    async with async_client().stream("POST", "/api/chat", json=payload) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if data.get("error"):
+                raise RuntimeError(data["error"])
+            tok = (data.get("message") or {}).get("content", "")
+            if tok:
+                yield tok
+            if data.get("done"):
+                return
+
+
+def _fake_embed(texts):
+    # Very simple bag-of-chars embedding into fixed small dimension
+    dim = 64
+    out = []
+    for t in texts:
+        v = [0.0] * dim
+        for ch in (t or ""):
+            v[ord(ch) % dim] += 1.0
+        # normalize
+        n = math.sqrt(sum(x * x for x in v)) or 1.0
+        out.append([x / n for x in v])
+    return out
+
+
 def embed_texts(texts, model: str = EMBED_MODEL):
     if FAKE_EMBED:
-        # Very simple bag-of-chars embedding into fixed small dimension
-        dim = 64
-        out = []
-        for t in texts:
-            v = [0.0] * dim
-            for ch in (t or ""):
-                v[ord(ch) % dim] += 1.0
-            # normalize
-            n = math.sqrt(sum(x * x for x in v)) or 1.0
-            out.append([x / n for x in v])
-        return out
-    r = requests.post(
-        f"{OLLAMA}/api/embeddings", json={"model": model, "input": texts}, timeout=300
-    )
+        return _fake_embed(texts)
+    return _batcher.embed(list(texts), model)
+
+
+async def aembed_texts(texts, model: str = EMBED_MODEL):
+    """embed_texts() for the event loop; joins the same coalesced batches."""
+    if FAKE_EMBED:
+        return _fake_embed(texts)
+    return await asyncio.wrap_future(_batcher.submit(list(texts), model))
+
+
+def embed_query(q: str, model: str = EMBED_MODEL) -> List[float]:
+    """Embedding of a search/chat query, served from the query embedding LRU when possible."""
+    key = (model, normalize_query(q))
+    cache = query_embeddings()
+    v = cache.get(key)
+    if v is None:
+        v = embed_texts([key[1]], model)[0]
+        cache.put(key, v)
+    return v
+
+
+async def aembed_query(q: str, model: str = EMBED_MODEL) -> List[float]:
+    key = (model, normalize_query(q))
+    cache = query_embeddings()
+    v = cache.get(key)
+    if v is None:
+        v = (await aembed_texts([key[1]], model))[0]
+        cache.put(key, v)
+    return v
+
+
+def _post_embed(texts: List[str], model: str) -> List:
+    # /api/embed takes a list of inputs and answers {"embeddings": [[...], ...]}
+    r = session().post(f"{OLLAMA}/api/embed", json={"model": model, "input": texts}, timeout=300)
     r.raise_for_status()
-    # API returns {"embedding": [...]} for single, {"embeddings": [[...], ...]} for batch
     js = r.json()
     if isinstance(js, dict) and "embedding" in js:
         return [js["embedding"]]
     return js.get("embeddings", [])
+
+
+_batcher = EmbedBatcher(_post_embed)
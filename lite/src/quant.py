@@ -0,0 +1,101 @@
+from typing import Optional
+
+import numpy as np
+
+
+QUANTIZATIONS = ("none", "int8", "binary")
+# First-pass survivors re-ranked with full-precision vectors, per result candidate wanted
+RERANK_FACTOR = {"int8": 4, "binary": 16}
+# Rows encoded per block
+BLOCK_ROWS = 65536
+# int8 rows widened to float32 per block while scoring: small enough to stay in cache
+SCORE_ROWS = 1024
+# set bits of every byte value, where numpy (< 2.0) has no bitwise_count
+_BYTE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+_bitwise_count = getattr(np, "bitwise_count", None)
+
+
+def popcount(x: np.ndarray) -> np.ndarray:
+    """Set bits of every uint8 in ``x``."""
+    return _bitwise_count(x) if _bitwise_count is not None else _BYTE_BITS[x]
+
+
+def code_bytes(level: str, dim: int) -> int:
+    """Bytes per row of ``level`` codes for ``dim``-wide vectors."""
+    return dim if level == "int8" else (dim + 7) // 8
+
+
+class Codes:
+    """Compact copies of an index's rows used for first-pass scoring.
+
+    ``int8``: every dimension scaled by its own factor (max |x| over the rows
+    encoded first, /127) and rounded; later rows are clipped to that range.
+    ``binary``: one sign bit per dimension, compared by Hamming distance.
+    Rows are appended in order; ``rows`` is how many are encoded.
+    """
+
+    def __init__(self, level: str, dim: int):
+        if level not in RERANK_FACTOR:
+            raise ValueError(f"quantization must be one of: {', '.join(QUANTIZATIONS)}")
+        self.level = level
+        self.dim = dim
+        self.rows = 0
+        self.scale: Optional[np.ndarray] = None
+        self._codes = np.zeros((0, code_bytes(level, dim)), dtype=np.int8 if level == "int8" else np.uint8)
+
+    @property
+    def codes(self) -> np.ndarray:
+        return self._codes[: self.rows]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._codes.nbytes) + (int(self.scale.nbytes) if self.scale is not None else 0)
+
+    def _encode(self, x: np.ndarray) -> np.ndarray:
+        if self.level == "binary":
+            return np.packbits(x > 0, axis=1)
+        return np.clip(np.rint(x / self.scale), -127, 127).astype(np.int8)
+
+    def extend(self, matrix: np.ndarray) -> None:
+        """Encode rows ``self.rows:`` of ``matrix`` (the index's rows, in order)."""
+        n = matrix.shape[0]
+        if n <= self.rows:
+            return
+        if self.level == "int8" and self.scale is None:
+            top = np.zeros(self.dim, dtype=np.float32)
+            for lo in range(0, n, BLOCK_ROWS):
+                top = np.maximum(top, np.abs(matrix[lo:lo + BLOCK_ROWS]).max(axis=0))
+            self.scale = np.where(top > 0, top / 127.0, 1.0).astype(np.float32)
+        if n > self._codes.shape[0]:
+            grown = np.zeros((max(n, 2 * self._codes.shape[0]), self._codes.shape[1]), dtype=self._codes.dtype)
+            grown[: self.rows] = self._codes[: self.rows]
+            self._codes = grown
+        for lo in range(self.rows, n, BLOCK_ROWS):
+            hi = min(n, lo + BLOCK_ROWS)
+            self._codes[lo:hi] = self._encode(np.asarray(matrix[lo:hi], dtype=np.float32))
+        self.rows = n
+
+    def scores(self, q: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Approximate similarity of ``rows`` to unit query ``q`` (higher is closer).
+
+        int8 estimates the inner product; binary returns minus the Hamming
+        distance, which only orders rows.
+        """
+        # read once: another search may be appending rows meanwhile
+        codes = self.codes
+        whole = 4 * rows.size >= codes.shape[0]
+        codes = codes if whole else codes[rows]
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        if self.level == "int8":
+            qs = (q * self.scale).astype(np.float32)
+            buf = np.empty((min(SCORE_ROWS, codes.shape[0]), self.dim), dtype=np.float32)
+            for lo in range(0, codes.shape[0], SCORE_ROWS):
+                block = codes[lo:lo + SCORE_ROWS]
+                wide = buf[: block.shape[0]]
+                np.copyto(wide, block, casting="unsafe")
+                np.matmul(wide, qs, out=out[lo:lo + block.shape[0]])
+        else:
+            qb = np.packbits(q > 0)
+            for lo in range(0, codes.shape[0], BLOCK_ROWS):
+                out[lo:lo + BLOCK_ROWS] = -popcount(codes[lo:lo + BLOCK_ROWS] ^ qb).sum(axis=1, dtype=np.int32)
+        return out[rows] if whole else out
@@ -0,0 +1,258 @@
+import collections
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .storage.config import META_DIR, _atomic_write
+
+
+QUEUE_PATH = os.path.join(META_DIR, "reindex_queue.json")
+# Concurrent reindex batches
+REINDEX_WORKERS = max(1, int(os.getenv("REINDEX_WORKERS", "2")))
+# Notes per batch: their chunks share embedding requests and one embedding-store segment
+REINDEX_BATCH_NOTES = max(1, int(os.getenv("REINDEX_BATCH_NOTES", "32")))
+# Attempts before a failing note is dropped; retries back off 2 s, 4 s, ...
+MAX_ATTEMPTS = 3
+# Errors kept for the status endpoint
+KEEP_ERRORS = 20
+# Window for the throughput figure
+RATE_WINDOW_MS = 60_000
+
+HIGH, NORMAL = 0, 1
+
+
+def _now() -> int:
+    return int(time.time() * 1000)
+
+
+def _debounce_ms() -> int:
+    try:
+        from .storage.config import load_settings
+
+        return int(load_settings().get("REINDEX_DEBOUNCE_MS", 500))
+    except Exception:
+        return 500
+
+
+def _reindex(note_ids: List[str]) -> int:
+    from .storage import notes as notes_store
+    from .storage.config import load_settings
+    from .storage.indexing import reindex_notes
+
+    s = load_settings()
+    items = []
+    for nid in note_ids:
+        try:
+            rec = notes_store.get_note(nid)
+        except FileNotFoundError:
+            # deleted since it was queued; remove_note_index already dropped its chunks
+            continue
+        items.append((nid, rec.get("title", ""), rec.get("content", "")))
+    if not items:
+        return 0
+    return reindex_notes(items, s["CHUNK_SIZE"], s["CHUNK_OVERLAP"], s.get("CHUNKER", "fixed"))
+
+
+class ReindexQueue:
+    """Debounced, persistent queue of notes waiting to be re-embedded.
+
+    ``enqueue`` (re)sets a note's due time to now + ``REINDEX_DEBOUNCE_MS``,
+    so a burst of edits costs one reindex; ``immediate`` makes it due now at
+    high priority. A dispatcher thread hands due notes, high priority first,
+    to at most ``workers`` concurrent batches of up to ``batch`` notes, each
+    reindexed with one ``reindex_notes`` call. A note edited while its batch
+    runs is queued again and runs after it. Pending and in-flight notes are
+    saved to ``path`` so ``resume`` picks them up after a restart.
+    """
+
+    def __init__(self, path: str = QUEUE_PATH, reindex: Optional[Callable[[List[str]], int]] = None,
+                 workers: int = REINDEX_WORKERS, batch: int = REINDEX_BATCH_NOTES):
+        self.path = path
+        self.workers = max(1, int(workers))
+        self.batch = max(1, int(batch))
+        self._reindex = reindex or _reindex
+        self._pending: Dict[str, Dict] = {}
+        self._inflight: Dict[str, Dict] = {}
+        self._active = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._loaded = False
+        self._done = 0
+        self._failed = 0
+        self._chunks = 0
+        self._recent: Deque[Tuple[int, int]] = collections.deque()
+        self._errors: Deque[Dict] = collections.deque(maxlen=KEEP_ERRORS)
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._pending.update(json.load(f).get("pending") or {})
+        except Exception:
+            # missing or unreadable: the notes are still reindexed on their next edit
+            pass
+        self._loaded = True
+
+    def _save(self) -> None:
+        # in-flight notes are saved too: a crash mid-batch reruns them
+        pending = {**self._inflight, **self._pending}
+        try:
+            _atomic_write(self.path, json.dumps({"pending": pending}))
+        except Exception:
+            pass
+
+    def _start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="reindex")
+            self._thread = threading.Thread(target=self._run, name="reindex-dispatch", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, note_ids: List[str], immediate: bool = False) -> None:
+        delay = 0 if immediate else _debounce_ms()
+        with self._cond:
+            self._load()
+            now = _now()
+            for nid in note_ids:
+                old = self._pending.get(nid)
+                prio = HIGH if immediate or (old is not None and old["priority"] == HIGH) else NORMAL
+                due = now if prio == HIGH else now + delay
+                self._pending[nid] = {"due": due, "priority": prio, "queued_at": old["queued_at"] if old else now,
+                                      "attempts": old["attempts"] if old else 0}
+            self._save()
+            self._start()
+            self._cond.notify_all()
+
+    def resume(self) -> int:
+        """Start working on notes left queued by the previous run. Returns how many."""
+        with self._cond:
+            self._load()
+            n = len(self._pending)
+            if n:
+                self._start()
+                self._cond.notify_all()
+            return n
+
+    def status(self) -> Dict:
+        with self._cond:
+            self._load()
+            now = _now()
+            while self._recent and self._recent[0][0] < now - RATE_WINDOW_MS:
+                self._recent.popleft()
+            return {
+                "pending": len(self._pending),
+                "due": sum(1 for e in self._pending.values() if e["due"] <= now),
+                "high_priority": sum(1 for e in self._pending.values() if e["priority"] == HIGH),
+                "in_flight": sorted(self._inflight),
+                "workers": self.workers,
+                "busy_workers": self._active,
+                "done": self._done,
+                "failed": self._failed,
+                "chunks": self._chunks,
+                "notes_per_min": sum(n for _, n in self._recent) * 60_000 / RATE_WINDOW_MS,
+                "last_errors": list(self._errors),
+            }
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Block until nothing is pending or running (due or not). False on timeout."""
+        end = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._pending or self._inflight:
+                left = None if end is None else end - time.time()
+                if left is not None and left <= 0:
+                    return False
+                self._cond.wait(left)
+            return True
+
+    # -- dispatcher -----------------------------------------------------------
+    def _take(self) -> List[str]:
+        if self._active >= self.workers:
+            return []
+        now = _now()
+        due = sorted(((e["priority"], e["due"], nid) for nid, e in self._pending.items()
+                      if e["due"] <= now and nid not in self._inflight))
+        ids = [nid for _, _, nid in due[: self.batch]]
+        for nid in ids:
+            self._inflight[nid] = self._pending.pop(nid)
+        if ids:
+            self._active += 1
+        return ids
+
+    def _wait_s(self) -> Optional[float]:
+        if self._active >= self.workers:
+            return None
+        waiting = [e["due"] for nid, e in self._pending.items() if nid not in self._inflight]
+        if not waiting:
+            return None
+        return max(0.0, (min(waiting) - _now()) / 1000.0) + 0.001
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                ids = self._take()
+                while not ids:
+                    self._cond.wait(self._wait_s())
+                    ids = self._take()
+            self._pool.submit(self._process, ids)
+
+    def _reindex_each(self, ids: List[str]) -> Tuple[int, Dict[str, str]]:
+        """Chunks written and the error of each note that failed.
+
+        A failed batch is retried one note at a time, so a note that cannot be
+        reindexed does not cost the rest of its batch an attempt.
+        """
+        try:
+            return int(self._reindex(ids) or 0), {}
+        except Exception as e:
+            if len(ids) == 1:
+                return 0, {ids[0]: f"{type(e).__name__}: {e}"}
+        chunks, errors = 0, {}
+        for nid in ids:
+            n, failed = self._reindex_each([nid])
+            chunks += n
+            errors.update(failed)
+        return chunks, errors
+
+    def _process(self, ids: List[str]) -> None:
+        chunks, errors = self._reindex_each(ids)
+        with self._cond:
+            now = _now()
+            ok = len(ids) - len(errors)
+            self._done += ok
+            self._chunks += chunks
+            if ok:
+                self._recent.append((now, ok))
+            if errors:
+                failed = list(errors)
+                self._errors.append({"at": now, "note_ids": failed[:10], "notes": len(failed), "error": errors[failed[0]]})
+            for nid in ids:
+                entry = self._inflight.pop(nid)
+                if nid not in errors or nid in self._pending:
+                    # done, or edited again while running: the newer entry wins
+                    continue
+                entry["attempts"] += 1
+                if entry["attempts"] >= MAX_ATTEMPTS:
+                    self._failed += 1
+                    continue
+                entry["due"] = now + 1000 * 2 ** entry["attempts"]
+                self._pending[nid] = entry
+            self._active -= 1
+            self._save()
+            self._cond.notify_all()
+
+
+_queue: Optional[ReindexQueue] = None
+_queue_lock = threading.Lock()
+
+
+def reindex_queue() -> ReindexQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = ReindexQueue()
+        return _queue
@@ -0,0 +1,703 @@
+import copy
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from . import ann, quant
+from .storage.parquet_util import read_parquet_safe
+from .storage.scope import note_ordinals
+
+
+# Reciprocal rank fusion damping constant (Cormack et al.)
+RRF_K = 60
+
+
+def normalize_rows(m: np.ndarray) -> np.ndarray:
+    """Return a float32 copy of ``m`` with every row scaled to unit length."""
+    m = np.asarray(m, dtype=np.float32)
+    if m.ndim == 1:
+        m = m.reshape(1, -1)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(m / norms, dtype=np.float32)
+
+
+def top_n(scores: np.ndarray, n: int) -> np.ndarray:
+    """Positions of the ``n`` highest scores, best first."""
+    if n <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if n < scores.size:
+        idx = np.argpartition(-scores, n - 1)[:n]
+    else:
+        idx = np.arange(scores.size)
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def mmr(vecs: np.ndarray, scores: np.ndarray, k: int, lambda_: float = 0.7) -> List[int]:
+    """Greedy maximal marginal relevance over a candidate sub-matrix.
+
+    ``vecs`` are unit rows, ``scores`` their similarity to the query. After each
+    pick the running max-similarity-to-selected vector is updated with one
+    matrix-vector product instead of re-scoring every pair.
+    """
+    n = scores.size
+    if n == 0 or k <= 0:
+        return []
+    chosen: List[int] = []
+    redundancy = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    for _ in range(min(k, n)):
+        mr = lambda_ * scores - (1.0 - lambda_) * redundancy
+        mr[~available] = -np.inf
+        pick = int(np.argmax(mr))
+        chosen.append(pick)
+        available[pick] = False
+        np.maximum(redundancy, vecs @ vecs[pick], out=redundancy)
+    return chosen
+
+
+# A scope is a list of note ids or a bool bitmap over note ordinals (None = everything)
+Scope = Union[List[str], np.ndarray, None]
+
+
+def _bitmap_rows(bitmap: np.ndarray, ords: np.ndarray) -> np.ndarray:
+    out = np.zeros(ords.size, dtype=bool)
+    inside = ords < bitmap.size
+    out[inside] = bitmap[ords[inside]]
+    return out
+
+
+class EmbeddingIndex:
+    """Chunk embeddings held as one contiguous, row-normalized float32 matrix.
+
+    Rows live in preallocated slots so a single note can be replaced or removed
+    in place; removed slots are masked out until ``compact`` reclaims them.
+    With IVF centroids attached every row also records its inverted list, so
+    ``search(nprobe=...)`` only scores rows in the lists closest to the query.
+    Updates only fill slots past the current rows, flip the live mask or swap
+    in new arrays, so a ``snapshot`` can be searched while they go on.
+    """
+
+    def __init__(self, note_ids: Iterable[str], chunk_index: Iterable[int], texts: Iterable[str],
+                 updated_at: Iterable[int], matrix: np.ndarray):
+        self._size = 0
+        self._dead = 0
+        self._rows: Dict[str, List[int]] = {}
+        self._ivf: Optional[np.ndarray] = None
+        self.ivf_rows = 0
+        self.ivf_dirty = False
+        # True while ``_matrix`` is a caller's array (e.g. a np.memmap) used in place
+        self.mapped = False
+        # codes shared with this index's snapshots; replaced whenever rows are renumbered
+        self._codes: List[Optional[quant.Codes]] = [None]
+        self._codes_lock = threading.Lock()
+        self._alloc(0, 0)
+        note_ids = list(note_ids)
+        if note_ids:
+            self._append(note_ids, list(chunk_index), list(texts), list(updated_at), matrix)
+
+    def _alloc(self, capacity: int, dim: int, matrix: Optional[np.ndarray] = None) -> None:
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32) if matrix is None else matrix
+        self.mapped = matrix is not None
+        self._note_ids = np.empty(capacity, dtype=object)
+        self._chunk_index = np.zeros(capacity, dtype=np.int64)
+        self._texts = np.empty(capacity, dtype=object)
+        self._updated_at = np.zeros(capacity, dtype=np.int64)
+        self._live = np.zeros(capacity, dtype=bool)
+        self._lists = np.full(capacity, -1, dtype=np.int32)
+        self._ords = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self, need: int, dim: int, matrix: Optional[np.ndarray] = None) -> None:
+        cap = self._matrix.shape[0]
+        if matrix is None and not self.mapped and need <= cap and dim == self._matrix.shape[1]:
+            return
+        old = (self._matrix, self._note_ids, self._chunk_index, self._texts, self._updated_at, self._live,
+               self._lists, self._ords)
+        n = self._size
+        if matrix is not None:
+            self._alloc(matrix.shape[0], dim, matrix)
+        else:
+            self._alloc(max(need, 2 * cap, 64), dim)
+        if not n:
+            return
+        # a mapped matrix already holds the old rows: only the row metadata is copied
+        for dst, src in zip(
+            (self._note_ids, self._chunk_index, self._texts, self._updated_at, self._live, self._lists, self._ords),
+            old[1:]
+        ):
+            dst[:n] = src[:n]
+        if matrix is None:
+            self._matrix[:n] = old[0][:n]
+
+    def _append(self, note_ids, chunk_index, texts, updated_at, matrix) -> None:
+        m = normalize_rows(matrix)
+        n = len(note_ids)
+        if self._size and m.shape[1] != self._matrix.shape[1]:
+            # embedding model changed: rows of different widths cannot be scored together
+            self._size = self._dead = 0
+            self._rows = {}
+            self._ivf = None
+            self._codes = [None]
+            self._alloc(0, 0)
+        self._grow(self._size + n, m.shape[1])
+        lo, hi = self._size, self._size + n
+        self._matrix[lo:hi] = m
+        self._note_ids[lo:hi] = note_ids
+        self._chunk_index[lo:hi] = chunk_index
+        self._texts[lo:hi] = texts
+        self._updated_at[lo:hi] = updated_at
+        self._live[lo:hi] = True
+        self._ords[lo:hi] = note_ordinals().get(note_ids)
+        if self._ivf is not None:
+            self._lists[lo:hi] = ann.assign(m, self._ivf)
+            self.ivf_dirty = True
+        for r, nid in enumerate(note_ids, start=lo):
+            self._rows.setdefault(nid, []).append(r)
+        self._size = hi
+
+    @classmethod
+    def from_mapped(cls, matrix: np.ndarray, rows: np.ndarray, note_ids, chunk_index, texts,
+                    updated_at) -> "EmbeddingIndex":
+        """Index over ``matrix`` used in place: a row-normalized (n, dim) array such as a
+        read-only ``np.memmap``. ``rows`` are the matrix rows holding the given chunks;
+        all other rows stay masked out."""
+        index = cls([], [], [], [], np.zeros((0, 0), dtype=np.float32))
+        index.extend_mapped(matrix, rows, note_ids, chunk_index, texts, updated_at)
+        return index
+
+    def extend_mapped(self, matrix: np.ndarray, rows: np.ndarray, note_ids, chunk_index, texts,
+                      updated_at) -> None:
+        """Switch to ``matrix`` (the same rows plus appended ones) and fill in ``rows``.
+
+        The notes in ``note_ids`` lose their previous rows first. An index that
+        does not map ``matrix``'s file (different width, or built from copies)
+        takes the rows as a copy instead.
+        """
+        note_ids = list(note_ids)
+        rows = np.asarray(rows, dtype=np.int64)
+        for nid in set(note_ids):
+            self.remove_note(nid)
+        if self._size and (not self.mapped or matrix.shape[0] < self._size or matrix.shape[1] != self._matrix.shape[1]):
+            if rows.size:
+                self._append(note_ids, list(chunk_index), list(texts), list(updated_at), matrix[rows])
+            return
+        self._grow(matrix.shape[0], matrix.shape[1], matrix)
+        self._size = int(matrix.shape[0])
+        self._matrix = matrix
+        self._note_ids[rows] = note_ids
+        self._chunk_index[rows] = np.asarray(chunk_index, dtype=np.int64)
+        self._texts[rows] = list(texts)
+        self._updated_at[rows] = np.asarray(updated_at, dtype=np.int64)
+        self._live[rows] = True
+        self._ords[rows] = note_ordinals().get(note_ids)
+        if self._ivf is not None and rows.size:
+            self._lists[rows] = ann.assign(matrix[rows], self._ivf)
+            self.ivf_dirty = True
+        for r, nid in zip(rows.tolist(), note_ids):
+            self._rows.setdefault(nid, []).append(r)
+        self._dead = self._size - int(self._live[: self._size].sum())
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix[: self._size]
+
+    @property
+    def note_ids(self) -> np.ndarray:
+        return self._note_ids[: self._size]
+
+    @property
+    def chunk_index(self) -> np.ndarray:
+        return self._chunk_index[: self._size]
+
+    @property
+    def texts(self) -> np.ndarray:
+        return self._texts[: self._size]
+
+    @property
+    def updated_at(self) -> np.ndarray:
+        return self._updated_at[: self._size]
+
+    @property
+    def live(self) -> np.ndarray:
+        return self._live[: self._size]
+
+    def __len__(self) -> int:
+        return self._size - self._dead
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "EmbeddingIndex":
+        if df.empty:
+            return cls([], [], [], [], np.zeros((0, 0), dtype=np.float32))
+        emb = df["embedding"]
+        ok = emb.map(lambda v: v is not None and len(v) > 0).to_numpy(dtype=bool)
+        df = df[ok]
+        if df.empty:
+            return cls([], [], [], [], np.zeros((0, 0), dtype=np.float32))
+        matrix = np.vstack([np.asarray(v, dtype=np.float32) for v in df["embedding"]])
+        updated = df["updated_at"].fillna(0).astype("int64") if "updated_at" in df.columns else [0] * len(df)
+        return cls(df["note_id"], df["chunk_index"].astype("int64"), df["text"].fillna(""), updated, matrix)
+
+    def remove_note(self, note_id: str) -> int:
+        rows = self._rows.pop(note_id, [])
+        if rows:
+            self._live[rows] = False
+            self._dead += len(rows)
+            # a mapped file is compacted by its store's merge
+            if not self.mapped and self._dead > max(1024, self._size // 2):
+                self.compact()
+        return len(rows)
+
+    def upsert_note(self, note_id: str, texts: List[str], embeddings, updated_at: int) -> None:
+        """Replace every row of ``note_id`` with the given chunks (in chunk order)."""
+        self.remove_note(note_id)
+        if not texts:
+            return
+        n = len(texts)
+        self._append([note_id] * n, list(range(n)), list(texts), [int(updated_at)] * n,
+                     np.asarray(embeddings, dtype=np.float32))
+
+    def note_texts(self, note_id: str) -> List[str]:
+        """Chunk texts currently held for ``note_id``, in chunk order."""
+        rows = self._rows.get(note_id, [])
+        return [self._texts[r] for r in sorted(rows, key=lambda r: self._chunk_index[r])]
+
+    def compact(self) -> None:
+        keep = np.flatnonzero(self.live)
+        self._matrix = np.ascontiguousarray(self._matrix[keep])
+        self._note_ids = self._note_ids[keep]
+        self._chunk_index = self._chunk_index[keep]
+        self._texts = self._texts[keep]
+        self._updated_at = self._updated_at[keep]
+        self._live = self._live[keep]
+        self._lists = self._lists[keep]
+        self._ords = self._ords[keep]
+        self._size = int(keep.size)
+        self._dead = 0
+        self._rows = {}
+        for r, nid in enumerate(self._note_ids):
+            self._rows.setdefault(nid, []).append(r)
+        self._codes = [None]
+
+    def snapshot(self) -> "EmbeddingIndex":
+        """Read-only view of the current rows that stays consistent while this index
+        is updated, for searching without holding the writers' lock. Take it
+        under that lock."""
+        view = copy.copy(self)
+        view._live = self._live[: self._size].copy()
+        return view
+
+    def _slots(self, note_id: str) -> np.ndarray:
+        # rows appended after a snapshot was taken are not part of it
+        slots = np.asarray(self._rows.get(note_id, ()), dtype=np.int64)
+        return slots[slots < self._size]
+
+    @property
+    def ivf(self) -> Optional[np.ndarray]:
+        return self._ivf
+
+    def attach_ivf(self, centroids: np.ndarray, lists: Optional[np.ndarray] = None, trained_rows: int = 0) -> None:
+        """Use ``centroids`` for IVF search; rows without a known list are assigned now."""
+        if not self._size or centroids.shape[1] != self._matrix.shape[1]:
+            return
+        self._ivf = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.ivf_rows = int(trained_rows or len(self))
+        # a new array: snapshots keep probing the lists they were taken with
+        self._lists = self._lists.copy()
+        self._lists[: self._size] = -1 if lists is None else lists
+        todo = np.flatnonzero((self.lists < 0) & self.live)
+        if todo.size:
+            self._lists[todo] = ann.assign(self._matrix[todo], self._ivf)
+        self.ivf_dirty = True
+
+    @property
+    def lists(self) -> np.ndarray:
+        return self._lists[: self._size]
+
+    def _probe(self, q: np.ndarray, sel: np.ndarray, want: int, nprobe: int) -> np.ndarray:
+        """Narrow ``sel`` to the closest ``nprobe`` lists, probing further while fewer
+        than ``want`` rows of the (possibly filtered) scope are covered."""
+        order = ann.probe_order(self._ivf, q)
+        lists = self.lists
+        counts = np.bincount(lists[sel & (lists >= 0)], minlength=self._ivf.shape[0])
+        covered = np.cumsum(counts[order])
+        p = max(int(nprobe), int(np.searchsorted(covered, want)) + 1)
+        if p >= order.size:
+            return sel
+        probed = np.zeros(self._ivf.shape[0] + 1, dtype=bool)
+        probed[order[:p]] = True
+        # rows without a list (-1 -> the extra last slot) are always scored
+        probed[-1] = True
+        return sel & probed[lists]
+
+    def mask(self, allowed: Scope = None, date_start: Optional[int] = None,
+             date_end: Optional[int] = None) -> Optional[np.ndarray]:
+        """Row mask for the allowed notes and chunk timestamps (None = all rows).
+
+        ``allowed`` is a list of note ids or a bitmap over note ordinals as
+        returned by the scope resolver; the bitmap is applied with one gather
+        through the per-row note ordinals.
+        """
+        m: Optional[np.ndarray] = None
+        if isinstance(allowed, np.ndarray):
+            m = _bitmap_rows(allowed, self._ords[: self._size])
+        elif allowed:
+            m = np.isin(self.note_ids, np.asarray(list(allowed), dtype=object))
+        if date_start:
+            dm = self.updated_at >= int(date_start)
+            m = dm if m is None else (m & dm)
+        if date_end:
+            dm = self.updated_at <= int(date_end)
+            m = dm if m is None else (m & dm)
+        return m
+
+    def search(self, qv, k: int, mask: Optional[np.ndarray] = None, candidates: int = 64,
+               lambda_: float = 0.7, note_ranks: Optional[Dict[str, int]] = None,
+               nprobe: Optional[int] = None, quantization: Optional[str] = None) -> List[Dict]:
+        """Score every row against ``qv``, keep the best ``candidates`` and diversify with MMR.
+
+        With ``note_ranks`` (note_id -> 1-based keyword rank) the candidates'
+        vector ranks are fused with their note's keyword rank by reciprocal rank
+        fusion, and the best chunk of every keyword hit joins the candidate set.
+        With ``nprobe`` and IVF centroids attached, only rows in the closest
+        lists are scored once the scope holds more than ``ann.ANN_MIN_ROWS`` rows.
+        With ``quantization`` ("int8" or "binary") rows are first scored on
+        their compact codes and only the best ``quant.RERANK_FACTOR`` times
+        ``candidates`` (plus keyword hits) are scored on the full vectors.
+        """
+        if not len(self):
+            return []
+        sel = self.live if mask is None else (self.live & mask)
+        q = normalize_rows(qv)[0]
+        if nprobe and self._ivf is not None and int(sel.sum()) > ann.ANN_MIN_ROWS:
+            scope = sel
+            sel = self._probe(q, sel, max(int(k), int(candidates)), nprobe)
+            for nid in (note_ranks or ()):
+                # keyword hits stay candidates even outside the probed lists
+                slots = self._slots(nid)
+                sel[slots] = scope[slots]
+        rows = np.flatnonzero(sel)
+        if rows.size == 0:
+            return []
+        k = max(1, int(k))
+        if quantization in quant.RERANK_FACTOR:
+            keep = quant.RERANK_FACTOR[quantization] * max(k, int(candidates))
+            if rows.size > keep:
+                rows = self._prefilter(q, rows, sel, keep, quantization, note_ranks)
+        if rows.size == self._size:
+            scores = self.matrix @ q
+        elif 4 * rows.size >= self._size:
+            # most rows selected: one pass over the whole matrix beats gathering a copy
+            scores = (self.matrix @ q)[rows]
+        else:
+            scores = self.matrix[rows] @ q
+        best = top_n(scores, max(k, int(candidates)))
+        rel = scores[best]
+        if note_ranks:
+            best, rel = self._fuse(rows, sel, scores, best, note_ranks)
+        cand_rows = rows[best]
+        picks = mmr(self.matrix[cand_rows], rel, k, lambda_)
+        out: List[Dict] = []
+        for p in picks:
+            r = int(cand_rows[p])
+            out.append({
+                "note_id": self.note_ids[r],
+                "chunk_index": int(self.chunk_index[r]),
+                "text": self.texts[r],
+                "score": float(scores[best[p]]),
+            })
+        return out
+
+    def codes(self, level: str) -> quant.Codes:
+        """``level`` codes of every row, encoding rows added since the last call."""
+        dim = self._matrix.shape[1]
+        with self._codes_lock:
+            c = self._codes[0]
+            if c is None or c.level != level or c.dim != dim:
+                c = self._codes[0] = quant.Codes(level, dim)
+            c.extend(self.matrix)
+        return c
+
+    @property
+    def codes_nbytes(self) -> int:
+        c = self._codes[0]
+        return c.nbytes if c is not None else 0
+
+    def _prefilter(self, q: np.ndarray, rows: np.ndarray, sel: np.ndarray, keep: int, level: str,
+                   note_ranks: Optional[Dict[str, int]]) -> np.ndarray:
+        approx = self.codes(level).scores(q, rows)
+        out = [rows[top_n(approx, keep)]]
+        for nid in (note_ranks or ()):
+            # keyword hits keep their chunks for fusion even when the codes rank them low
+            slots = self._slots(nid)
+            if slots.size:
+                out.append(slots[sel[slots]])
+        return np.unique(np.concatenate(out))
+
+    def _fuse(self, rows, sel, scores, best, note_ranks: Dict[str, int]):
+        have = set(self._note_ids[rows[best]].tolist())
+        extra = []
+        for nid in note_ranks:
+            if nid in have:
+                continue
+            slots = self._slots(nid)
+            slots = slots[sel[slots]]
+            if slots.size:
+                pos = np.searchsorted(rows, slots)
+                extra.append(int(pos[np.argmax(scores[pos])]))
+        vrank = np.arange(1, best.size + 1, dtype=np.float64)
+        if extra:
+            extra = np.asarray(extra, dtype=np.int64)
+            erank = np.array([(scores > scores[p]).sum() + 1 for p in extra], dtype=np.float64)
+            best = np.concatenate([best, extra])
+            vrank = np.concatenate([vrank, erank])
+        kw = np.array([note_ranks.get(n, 0) for n in self._note_ids[rows[best]]], dtype=np.float64)
+        fused = 1.0 / (RRF_K + vrank) + np.where(kw > 0, 1.0 / (RRF_K + np.maximum(kw, 1)), 0.0)
+        return best, (fused / fused.max()).astype(np.float32)
+
+
+def rrf(rankings: List[List], k: Optional[int] = None) -> List[Tuple]:
+    """Reciprocal rank fusion of several best-first key lists -> [(key, score)] best first."""
+    k = RRF_K if k is None else k
+    fused: Dict = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+class EmbeddingCache:
+    """Process-wide resident copy of the embeddings table.
+
+    Loaded once, patched in place by the indexing code, and reloaded when the
+    (mtime, size) of ``path`` (or the version ``stat`` returns) shows that
+    another process changed the table.
+    A reload is built without holding the lock, and other callers keep using
+    the stale index until it is swapped in; searches score a snapshot and do
+    not hold the lock either. Merges that keep the rows as they are only move
+    the stat along (see ``merged``).
+    """
+
+    def __init__(self, path: str, loader: Optional[Callable[[], pd.DataFrame]] = None,
+                 ann_path: Optional[str] = None, stat: Optional[Callable[[], Optional[Tuple]]] = None):
+        self.path = path
+        self._stat_fn = stat
+        self.ann_path = ann_path
+        self._loader = loader or (lambda: read_parquet_safe(path))
+        self._lock = threading.RLock()
+        self._index: Optional[EmbeddingIndex] = None
+        self._stat: Optional[Tuple] = None
+        self._building: Optional[threading.Thread] = None
+        self._load_lock = threading.Lock()
+        self._version = 0
+        # stat before -> after of merges that left the rows as they were
+        self._moves: Dict[Tuple, Tuple] = {}
+
+    def file_stat(self) -> Optional[Tuple]:
+        if self._stat_fn is not None:
+            return self._stat_fn()
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self) -> EmbeddingIndex:
+        st = self.file_stat()
+        with self._lock:
+            index = self._index
+            if index is not None and st == self._stat:
+                return index
+        # only the first load waits: while another thread reloads, the stale index is served
+        if not self._load_lock.acquire(blocking=index is None):
+            return index
+        try:
+            with self._lock:
+                if self._index is not None and self.file_stat() == self._stat:
+                    return self._index
+                version = self._version
+            st = self.file_stat()
+            data = self._loader()
+            # loaders return rows to copy in, or an index already built over mapped files
+            fresh = data if isinstance(data, EmbeddingIndex) else EmbeddingIndex.from_frame(data)
+            self._attach_saved_ann(fresh)
+            with self._lock:
+                self._index = fresh
+                # invalidated while loading: serve it, but reload on the next call
+                self._stat = (st if st is not None else self.file_stat()) if version == self._version else None
+                return fresh
+        finally:
+            self._load_lock.release()
+
+    def _view(self) -> EmbeddingIndex:
+        index = self.get()
+        with self._lock:
+            return index.snapshot()
+
+    def in_scope(self, allowed: Scope = None, date_start: Optional[int] = None,
+                 date_end: Optional[int] = None) -> bool:
+        """True if any live row passes the scope filters."""
+        index = self._view()
+        mask = index.mask(allowed, date_start, date_end)
+        return bool(index.live.any() if mask is None else (index.live & mask).any())
+
+    def search(self, qv, k: int, allowed: Scope = None, date_start: Optional[int] = None,
+               date_end: Optional[int] = None, **kw) -> List[Dict]:
+        index = self._view()
+        if kw.get("nprobe"):
+            self.ensure_ann()
+        return index.search(qv, k, mask=index.mask(allowed, date_start, date_end), **kw)
+
+    # -- IVF ----------------------------------------------------------------
+    def _attach_saved_ann(self, index: EmbeddingIndex) -> None:
+        data = ann.load(self.ann_path) if self.ann_path else None
+        if not data or not len(index):
+            return
+        saved = pd.DataFrame({
+            "note_id": data["note_ids"].astype(object),
+            "chunk_index": data["chunk_index"],
+            "updated_at": data["updated_at"],
+            "list": data["lists"],
+        })
+        cur = pd.DataFrame({"note_id": index.note_ids, "chunk_index": index.chunk_index,
+                            "updated_at": index.updated_at})
+        # rows rewritten since the save carry a new updated_at and get reassigned
+        lists = cur.merge(saved, how="left", on=["note_id", "chunk_index", "updated_at"])["list"]
+        index.attach_ivf(data["centroids"], lists.fillna(-1).to_numpy(dtype=np.int32),
+                         trained_rows=int(data["trained_rows"][0]))
+        index.ivf_dirty = False
+
+    def ensure_ann(self) -> None:
+        """Train IVF centroids in the background once the index is big enough, or has outgrown them."""
+        index = self.get()
+        with self._lock:
+            n = len(index)
+            if n <= ann.ANN_MIN_ROWS:
+                return
+            if index.ivf is not None and n < ann.RETRAIN_GROWTH * max(1, index.ivf_rows):
+                return
+            if self._building is not None and self._building.is_alive():
+                return
+            sample = index.matrix[index.live].copy()
+            self._building = threading.Thread(target=self._build_ann, args=(index, sample), name="ann-build",
+                                              daemon=True)
+            self._building.start()
+
+    def _build_ann(self, index: EmbeddingIndex, sample: np.ndarray) -> None:
+        try:
+            centroids = ann.kmeans(sample, ann.nlist_for(sample.shape[0]))
+        except Exception:
+            return
+        with self._lock:
+            if index is not self._index:
+                return
+            index.attach_ivf(centroids, trained_rows=sample.shape[0])
+        self.save_ann()
+
+    def save_ann(self) -> bool:
+        """Persist the IVF centroids and row lists if they changed since the last save."""
+        with self._lock:
+            index = self._index
+            if index is None or index.ivf is None or not index.ivf_dirty or not self.ann_path:
+                return False
+            live = index.live
+            args = (index.ivf.copy(), index.note_ids[live], index.chunk_index[live], index.updated_at[live],
+                    index.lists[live], index.ivf_rows)
+            index.ivf_dirty = False
+        try:
+            ann.save(self.ann_path, *args)
+        except Exception:
+            index.ivf_dirty = True
+            return False
+        return True
+
+    def note_texts(self, note_id: str) -> List[str]:
+        index = self.get()
+        with self._lock:
+            return index.note_texts(note_id)
+
+    def _follow(self, stat: Optional[Tuple]) -> Optional[Tuple]:
+        for _ in range(len(self._moves)):
+            if stat not in self._moves:
+                break
+            stat = self._moves[stat]
+        return stat
+
+    def merged(self, before: Optional[Tuple], after: Optional[Tuple],
+               remapped: bool = False) -> None:
+        """Take a store merge that changed the file from ``before`` to ``after``.
+
+        The rows stay as they were, so a loaded index just moves on to
+        ``after``, also when the merge is reported before the write it followed
+        has been patched in. ``remapped`` merges moved rows (e.g. to a new
+        matrix file): the index is reloaded in the background and the old one
+        served meanwhile.
+        """
+        with self._lock:
+            if not remapped:
+                if len(self._moves) >= 64:
+                    self._moves.clear()
+                self._moves[before] = after
+                self._stat = self._follow(self._stat)
+                return
+            if self._index is None:
+                return
+        threading.Thread(target=self.get, name="embeddings-reload", daemon=True).start()
+
+    def _patch(self, expected: Optional[Tuple], fn, after: Optional[Tuple] = None) -> None:
+        with self._lock:
+            if self._index is None:
+                return
+            if self._follow(expected) != self._stat:
+                # someone else wrote the table since we loaded it; reload lazily
+                self._index = None
+                return
+            fn(self._index)
+            # ``after``: stat the write itself left, so a merge landing since then still reloads
+            self._stat = self._follow(after if after is not None else self.file_stat())
+
+    def upsert_note(self, note_id: str, texts: List[str], embeddings, updated_at: int,
+                    expected: Optional[Tuple] = None) -> None:
+        """Apply a note rewrite that changed the file from ``expected`` to its current stat."""
+        self._patch(expected, lambda ix: ix.upsert_note(note_id, texts, embeddings, updated_at))
+
+    def upsert_notes(self, notes: List[Tuple[str, List[str], list]], updated_at: int,
+                     expected: Optional[Tuple] = None, after: Optional[Tuple] = None) -> None:
+        """``upsert_note`` for several (note_id, texts, embeddings) written by one store commit."""
+        def apply(ix: EmbeddingIndex) -> None:
+            for note_id, texts, embeddings in notes:
+                ix.upsert_note(note_id, texts, embeddings, updated_at)
+
+        self._patch(expected, apply, after)
+
+    def extend_mapped(self, matrix: np.ndarray, rows, note_ids, chunk_index, texts, updated_at,
+                      removed: Iterable[str] = (), expected: Optional[Tuple] = None,
+                      after: Optional[Tuple] = None) -> None:
+        """Apply a write that removed ``removed`` and appended ``rows`` to the mapped
+        matrix file (see ``EmbeddingIndex.extend_mapped``)."""
+        def apply(ix: EmbeddingIndex) -> None:
+            for note_id in removed:
+                ix.remove_note(note_id)
+            ix.extend_mapped(matrix, rows, note_ids, chunk_index, texts, updated_at)
+
+        self._patch(expected, apply, after)
+
+    def remove_note(self, note_id: str, expected: Optional[Tuple] = None) -> None:
+        self._patch(expected, lambda ix: ix.remove_note(note_id))
+
+    def remove_notes(self, note_ids: List[str], expected: Optional[Tuple] = None,
+                     after: Optional[Tuple] = None) -> None:
+        def apply(ix: EmbeddingIndex) -> None:
+            for note_id in note_ids:
+                ix.remove_note(note_id)
+
+        self._patch(expected, apply, after)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._index = None
+            self._stat = None
+            self._version += 1
+
@@ -1,39 +1,57 @@
 import time
-from datetime import datetime, timedelta, timezone
+from typing import List
+
 from apscheduler.schedulers.background import BackgroundScheduler
 
 _scheduler = BackgroundScheduler(timezone="UTC")
 
 
 def nightly_job():
-    # placeholder for maintenance jobs (summaries, cleanup)
-    pass
-
-
-def _do_reindex(note_id: str):
+    # compaction, orphan cleanup and index reconciliation, paced by MAINTENANCE_IO_MB_S
     try:
-        from .storage.config import load_settings
-        from .storage.indexing import reindex_note
-        from .storage import notes as notes_store
+        from .storage.maintenance import start_maintenance
 
-        s = load_settings()
-        rec = notes_store.get_note(note_id)
-        reindex_note(note_id, rec.get("title", ""), rec.get("content", ""), s["CHUNK_SIZE"], s["CHUNK_OVERLAP"])
+        start_maintenance()
     except Exception:
         pass
 
 
 def schedule_reindex(note_id: str, immediate: bool = False):
-    delay_ms = 0
+    """Queue a debounced reindex of ``note_id``; ``immediate`` skips the debounce and jumps the queue."""
+    from .reindex_queue import reindex_queue
+
+    reindex_queue().enqueue([note_id], immediate=immediate)
+
+
+def schedule_reindex_many(note_ids: List[str], immediate: bool = False):
+    from .reindex_queue import reindex_queue
+
+    reindex_queue().enqueue(list(note_ids), immediate=immediate)
+
+
+def checkpoint_journals():
     try:
-        from .storage.config import load_settings
+        from .storage.metadata import checkpoint_all
 
-        s = load_settings()
-        delay_ms = int(s.get("REINDEX_DEBOUNCE_MS", 500))
+        checkpoint_all()
     except Exception:
-        delay_ms = 500
-    run_at = datetime.now(timezone.utc) + timedelta(milliseconds=(0 if immediate else delay_ms))
-    _scheduler.add_job(_do_reindex, id=f"reindex:{note_id}", args=[note_id], run_date=run_at, replace_existing=True)
+        pass
+    # snapshot the keyword indexes so a restart only re-reads notes edited since
+    try:
+        from .storage.bm25 import bm25_index
+        from .storage.trigram import trigram_index
+
+        for ix in (trigram_index(), bm25_index()):
+            ix.save()
+    except Exception:
+        pass
+    # persist IVF list assignments made by incremental reindexing
+    try:
+        from .vector_backends import vector_backend
+
+        vector_backend().save_ann()
+    except Exception:
+        pass
 
 
 def start_scheduler():
@@ -42,6 +60,11 @@ def start_scheduler():
         _scheduler.add_job(nightly_job, "cron", hour=3, minute=0)
     except Exception:
         pass
+    # fold metadata journals into their parquet base files
+    try:
+        _scheduler.add_job(checkpoint_journals, "interval", minutes=10)
+    except Exception:
+        pass
     _scheduler.start()
 
 
@@ -0,0 +1,145 @@
+import heapq
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .config import META_DIR
+from .parquet_util import table_path
+from .text_index import NoteTextIndex, pack_strings, unpack_strings
+
+
+BM25_PATH = os.path.join(META_DIR, "bm25.npz")
+K1 = 1.2
+B = 0.75
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall((text or "").lower())
+
+
+class BM25Index(NoteTextIndex):
+    """Inverted index over note titles and bodies with Okapi BM25 ranking.
+
+    Postings (term -> {note_id: tf}) live in memory; the snapshot stores them
+    as flat note-position and tf arrays per term.
+    """
+
+    def __init__(self, path: str = BM25_PATH):
+        super().__init__(path, legacy=[table_path("bm25_docs")])
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._total_len = 0
+
+    def _encode(self, title: str, body: str) -> Dict:
+        tf = Counter(tokenize(title))
+        tf.update(tokenize(body))
+        terms = sorted(tf)
+        return {"terms": terms, "tfs": [tf[t] for t in terms]}
+
+    def _add_row(self, note_id: str, row: Dict) -> None:
+        self._remove_row(note_id)
+        terms = list(row.get("terms") if row.get("terms") is not None else [])
+        tfs = [int(x) for x in (row.get("tfs") if row.get("tfs") is not None else [])]
+        for t, tf in zip(terms, tfs):
+            self._postings.setdefault(t, {})[note_id] = tf
+        self._doc_terms[note_id] = terms
+        self._doc_len[note_id] = sum(tfs)
+        self._total_len += sum(tfs)
+
+    def _remove_row(self, note_id: str) -> None:
+        for t in self._doc_terms.pop(note_id, []):
+            plist = self._postings.get(t)
+            if plist is not None:
+                plist.pop(note_id, None)
+                if not plist:
+                    del self._postings[t]
+        self._total_len -= self._doc_len.pop(note_id, 0)
+
+    def _dump(self, order: Dict[str, int]) -> Dict[str, np.ndarray]:
+        terms = list(self._postings)
+        docs: List[int] = []
+        tfs: List[int] = []
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, t in enumerate(terms):
+            plist = self._postings[t]
+            docs.extend(order[n] for n in plist)
+            tfs.extend(plist.values())
+            offsets[i + 1] = len(docs)
+        packed, term_offsets = pack_strings(terms)
+        return {"terms": packed, "term_offsets": term_offsets, "docs": np.asarray(docs, dtype=np.uint32),
+                "tfs": np.asarray(tfs, dtype=np.uint32), "posting_offsets": offsets}
+
+    def _restore(self, data: Dict[str, np.ndarray], note_ids: List[str]) -> None:
+        docs, tfs = data["docs"].tolist(), data["tfs"].tolist()
+        offsets = data["posting_offsets"].tolist()
+        doc_terms: Dict[str, List[str]] = {nid: [] for nid in note_ids}
+        doc_len = dict.fromkeys(note_ids, 0)
+        for i, t in enumerate(unpack_strings(data["terms"], data["term_offsets"])):
+            plist = {}
+            for d, tf in zip(docs[offsets[i]:offsets[i + 1]], tfs[offsets[i]:offsets[i + 1]]):
+                nid = note_ids[d]
+                plist[nid] = tf
+                doc_terms[nid].append(t)
+                doc_len[nid] += tf
+            self._postings[t] = plist
+        self._doc_terms, self._doc_len = doc_terms, doc_len
+        self._total_len = sum(doc_len.values())
+
+    def _idf(self, df: int) -> float:
+        n = len(self._doc_len)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, q: str, k: int = 10, allowed: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """Top-``k`` (note_id, score) pairs.
+
+        Term-at-a-time with max-score pruning: terms are visited in decreasing
+        upper bound, and once the bounds of the remaining terms cannot lift an
+        unseen note above the current k-th score, only notes already in the
+        accumulator set are updated.
+        """
+        with self._lock:
+            self._load()
+            if not self._doc_len or k <= 0:
+                return []
+            avgdl = (self._total_len / len(self._doc_len)) or 1.0
+            terms = []
+            for t in set(tokenize(q)):
+                plist = self._postings.get(t)
+                if plist:
+                    idf = self._idf(len(plist))
+                    terms.append((idf * (K1 + 1.0), idf, plist))
+            terms.sort(key=lambda x: x[0], reverse=True)
+            remaining = sum(ub for ub, _, _ in terms)
+            acc: Dict[str, float] = {}
+            for ub, idf, plist in terms:
+                admit = True
+                if len(acc) >= k:
+                    theta = heapq.nlargest(k, acc.values())[-1]
+                    admit = remaining > theta
+                remaining -= ub
+                items = plist.items() if admit else ((n, plist[n]) for n in acc if n in plist)
+                for nid, tf in items:
+                    if allowed is not None and nid not in allowed:
+                        continue
+                    norm = K1 * (1.0 - B + B * self._doc_len[nid] / avgdl)
+                    acc[nid] = acc.get(nid, 0.0) + idf * tf * (K1 + 1.0) / (tf + norm)
+            return heapq.nlargest(k, acc.items(), key=lambda x: x[1])
+
+
+_index: Optional[BM25Index] = None
+_index_lock = threading.Lock()
+
+
+def bm25_index() -> BM25Index:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = BM25Index()
+        return _index
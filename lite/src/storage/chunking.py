@@ -0,0 +1,201 @@
+import hashlib
+import re
+import zlib
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+
+CHUNKERS = ("fixed", "structured")
+
+# A paragraph whose crc32 is 0 mod ANCHOR_EVERY closes the chunk it ends
+ANCHOR_EVERY = 4
+# Characters that feed the rolling hash used to cut oversized blocks
+GEAR_WINDOW = 32
+
+_HEADING = re.compile(r"#{1,6}\s")
+_GEAR = np.array(
+    [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:4], "little") for i in range(256)], dtype=np.uint64
+)
+
+
+def _fixed_spans(n: int, chunk_size: int, overlap: int) -> List[Tuple[int, int]]:
+    out: List[Tuple[int, int]] = []
+    i = 0
+    while i < n:
+        j = min(n, i + chunk_size)
+        out.append((i, j))
+        # advance with overlap
+        ni = j - overlap
+        if ni <= i:
+            ni = j
+        i = ni
+    return out
+
+
+def _blocks(text: str) -> List[Tuple[int, int, bool]]:
+    """Contiguous (start, end, starts_with_heading) blocks.
+
+    A block is a paragraph with its trailing blank lines; a markdown heading
+    line always starts a new block.
+    """
+    out: List[Tuple[int, int, bool]] = []
+    start, heading, blank_run = 0, False, False
+    pos = 0
+    for line in text.splitlines(keepends=True):
+        is_blank = not line.strip()
+        is_heading = bool(_HEADING.match(line))
+        if pos > start and (is_heading or (blank_run and not is_blank)):
+            out.append((start, pos, heading))
+            start, heading = pos, False
+        if pos == start:
+            heading = is_heading
+        blank_run = is_blank
+        pos += len(line)
+    if pos > start:
+        out.append((start, pos, heading))
+    return out
+
+
+def _anchor_cuts(text: str, start: int, end: int, lo: int, hi: int) -> List[int]:
+    """Cut points inside ``text[start:end]`` chosen by a rolling (gear) hash.
+
+    A cut lands where the hash of the preceding ``GEAR_WINDOW`` characters has
+    its top bits clear, so cut positions depend only on nearby content and an
+    edit moves at most the cuts around it. Pieces stay within [lo, hi].
+    """
+    codes = np.frombuffer(text[start:end].encode("utf-32-le"), dtype=np.uint32) & 0xFF
+    g = _GEAR[codes]
+    h = np.zeros(g.size, dtype=np.uint64)
+    for j in range(min(GEAR_WINDOW, g.size)):
+        h[j:] += g[: g.size - j] << np.uint64(j)
+    bits = max(1, int(np.log2(max(2, (lo + hi) // 2))))
+    # high bits mix every character of the window; the low ones only the last few
+    hits = np.flatnonzero(((h >> np.uint64(32)) & np.uint64((1 << bits) - 1)) == 0) + 1
+    cuts: List[int] = []
+    last = 0
+    for p in hits.tolist():
+        while p - last > hi:
+            last += hi
+            cuts.append(start + last)
+        if p - last >= lo and end - start - p >= lo:
+            cuts.append(start + p)
+            last = p
+    while end - start - last > hi:
+        last += hi
+        cuts.append(start + last)
+    return cuts
+
+
+def _structured_cores(text: str, chunk_size: int, overlap: int) -> List[Tuple[int, int]]:
+    """Chunk spans of ``text`` before the overlap is prepended."""
+    size = max(1, chunk_size - overlap)
+    lo = max(1, size // 4)
+    pieces: List[Tuple[int, int, bool, bool]] = []
+    for s, e, heading in _blocks(text):
+        bounds = [s] + (_anchor_cuts(text, s, e, lo, size) if e - s > size else []) + [e]
+        for k in range(len(bounds) - 1):
+            # only a whole paragraph can carry a content anchor
+            whole = len(bounds) == 2
+            pieces.append((bounds[k], bounds[k + 1], heading and k == 0, whole))
+    cores: List[Tuple[int, int]] = []
+    cur = None
+    for s, e, heading, whole in pieces:
+        if cur is not None and (heading or e - cur > size):
+            cores.append((cur, s))
+            cur = None
+        if cur is None:
+            cur = s
+        if whole and e - cur >= lo and zlib.crc32(text[s:e].strip().encode("utf-8")) % ANCHOR_EVERY == 0:
+            cores.append((cur, e))
+            cur = None
+    if cur is not None:
+        cores.append((cur, len(text)))
+    return cores
+
+
+def _structured_spans(text: str, chunk_size: int, overlap: int) -> List[Tuple[int, int]]:
+    return [(max(0, s - overlap), e) for s, e in _structured_cores(text, chunk_size, overlap)]
+
+
+def chunk_spans(text: str, chunk_size: int, overlap: int, mode: str = "fixed") -> List[Tuple[int, int]]:
+    """(start, end) character spans of the chunks of ``text``.
+
+    ``fixed`` slides a ``chunk_size`` window forward by ``chunk_size - overlap``.
+    ``structured`` cuts at markdown headings and at paragraphs whose content
+    hash is an anchor, splitting long paragraphs at rolling-hash anchors, so an
+    edit only moves the boundaries next to it. Each chunk is at most
+    ``chunk_size`` characters including the ``overlap`` it repeats from its
+    predecessor.
+    """
+    if chunk_size <= 0:
+        return [(0, len(text))]
+    if mode == "structured":
+        return _structured_spans(text, chunk_size, max(0, min(int(overlap), chunk_size // 2)))
+    return _fixed_spans(len(text), chunk_size, overlap)
+
+
+def chunk_text(text: str, chunk_size: int, overlap: int, mode: str = "fixed") -> List[str]:
+    if chunk_size <= 0:
+        return [text]
+    return [text[s:e] for s, e in chunk_spans(text, chunk_size, overlap, mode)]
+
+
+def _stream_step(buf: str, k: int, chunk_size: int, overlap: int, mode: str,
+                 final: bool) -> Tuple[List[Tuple[int, int]], int, int]:
+    """Settled spans of ``buf`` (whose first ``k`` chars are context), the
+    offset to restart the buffer at and the context length kept before it."""
+    if mode == "structured":
+        ov = max(0, min(int(overlap), chunk_size // 2))
+        cores = [(k + s, k + e) for s, e in _structured_cores(buf[k:], chunk_size, ov)]
+        if final:
+            done = cores
+        else:
+            # later input can only move cuts in the last block, or near the end of a huge one
+            blocks = _blocks(buf[k:])
+            safe = max(k + blocks[-1][0] if blocks else k, len(buf) - 2 * chunk_size)
+            done = [c for c in cores if c[1] <= safe]
+        spans = [(max(0, s - ov), e) for s, e in done]
+        if len(done) == len(cores):
+            return spans, len(buf), 0
+        nxt = cores[len(done)][0]
+        restart = max(0, nxt - ov)
+        return spans, restart, nxt - restart
+    spans = [(k + s, k + e) for s, e in _fixed_spans(len(buf) - k, chunk_size, overlap)]
+    if final:
+        return spans, len(buf), 0
+    # a window that reaches the end of the buffer may still grow
+    done = [sp for sp in spans if sp[1] < len(buf)]
+    return done, spans[len(done)][0] if len(done) < len(spans) else len(buf), 0
+
+
+def iter_chunks(pieces: Iterable[str], chunk_size: int, overlap: int,
+                mode: str = "fixed") -> Iterator[Tuple[int, int, str]]:
+    """Chunk text that arrives in pieces; yields (start, end, text) with offsets into the whole text.
+
+    A span is emitted once more input can no longer move it, and the buffer
+    restarts at the first pending span, so memory stays at a few chunks plus
+    one piece. ``fixed`` yields exactly the spans of ``chunk_spans`` over the
+    whole text. ``structured`` restarts boundary detection at each pending
+    chunk, so its cuts can differ slightly from a whole-text pass, but they
+    are the same for the same input.
+    """
+    buf, base, k = "", 0, 0
+    for piece in pieces:
+        if not piece:
+            continue
+        buf += piece
+        if chunk_size <= 0:
+            continue
+        spans, restart, k_next = _stream_step(buf, k, chunk_size, overlap, mode, final=False)
+        for s, e in spans:
+            yield base + s, base + e, buf[s:e]
+        buf, base, k = buf[restart:], base + restart, k_next
+    if chunk_size <= 0:
+        if buf:
+            yield 0, len(buf), buf
+        return
+    if len(buf) > k:
+        spans, _, _ = _stream_step(buf, k, chunk_size, overlap, mode, final=True)
+        for s, e in spans:
+            yield base + s, base + e, buf[s:e]
@@ -8,6 +8,8 @@ DOCS_DIR = os.getenv("DOCS_DIR", os.path.join(DATA_DIR, "docs"))
 NOTES_DIR = os.path.join(DATA_DIR, "notes")
 META_DIR = os.path.join(DATA_DIR, "meta")
 SETTINGS_PATH = os.path.join(DATA_DIR, "settings.json")
+# Directory POST /notes/import may read vaults from; unset keeps import to the CLI
+VAULT_DIR = os.getenv("VAULT_DIR", "")
 
 
 DEFAULT_SETTINGS: Dict[str, Any] = {
@@ -15,9 +17,17 @@ DEFAULT_SETTINGS: Dict[str, Any] = {
     "EMBED_MODEL": os.getenv("EMBED_MODEL", "nomic-embed-text"),
     "CHUNK_SIZE": 800,
     "CHUNK_OVERLAP": 100,
+    # "fixed" character windows or "structured" (headings, paragraphs, content anchors)
+    "CHUNKER": "fixed",
     "REINDEX_DEBOUNCE_MS": 500,
     "SEARCH_THROTTLE_MS": 200,
     "MAX_CHUNKS_PER_QUERY": 64,
+    # /chat vector scoring: "exact" over every chunk, or "ann" (IVF; more probed lists = better recall, slower)
+    "RETRIEVAL_MODE": "exact",
+    "ANN_NPROBE": 8,
+    # first-pass scoring on compact codes ("int8" per-dimension scaled, "binary" sign bits),
+    # best candidates re-ranked on the full vectors; "none" scores full vectors only
+    "QUANTIZATION": "none",
     "SIMPLE_MODE": True,
 }
 
@@ -0,0 +1,274 @@
+import collections
+import hashlib
+import os
+import threading
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .config import META_DIR
+from .parquet_util import _fsync_dir, atomic_replace
+
+
+# Merge the append-only part files once this many accumulate
+MAX_PARTS = 32
+# Vectors kept in memory; the others are read back from their part when asked for
+EMBED_CACHE_MB = float(os.getenv("EMBED_CACHE_MB", "64"))
+# Rows per parquet row group: what reading back one vector decodes
+ROW_GROUP = 1024
+
+SCHEMA = pa.schema([("model", pa.string()), ("sha256", pa.string()), ("embedding", pa.list_(pa.float32()))])
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+class EmbedCache:
+    """Persistent (embed model, sha256 of chunk text) -> embedding cache.
+
+    New entries are written as small append-only parquet parts; any set of
+    parts is consistent (duplicates carry identical vectors), so merging is a
+    plain rewrite followed by deleting the merged parts. Only the key ->
+    (part, row) index stays resident: vectors are float32 arrays in an LRU of
+    at most ``max_bytes``, read back by row group on a miss.
+    """
+
+    def __init__(self, root: str, max_bytes: Optional[int] = None):
+        self.root = root
+        self._lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+        self._merging: Optional[threading.Thread] = None
+        self._keys: Optional[Dict[Tuple[str, str], Tuple[str, int]]] = None
+        self._lru: "collections.OrderedDict[Tuple[str, str], np.ndarray]" = collections.OrderedDict()
+        self._lru_bytes = 0
+        self.max_bytes = int(EMBED_CACHE_MB * 1024 * 1024) if max_bytes is None else int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def _parts(self) -> List[str]:
+        try:
+            return sorted(f for f in os.listdir(self.root) if f.endswith(".parquet"))
+        except FileNotFoundError:
+            return []
+
+    def _index(self) -> Dict[Tuple[str, str], Tuple[str, int]]:
+        if self._keys is None:
+            keys: Dict[Tuple[str, str], Tuple[str, int]] = {}
+            for f in self._parts():
+                try:
+                    df = pd.read_parquet(os.path.join(self.root, f), engine="pyarrow", columns=["model", "sha256"])
+                except Exception:
+                    continue
+                for r, key in enumerate(zip(df["model"], df["sha256"])):
+                    keys.setdefault(key, (f, r))
+            self._keys = keys
+        return self._keys
+
+    def _remember(self, key: Tuple[str, str], vec: np.ndarray) -> None:
+        old = self._lru.pop(key, None)
+        if old is not None:
+            self._lru_bytes -= old.nbytes
+        self._lru[key] = vec
+        self._lru_bytes += vec.nbytes
+        while self._lru_bytes > self.max_bytes and self._lru:
+            self._lru_bytes -= self._lru.popitem(last=False)[1].nbytes
+
+    def _read_back(self, wanted: Dict[Tuple[str, str], Tuple[str, int]]) -> Dict[Tuple[str, str], np.ndarray]:
+        """Vectors of ``wanted`` keys, decoding each row group they are in once."""
+        by_group: Dict[Tuple[str, int], List[Tuple[Tuple[str, str], int]]] = {}
+        out: Dict[Tuple[str, str], np.ndarray] = {}
+        for key, (f, r) in wanted.items():
+            by_group.setdefault((f, r // ROW_GROUP), []).append((key, r))
+        files: Dict[str, Optional[pq.ParquetFile]] = {}
+        for (f, _), items in sorted(by_group.items()):
+            if f not in files:
+                try:
+                    files[f] = pq.ParquetFile(os.path.join(self.root, f))
+                except Exception:
+                    # merged away by another process: those texts are embedded again
+                    files[f] = None
+            pf = files[f]
+            if pf is None:
+                continue
+            starts = np.cumsum([0] + [pf.metadata.row_group(i).num_rows for i in range(pf.num_row_groups)])
+            for g in sorted({int(np.searchsorted(starts, r, side="right")) - 1 for _, r in items}):
+                col = pf.read_row_group(g, columns=["embedding"]).column(0).combine_chunks()
+                offsets = col.offsets.to_numpy()
+                values = col.values.to_numpy(zero_copy_only=False)
+                for key, r in items:
+                    i = r - int(starts[g])
+                    if 0 <= i < len(col) and r < starts[g + 1]:
+                        out[key] = np.asarray(values[offsets[i]:offsets[i + 1]], dtype=np.float32)
+        return out
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index())
+
+    def get(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            keys = self._index()
+            want = [(model, text_hash(t)) for t in texts]
+            found: Dict[Tuple[str, str], np.ndarray] = {}
+            cold: Dict[Tuple[str, str], Tuple[str, int]] = {}
+            for key in want:
+                vec = self._lru.get(key)
+                if vec is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = vec
+                elif key in keys:
+                    cold[key] = keys[key]
+            if cold:
+                for key, vec in self._read_back(cold).items():
+                    found[key] = vec
+                    self._remember(key, vec)
+            return [found.get(key) for key in want]
+
+    def put(self, model: str, texts: Sequence[str], embeddings: Sequence[Sequence[float]]) -> None:
+        rows = []
+        with self._lock:
+            keys = self._index()
+            name = f"part-{uuid.uuid4().hex}.parquet"
+            for t, e in zip(texts, embeddings):
+                key = (model, text_hash(t))
+                if key not in keys:
+                    vec = np.asarray(e, dtype=np.float32).ravel()
+                    keys[key] = (name, len(rows))
+                    self._remember(key, vec)
+                    rows.append({"model": model, "sha256": key[1], "embedding": vec})
+            if not rows:
+                return
+            os.makedirs(self.root, exist_ok=True)
+            atomic_replace(os.path.join(self.root, name), pd.DataFrame(rows), row_group_size=ROW_GROUP)
+        # a merge rewrites every part, so it runs off the writer's thread and
+        # takes the lock only to swap in its result
+        if len(self._parts()) > MAX_PARTS and not self._merge_lock.locked():
+            self._merge_later()
+
+    def _merge_later(self) -> None:
+        with self._lock:
+            if self._merging is not None and self._merging.is_alive():
+                return
+            self._merging = threading.Thread(target=self._merge_quietly, name="embed-cache-merge", daemon=True)
+            self._merging.start()
+
+    def _merge_quietly(self) -> None:
+        try:
+            self.merge()
+        except Exception:
+            # left for the next put past the bound, or maintenance
+            pass
+
+    def embed(self, model: str, texts: Sequence[str], embed_fn: Callable[[List[str]], List]) -> List[List[float]]:
+        """Embeddings for ``texts``, calling ``embed_fn`` only for unseen (model, text) pairs."""
+        found = self.get(model, texts)
+        missing: Dict[str, int] = {}
+        for t, v in zip(texts, found):
+            if v is None and t not in missing:
+                missing[t] = len(missing)
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            fresh = list(embed_fn(list(missing)))
+            self.put(model, list(missing), fresh)
+            return [v.tolist() if v is not None else list(fresh[missing[t]]) for t, v in zip(texts, found)]
+        return [v.tolist() for v in found]
+
+    def merge(self, keep: Optional[Iterable[str]] = None, budget=None) -> int:
+        """Rewrite every part as one; returns how many were merged.
+
+        With ``keep`` (text hashes still in use) entries of other texts are
+        dropped too. Row groups are copied one at a time without holding the
+        cache lock; lookups and new parts go on meanwhile. ``budget`` (e.g.
+        ``maintenance.IOBudget``) is charged per row group read and written.
+        """
+        keep = set(keep) if keep is not None else None
+        with self._merge_lock:
+            with self._lock:
+                parts = self._parts()
+                keys = self._index()
+                stale = keep is not None and any(h not in keep for _, h in keys)
+            if len(parts) <= 1 and not stale:
+                return 0
+            name = f"part-{uuid.uuid4().hex}.parquet"
+            path = os.path.join(self.root, name)
+            moved: Dict[Tuple[str, str], Tuple[str, int]] = {}
+            merged = set(parts)
+            with pq.ParquetWriter(path + ".tmp", SCHEMA) as w:
+                for f in parts:
+                    try:
+                        pf = pq.ParquetFile(os.path.join(self.root, f))
+                    except Exception:
+                        continue
+                    start = 0
+                    for g in range(pf.num_row_groups):
+                        t = pf.read_row_group(g, columns=["model", "sha256", "embedding"])
+                        if budget is not None:
+                            budget.spend(t.nbytes)
+                        rows = [(k, start + i) for i, k in enumerate(zip(t.column(0).to_pylist(), t.column(1).to_pylist()))]
+                        start += t.num_rows
+                        # the first copy of each key only, and only keys still in use
+                        mask = [keys.get(k) == (f, r) and (keep is None or k[1] in keep) for k, r in rows]
+                        t = t.filter(pa.array(mask, type=pa.bool_())).cast(SCHEMA)
+                        for (k, _), ok in zip(rows, mask):
+                            if ok:
+                                moved[k] = (name, len(moved))
+                        if t.num_rows:
+                            w.write_table(t, row_group_size=ROW_GROUP)
+                            if budget is not None:
+                                budget.spend(t.nbytes)
+            os.replace(path + ".tmp", path)
+            _fsync_dir(path)
+            with self._lock:
+                for k, at in list(keys.items()):
+                    if at[0] not in merged:
+                        continue
+                    if k in moved:
+                        keys[k] = moved[k]
+                    else:
+                        del keys[k]
+                        vec = self._lru.pop(k, None)
+                        if vec is not None:
+                            self._lru_bytes -= vec.nbytes
+                for f in parts:
+                    try:
+                        os.remove(os.path.join(self.root, f))
+                    except OSError:
+                        pass
+            return len(parts)
+
+    def seed(self, model: str, texts: Sequence[str], embeddings: Sequence[Sequence[float]]) -> None:
+        """Prime an empty cache with vectors that are already stored elsewhere."""
+        with self._lock:
+            if not self._index():
+                self.put(model, texts, embeddings)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._index()),
+                "resident_bytes": self._lru_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "parts": len(self._parts()),
+            }
+
+
+_cache: Optional[EmbedCache] = None
+_cache_lock = threading.Lock()
+
+
+def embed_cache() -> EmbedCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbedCache(os.path.join(META_DIR, "embed_cache"))
+        return _cache
@@ -1,54 +1,66 @@
 import time
-from typing import Dict, List
-
-import pandas as pd
-
-from ..vectorstore import _collection, embed_texts
-from .parquet_util import atomic_replace, table_path, read_parquet_safe
-
-
-def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
-    if chunk_size <= 0:
-        return [text]
-    out: List[str] = []
-    i = 0
-    L = len(text)
-    while i < L:
-        j = min(L, i + chunk_size)
-        out.append(text[i:j])
-        # advance with overlap
-        ni = j - overlap
-        if ni <= i:
-            ni = j
-        i = ni
-    return out
-
-
-def reindex_note(note_id: str, title: str, text: str, chunk_size: int, overlap: int) -> int:
-    # Delete old chunks by metadata filter
-    try:
-        _collection.delete(where={"note_id": note_id})
-    except Exception:
-        pass
-    if not text:
-        return 0
-    chunks = chunk_text(text, chunk_size, overlap)
-    embs = embed_texts(chunks)
-    ids = [f"note:{note_id}:{i}" for i in range(len(chunks))]
-    metas: List[Dict] = [{"note_id": note_id, "title": title}] * len(chunks)
-    _collection.add(ids=ids, documents=chunks, metadatas=metas, embeddings=embs)
-    # also persist to parquet
-    df = read_parquet_safe(table_path("embeddings"))
-    if df.empty:
-        df = pd.DataFrame(columns=["note_id", "chunk_index", "text", "embedding", "updated_at"])
-    ts = int(time.time() * 1000)
-    rows = [
-        {"note_id": note_id, "chunk_index": i, "text": chunks[i], "embedding": list(embs[i]), "updated_at": ts}
-        for i in range(len(chunks))
-    ]
-    # drop old rows for this note_id
-    if not df.empty:
-        df = df[df["note_id"] != note_id]
-    df = pd.concat([df, pd.DataFrame(rows)], ignore_index=True)
-    atomic_replace(table_path("embeddings"), df)
-    return len(chunks)
+from typing import Dict, List, Tuple
+
+from ..caches import bump_generation
+from ..ollama_client import EMBED_MODEL, embed_texts
+from ..vector_backends import vector_backend
+from .chunking import chunk_text
+from .embed_cache import embed_cache
+
+
+def reindex_note(note_id: str, title: str, text: str, chunk_size: int, overlap: int, chunker: str = "fixed") -> int:
+    return reindex_notes([(note_id, title, text)], chunk_size, overlap, chunker)
+
+
+def reindex_notes(notes: List[Tuple[str, str, str]], chunk_size: int, overlap: int,
+                  chunker: str = "fixed") -> int:
+    """Chunk and embed (note_id, title, text) and write them to the vector backend.
+
+    Every chunk text of the batch goes through the embedding cache in one
+    call, so Ollama sees full ``EMBED_BATCH_SIZE`` requests, and all rewritten
+    notes go to the backend in one write; notes whose chunks are unchanged
+    are skipped and empty notes are removed. Returns the number of chunks.
+    """
+    backend = vector_backend()
+    plans = [(note_id, title, chunk_text(text, chunk_size, overlap, chunker) if text else [])
+             for note_id, title, text in notes]
+    flat = [c for _, _, chunks in plans for c in chunks]
+    old = backend.note_texts([p[0] for p in plans])
+    if flat:
+        _backfill(backend, plans, old)
+    found = dict(zip(flat, embed_cache().embed(EMBED_MODEL, flat, embed_texts))) if flat else {}
+    written = backend.put_notes([(nid, title, chunks, [found[c] for c in chunks]) for nid, title, chunks in plans],
+                                int(time.time() * 1000))
+    if written:
+        bump_generation()
+    return len(flat)
+
+
+def _backfill(backend, plans: List[Tuple[str, str, List[str]]], old: Dict[str, List[str]]) -> None:
+    """Unchanged chunks indexed before the embedding cache existed: seed it from the stored vectors."""
+    ec = embed_cache()
+    for note_id, _, chunks in plans:
+        prev = old.get(note_id) or []
+        reuse = [i for i, v in enumerate(ec.get(EMBED_MODEL, chunks)) if v is None and i < len(prev) and prev[i] == chunks[i]]
+        if not reuse:
+            continue
+        try:
+            stored = backend.stored_vectors(note_id)
+            pairs = [stored[i] for i in reuse if i in stored and stored[i][0] == chunks[i]]
+            if pairs:
+                ec.put(EMBED_MODEL, [t for t, _ in pairs], [list(e) for _, e in pairs])
+        except Exception:
+            pass
+
+
+def remove_note_index(note_id: str) -> None:
+    """Drop a deleted note's chunks from the vector backend."""
+    remove_notes_index([note_id])
+
+
+def remove_notes_index(note_ids: List[str]) -> None:
+    note_ids = list(note_ids)
+    if not note_ids:
+        return
+    vector_backend().remove_notes(note_ids)
+    bump_generation()
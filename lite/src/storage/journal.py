@@ -0,0 +1,297 @@
+import json
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from .parquet_util import _fsync_dir, atomic_replace, table_path
+
+
+# Fold the journal into the parquet base once it grows past either bound
+CHECKPOINT_OPS = 500
+CHECKPOINT_BYTES = 1 << 20
+
+
+def _match(df: pd.DataFrame, match: Dict) -> pd.Series:
+    m = pd.Series(True, index=df.index)
+    for k, v in match.items():
+        if k not in df.columns:
+            return pd.Series(False, index=df.index)
+        m &= df[k].isin(v) if isinstance(v, (list, tuple, set)) else (df[k] == v)
+    return m
+
+
+def read_ops(p: str, start: int = 0) -> Tuple[List[Dict], int]:
+    """Decode complete JSON lines of ``p`` from byte offset ``start``; a torn tail is left for later.
+    Returns the ops and the offset after the last complete line."""
+    try:
+        with open(p, "rb") as f:
+            f.seek(start)
+            data = f.read()
+    except FileNotFoundError:
+        return [], start
+    end = data.rfind(b"\n") + 1
+    ops: List[Dict] = []
+    for line in data[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            ops.append(json.loads(line))
+        except ValueError:
+            continue
+    return ops, start + end
+
+
+def apply_op(df: pd.DataFrame, op: Dict, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Apply one journal op. Every op is idempotent so a journal can be replayed
+    over a base that already contains some of its effects."""
+    kind = op.get("op")
+    if kind == "upsert":
+        rows = op.get("rows") or []
+        if not rows:
+            return df
+        key = [k for k in (op.get("key") or []) if k in rows[0]]
+        new = pd.DataFrame(rows)
+        if key:
+            new = new.drop_duplicates(subset=key, keep="last")
+        if df.empty:
+            cols = list(df.columns) or list(columns or [])
+            return new.reindex(columns=list(dict.fromkeys(cols + list(new.columns))))
+        if key and all(k in df.columns for k in key):
+            if len(key) == 1:
+                df = df[~df[key[0]].isin(new[key[0]])]
+            else:
+                df = df[~pd.MultiIndex.from_frame(df[key]).isin(pd.MultiIndex.from_frame(new[key]))]
+        return pd.concat([df, new], ignore_index=True)
+    if df.empty:
+        return df
+    if kind == "update":
+        sel = _match(df, op.get("match") or {})
+        if sel.any():
+            df = df.copy()
+            for k, v in (op.get("set") or {}).items():
+                if k not in df.columns:
+                    df[k] = None
+                df.loc[sel, k] = v
+        return df
+    if kind == "delete":
+        return df[~_match(df, op.get("match") or {})]
+    return df
+
+
+class JournaledTable:
+    """A parquet table plus an append-only journal of row-level ops.
+
+    Writes append one fsynced JSON line to ``<table>.parquet.journal``; reads
+    replay the journal over the base file (incrementally for this process).
+    ``checkpoint`` folds the journal into the base through ``atomic_replace``
+    and keeps the folded journal as ``.journal.bak`` so the ``.bak`` base can
+    still be rolled forward if the new base turns out to be corrupt. A journal
+    past ``CHECKPOINT_OPS``/``CHECKPOINT_BYTES`` is folded on a background
+    thread, so the write that crossed the bound does not wait for the rewrite.
+
+    Subscribers get ``(before, after, ops)`` version transitions for every
+    append (``ops`` is None if writes from another process were folded in
+    too) and checkpoint (``ops == []``), so derived in-memory structures can
+    follow the table without re-reading it.
+    """
+
+    def __init__(self, path: str, columns: Optional[List[str]] = None):
+        self.path = path
+        self.columns = columns
+        self.journal_path = path + ".journal"
+        self._lock = threading.RLock()
+        self._df: Optional[pd.DataFrame] = None
+        self._base_stat: Optional[Tuple[int, int]] = None
+        self._pos = 0
+        self._ops = 0
+        self._folding: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[Tuple, Tuple, Optional[List[Dict]]], None]] = []
+
+    def subscribe(self, fn: Callable[[Tuple, Tuple, Optional[List[Dict]]], None]) -> None:
+        with self._lock:
+            self._listeners.append(fn)
+
+    def _notify(self, before: Tuple, ops: Optional[List[Dict]]) -> None:
+        after = (self._base_stat, self._pos)
+        for fn in list(self._listeners):
+            try:
+                fn(before, after, ops)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _stat(p: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(p)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self) -> None:
+        ops: List[Dict] = []
+        try:
+            df = pd.read_parquet(self.path, engine="pyarrow") if os.path.exists(self.path) else pd.DataFrame()
+        except Exception:
+            # base is corrupt: fall back to .bak and roll it forward with the folded journal
+            bak = self.path + ".bak"
+            if not os.path.exists(bak):
+                raise
+            df = pd.read_parquet(bak, engine="pyarrow")
+            ops, _ = read_ops(self.journal_path + ".bak")
+        tail, pos = read_ops(self.journal_path)
+        for op in ops + tail:
+            df = apply_op(df, op, self.columns)
+        self._df = df
+        self._pos = pos
+        self._ops = len(tail)
+        self._base_stat = self._stat(self.path)
+
+    def _refresh(self) -> pd.DataFrame:
+        base = self._stat(self.path)
+        jsize = (self._stat(self.journal_path) or (0, 0))[1]
+        if self._df is None or base != self._base_stat or jsize < self._pos:
+            self._load()
+        elif jsize > self._pos:
+            tail, self._pos = read_ops(self.journal_path, self._pos)
+            for op in tail:
+                self._df = apply_op(self._df, op, self.columns)
+            self._ops += len(tail)
+        return self._df
+
+    def read(self) -> pd.DataFrame:
+        with self._lock:
+            return self._refresh().copy()
+
+    def read_versioned(self) -> Tuple[pd.DataFrame, Tuple]:
+        """``read()`` plus the ``version()`` the frame corresponds to."""
+        with self._lock:
+            df = self._refresh().copy()
+            return df, (self._base_stat, self._pos)
+
+    def rows(self, match: Dict, limit: Optional[int] = None) -> List[Dict]:
+        """Rows whose columns equal ``match`` (a list value matches any of its items); NaN comes back as None."""
+        with self._lock:
+            df = self._refresh()
+            if df.empty:
+                return []
+            sel = df[_match(df, match)]
+            if limit is not None:
+                sel = sel.head(limit)
+            return sel.astype(object).where(sel.notna(), None).to_dict(orient="records")
+
+    def version(self) -> Tuple:
+        """Changes whenever the table content may have changed (base rewrite or journal append)."""
+        with self._lock:
+            self._refresh()
+            return (self._base_stat, self._pos)
+
+    def append(self, ops: Iterable[Dict]) -> None:
+        ops = list(ops)
+        if not ops:
+            return
+        payload = "".join(json.dumps(op, ensure_ascii=False, default=str) + "\n" for op in ops).encode("utf-8")
+        with self._lock:
+            self._refresh()
+            before = (self._base_stat, self._pos)
+            created = not os.path.exists(self.journal_path)
+            with open(self.journal_path, "ab") as f:
+                torn = f.tell() > self._pos
+                if torn:
+                    # torn line from a crashed writer: terminate it so our ops start clean
+                    f.write(b"\n")
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            if created:
+                _fsync_dir(self.journal_path)
+            self._refresh()
+            exact = not torn and self._base_stat == before[0] and self._pos == before[1] + len(payload)
+            self._notify(before, ops if exact else None)
+            if self._ops >= CHECKPOINT_OPS or self._pos >= CHECKPOINT_BYTES:
+                self._checkpoint_later()
+
+    def _checkpoint_later(self) -> None:
+        if self._folding is not None and self._folding.is_alive():
+            return
+        self._folding = threading.Thread(target=self._checkpoint_quietly, name="journal-checkpoint", daemon=True)
+        self._folding.start()
+
+    def _checkpoint_quietly(self) -> None:
+        try:
+            self.checkpoint()
+        except Exception:
+            # left for the next write past the bound, or the scheduled checkpoint
+            pass
+
+    def upsert(self, rows: List[Dict], key: List[str]) -> None:
+        self.append([{"op": "upsert", "key": key, "rows": rows}])
+
+    def update(self, match: Dict, values: Dict) -> None:
+        self.append([{"op": "update", "match": match, "set": values}])
+
+    def delete(self, match: Dict) -> None:
+        self.append([{"op": "delete", "match": match}])
+
+    def checkpoint(self) -> bool:
+        """Fold the journal into the parquet base. Returns False if there was nothing to fold."""
+        with self._lock:
+            df = self._refresh()
+            if not os.path.exists(self.journal_path):
+                return False
+            before = (self._base_stat, self._pos)
+            if self._pos:
+                if df.empty and self.columns and not len(df.columns):
+                    df = pd.DataFrame(columns=self.columns)
+                atomic_replace(self.path, df)
+            os.replace(self.journal_path, self.journal_path + ".bak")
+            _fsync_dir(self.journal_path)
+            self._pos = 0
+            self._ops = 0
+            self._base_stat = self._stat(self.path)
+            self._notify(before, [])
+            return True
+
+
+_tables: Dict[str, JournaledTable] = {}
+_tables_lock = threading.Lock()
+
+
+def journaled(path: str, columns: Optional[List[str]] = None) -> JournaledTable:
+    with _tables_lock:
+        t = _tables.get(path)
+        if t is None:
+            t = _tables[path] = JournaledTable(path, columns)
+        elif columns and not t.columns:
+            t.columns = columns
+        return t
+
+
+def read_table(name: str) -> pd.DataFrame:
+    """Journal-aware replacement for ``read_parquet_safe(table_path(name))``."""
+    return journaled(table_path(name)).read()
+
+
+def _size(p: str) -> int:
+    try:
+        return os.path.getsize(p)
+    except OSError:
+        return 0
+
+
+def checkpoint_all(budget=None) -> int:
+    """Fold the journal of every open table; ``budget`` (e.g. ``maintenance.IOBudget``)
+    is charged for each fold before it runs."""
+    with _tables_lock:
+        tables = list(_tables.values())
+    n = 0
+    for t in tables:
+        if budget is not None and os.path.exists(t.journal_path):
+            # read base and journal, write the new base
+            budget.spend(2 * _size(t.path) + _size(t.journal_path))
+        try:
+            n += int(t.checkpoint())
+        except Exception:
+            pass
+    return n
@@ -0,0 +1,269 @@
+"""Nightly maintenance: compaction, orphan cleanup and index reconciliation.
+
+    python -m lite.src.storage.maintenance [--io-mb-s 16]
+
+Folds metadata journals (and vacuums the sqlite file), drops vector backend
+chunks of deleted notes and compacts the backend and embedding cache,
+requeues notes that have text but no chunks, and deletes leftover temp,
+backup and segment files.
+Work is paced by an I/O budget so interactive requests keep the disk. The
+report of the last run is kept in ``maintenance.json``.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .config import META_DIR, _atomic_write
+
+
+REPORT_PATH = os.path.join(META_DIR, "maintenance.json")
+# Sustained disk throughput the pass may use; 0 = unthrottled
+MAINTENANCE_IO_MB_S = float(os.getenv("MAINTENANCE_IO_MB_S", "16"))
+# Temp files and unreferenced segments younger than this may still be in use
+STALE_AGE_S = 3600
+# Notes touched more recently may have a reindex in flight; reconcile them next time
+SETTLE_MS = 10 * 60 * 1000
+# notes_index sha256 of an empty body: such notes have no chunks
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+class IOBudget:
+    """Token bucket over bytes read and written: ``spend`` sleeps to hold the
+    average at ``bytes_per_s``, allowing about a second of burst."""
+
+    def __init__(self, bytes_per_s: float):
+        self.rate = float(bytes_per_s)
+        self.spent = 0
+        self.slept = 0.0
+        self._debt = 0.0
+        self._t = time.monotonic()
+
+    def spend(self, n: int) -> None:
+        self.spent += int(n)
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self._debt = max(0.0, self._debt - (now - self._t) * self.rate) + n
+        self._t = now
+        wait = self._debt / self.rate - 1.0
+        if wait > 0:
+            time.sleep(wait)
+            self.slept += wait
+
+
+def _note_rows() -> Dict[str, int]:
+    from .metadata import table
+
+    df = table("notes_index").read()
+    if df.empty:
+        return {}
+    return {nid: int(ts) if ts == ts and ts is not None else 0 for nid, ts in zip(df["note_id"], df["updated_at"])}
+
+
+def compact_metadata(budget: IOBudget) -> Dict:
+    """Fold every metadata journal, snapshot the keyword indexes; vacuum the sqlite file when fragmented."""
+    from .bm25 import bm25_index
+    from .metadata import METADATA_BACKEND, SCHEMAS, checkpoint_all, sqlite_db, table
+    from .trigram import trigram_index
+
+    # open each journaled table so checkpoint_all sees it
+    for name in SCHEMAS:
+        table(name)
+    # each fold, snapshot and vacuum is charged before it runs
+    out = {"journals_folded": checkpoint_all(budget), "sqlite_reclaimed_bytes": 0}
+    out["text_indexes_saved"] = sum(ix.save(budget) for ix in (trigram_index(), bm25_index()))
+    if METADATA_BACKEND == "sqlite":
+        out["sqlite_reclaimed_bytes"] = sqlite_db().vacuum(budget=budget)
+    return out
+
+
+def compact_embeddings(budget: IOBudget) -> Dict:
+    """Drop chunks of notes missing from notes_index, then compact the vector backend and
+    embedding cache, pruning cached vectors no stored chunk uses."""
+    from ..vector_backends import DOCUMENTS, NOTES, vector_backend
+    from .embed_cache import embed_cache, text_hash
+    from .indexing import remove_notes_index
+
+    backend = vector_backend()
+    # stored notes before the index: a note created in between has no chunks yet
+    have = list(backend.note_counts())
+    notes = _note_rows()
+    orphans = [nid for nid in have if nid not in notes]
+    if orphans:
+        remove_notes_index(orphans)
+    before = backend.disk_bytes()
+    # charged as the merges copy, so they are paced rather than paid for up front
+    out = {"orphan_notes": len(orphans), **backend.compact(STALE_AGE_S, budget)}
+    ec = embed_cache()
+    entries = len(ec)
+    # vectors of texts no stored chunk has any more (edited or deleted) are dropped
+    live = {text_hash(t) for kind in (NOTES, DOCUMENTS) for t in backend.texts(kind)}
+    out["embed_cache_parts_merged"] = ec.merge(keep=live, budget=budget)
+    out["embed_cache_pruned"] = entries - len(ec)
+    out["reclaimed_bytes"] = max(0, before - backend.disk_bytes())
+    return out
+
+
+def reconcile_index(budget: IOBudget) -> Dict:
+    """Requeue notes that have text but no chunks in the vector backend (a lost or failed reindex)."""
+    from ..vector_backends import vector_backend
+    from .metadata import table
+
+    started = int(time.time() * 1000)
+    have = vector_backend().note_counts()
+    budget.spend(200 * sum(have.values()))
+    df = table("notes_index").read()
+    missing: List[str] = []
+    if not df.empty:
+        for nid, ts, sha in zip(df["note_id"], df["updated_at"], df.get("sha256", [None] * len(df))):
+            # notes touched recently may have a reindex in flight
+            if nid in have or sha == EMPTY_SHA256 or (ts == ts and ts is not None and int(ts) > started - SETTLE_MS):
+                continue
+            missing.append(nid)
+    if missing:
+        from ..reindex_queue import reindex_queue
+
+        reindex_queue().enqueue(missing)
+    return {"notes": len(have), "requeued_notes": len(missing)}
+
+
+def _readable(path: str) -> bool:
+    try:
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+
+            pq.read_metadata(path)
+            return True
+        if path.endswith(".json"):
+            with open(path, "r", encoding="utf-8") as f:
+                json.load(f)
+            return True
+    except Exception:
+        pass
+    return False
+
+
+def _remove(path: str) -> int:
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except OSError:
+        return -1
+
+
+def remove_stale_files(budget: IOBudget) -> Dict:
+    """Old ``.tmp``/``.part`` leftovers and ``.bak`` copies of files that read back fine.
+
+    A ``.bak`` whose file is missing or unreadable is the recovery copy and
+    stays, as does an interrupted rebuild.
+    """
+    from .rebuild import REBUILD_DIR
+
+    files = n_bytes = kept = 0
+    now = time.time()
+    for d, dirs, names in os.walk(META_DIR):
+        if os.path.abspath(d) == os.path.abspath(REBUILD_DIR):
+            dirs[:] = []
+            continue
+        for name in names:
+            path = os.path.join(d, name)
+            try:
+                old = now - os.path.getmtime(path) >= STALE_AGE_S
+            except OSError:
+                continue
+            if not old:
+                continue
+            doomed: List[str] = []
+            if name.endswith((".tmp", ".tmp.npz", ".part")):
+                doomed = [path]
+            elif name.endswith(".journal.bak"):
+                # only used to roll back to the base's .bak
+                if not os.path.exists(path[: -len(".journal.bak")] + ".bak"):
+                    doomed = [path]
+            elif name.endswith(".bak"):
+                if _readable(path[:-4]):
+                    doomed = [path, path[:-4] + ".journal.bak"]
+                else:
+                    kept += 1
+            for p in doomed:
+                size = _remove(p)
+                if size >= 0:
+                    files += 1
+                    n_bytes += size
+                    budget.spend(4096)
+    return {"files": files, "bytes": n_bytes, "backups_kept": kept}
+
+
+STEPS = (
+    ("metadata", compact_metadata),
+    ("embeddings", compact_embeddings),
+    ("index", reconcile_index),
+    ("files", remove_stale_files),
+)
+
+
+def run_maintenance(io_mb_s: Optional[float] = None) -> Dict:
+    """Run every step, each on its own (a failing step is reported, not fatal); returns and saves the report."""
+    from ..caches import bump_generation
+
+    budget = IOBudget((MAINTENANCE_IO_MB_S if io_mb_s is None else io_mb_s) * 1024 * 1024)
+    t0 = time.time()
+    report: Dict = {"started_at": int(t0 * 1000), "errors": []}
+    for name, step in STEPS:
+        t = time.time()
+        try:
+            report[name] = step(budget)
+        except Exception as e:
+            report["errors"].append(f"{name}: {type(e).__name__}: {e}")
+        report.setdefault("seconds", {})[name] = round(time.time() - t, 3)
+    bump_generation()
+    report["finished_at"] = int(time.time() * 1000)
+    report["io"] = {"bytes": budget.spent, "throttled_s": round(budget.slept, 3)}
+    try:
+        _atomic_write(REPORT_PATH, json.dumps(report))
+    except Exception:
+        pass
+    return report
+
+
+_running = threading.Lock()
+
+
+def start_maintenance(io_mb_s: Optional[float] = None) -> bool:
+    """Run ``run_maintenance`` on a background thread; False if a pass is already running."""
+    if not _running.acquire(blocking=False):
+        return False
+
+    def run() -> None:
+        try:
+            run_maintenance(io_mb_s)
+        finally:
+            _running.release()
+
+    threading.Thread(target=run, name="maintenance", daemon=True).start()
+    return True
+
+
+def maintenance_status() -> Dict:
+    try:
+        with open(REPORT_PATH, "r", encoding="utf-8") as f:
+            last = json.load(f)
+    except Exception:
+        last = None
+    return {"running": _running.locked(), "last": last}
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description="Compact storage and remove orphaned index data.")
+    ap.add_argument("--io-mb-s", type=float, default=None, help="disk budget in MB/s (0 = unthrottled)")
+    args = ap.parse_args(argv)
+    print(json.dumps(run_maintenance(args.io_mb_s), indent=2))
+
+
+if __name__ == "__main__":
+    main()
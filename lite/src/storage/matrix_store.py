@@ -0,0 +1,279 @@
+import collections
+import os
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .parquet_util import atomic_replace
+from .segments import SEGMENT_COLUMNS, SegmentStore, spend
+
+
+# Sidecar columns: ids, texts and each row's offset into the matrix file
+SIDECAR_COLUMNS = ["note_id", "chunk_index", "text", "updated_at", "row"]
+# Rows copied per block when a merge rewrites the matrix file
+COPY_ROWS = 16384
+
+
+class MatrixStore(SegmentStore):
+    """Segment store whose vectors live in one memory-mapped float32 matrix file.
+
+    Vectors are unit-normalized and appended as C-order float32 rows of the
+    manifest's ``matrix`` file (``vectors-*.f32``); each segment is a parquet
+    sidecar of ids, texts and every chunk's row offset into that file (-1
+    without an embedding). Merges join sidecars only; rows of rewritten or
+    deleted notes stay in the file until they outnumber the live ones and a
+    merge rewrites it with the live rows only, so every live segment shares
+    one file that ``mapped`` opens read-only with
+    ``np.memmap``: processes share its page cache and a search index can
+    score it in place. Manifest, tombstones and adoption work as in
+    ``SegmentStore``.
+    """
+
+    SUFFIXES = (".parquet", ".f32")
+
+    @staticmethod
+    def _matrix_file(seg: Dict) -> str:
+        # segments written before the shared file each had their own
+        return seg.get("matrix") or seg["file"][: -len(".parquet")] + ".f32"
+
+    def _files(self, seg: Dict) -> List[str]:
+        return [seg["file"], self._matrix_file(seg)]
+
+    def _remove_segments(self, segs: Iterable[Dict]) -> None:
+        m = self._read_manifest()
+        # a matrix file goes with the last segment using it
+        live = {self._matrix_file(s) for s in m["segments"]} | {m.get("matrix")}
+        self._unlink(sorted({f for seg in segs for f in self._files(seg)} - live))
+
+    def _append(self, name: str, matrix: np.ndarray) -> int:
+        """Append rows to matrix file ``name``; returns the offset of the first."""
+        path = self._segment_path(name)
+        row_bytes = 4 * matrix.shape[1]
+        with open(path, "ab"):
+            pass
+        with open(path, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            # a torn row left by an interrupted append is overwritten
+            start = f.tell() // row_bytes
+            f.seek(start * row_bytes)
+            f.write(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+        return start
+
+    def _write_segment(self, name: str, df: pd.DataFrame, m: Dict) -> Dict:
+        vecs = [np.asarray(v, dtype=np.float32).ravel() if v is not None else np.empty(0, dtype=np.float32)
+                for v in (df["embedding"] if "embedding" in df.columns else [None] * len(df))]
+        dim = max((v.size for v in vecs), default=0) or int(m.get("dim") or 0)
+        rows = [i for i, v in enumerate(vecs) if dim and v.size == dim]
+        offsets = np.full(len(vecs), -1, dtype=np.int64)
+        fname = m.get("matrix")
+        if not fname or int(m.get("dim") or 0) != dim:
+            # first write, or a new embedding width: rows go to a fresh file
+            fname = f"vectors-{uuid.uuid4().hex}.f32"
+            open(self._segment_path(fname), "ab").close()
+        if rows:
+            matrix = np.vstack([vecs[i] for i in rows])
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            offsets[rows] = self._append(fname, matrix / np.where(norms > 0, norms, 1.0)) + np.arange(len(rows))
+        m["matrix"], m["dim"] = fname, int(dim)
+        # the sidecar goes last: its offsets only point at rows already on disk
+        side = df.reindex(columns=SEGMENT_COLUMNS).drop(columns=["embedding"]).assign(row=offsets)
+        atomic_replace(self._segment_path(name), side.reindex(columns=SIDECAR_COLUMNS))
+        return {"matrix": fname, "dim": int(dim)}
+
+    def _map(self, name: Optional[str], dim: int) -> np.ndarray:
+        path = self._segment_path(name) if name else ""
+        n = os.path.getsize(path) // (4 * dim) if name and dim and os.path.exists(path) else 0
+        if not n:
+            return np.zeros((0, dim), dtype=np.float32)
+        return np.memmap(path, dtype=np.float32, mode="r", shape=(n, dim))
+
+    def matrix(self, seg: Dict) -> np.ndarray:
+        """Read-only (rows, dim) float32 view of the matrix file ``seg``'s rows are in."""
+        return self._map(self._matrix_file(seg), int(seg.get("dim") or 0))
+
+    def _load(self, seg: Dict) -> pd.DataFrame:
+        side = pd.read_parquet(self._segment_path(seg["file"]), engine="pyarrow")
+        m = self.matrix(seg)
+        # rows of the mapped file, not copies
+        side["embedding"] = [m[r] if r >= 0 else None for r in side["row"].astype("int64")]
+        return side.reindex(columns=SEGMENT_COLUMNS)
+
+    def _sidecars(self, m: Dict, segs: List[Dict], note_ids: Optional[set] = None) -> pd.DataFrame:
+        parts = []
+        for seg in segs:
+            side = pd.read_parquet(self._segment_path(seg["file"]), engine="pyarrow")
+            keep = side["note_id"].map(m["notes"]).eq(seg["seq"]).to_numpy(dtype=bool) & (side["row"] >= 0).to_numpy()
+            if note_ids is not None:
+                keep &= side["note_id"].isin(note_ids).to_numpy()
+            parts.append(side[keep])
+        parts = [p for p in parts if not p.empty]
+        if not parts:
+            return pd.DataFrame(columns=SIDECAR_COLUMNS)
+        return pd.concat(parts, ignore_index=True)
+
+    def mapped(self) -> Optional[Tuple[np.ndarray, pd.DataFrame]]:
+        """The mapped matrix file and the sidecar rows of every live chunk with a vector.
+
+        None while live segments span several files (after an adoption or a
+        change of embedding width, until the merge that follows).
+        """
+        for _ in range(3):
+            m = self.manifest()
+            name = m.get("matrix")
+            if any(self._matrix_file(s) != name for s in m["segments"]):
+                return None
+            try:
+                side = self._sidecars(m, m["segments"])
+                return self._map(name, int(m.get("dim") or 0)), side
+            except FileNotFoundError:
+                # a concurrent merge retired the files; retry with the new manifest
+                continue
+        raise RuntimeError("embeddings manifest kept changing while reading")
+
+    def put_mapped(self, rows_by_note: Dict[str, List[Dict]]
+                   ) -> Tuple[np.ndarray, pd.DataFrame, Optional[Tuple[int, int]]]:
+        """``put_notes``, plus what a mapped index needs to take the write in place:
+        the matrix file after the append, the sidecar rows written and the
+        manifest stat of the write."""
+        with self._lock:
+            after = self.put_notes(rows_by_note)
+            m = self._read_manifest()
+            seqs = {m["notes"][nid] for nid, rows in rows_by_note.items() if rows and nid in m["notes"]}
+            side = self._sidecars(m, [s for s in m["segments"] if s["seq"] in seqs], set(rows_by_note))
+            return self._map(m.get("matrix"), int(m.get("dim") or 0)), side, after
+
+    def _spans_files(self, m: Dict) -> bool:
+        return any(self._matrix_file(s) != m.get("matrix") for s in m["segments"])
+
+    def _needs_rewrite(self, m: Dict) -> bool:
+        """Whether the matrix file itself should be rewritten: live segments span
+        several files, or rows of rewritten and deleted notes outnumber the live ones."""
+        if self._spans_files(m):
+            return True
+        live = collections.Counter(m["notes"].values())
+        rows = sum(int(s["rows"]) * live.get(s["seq"], 0) / max(1, int(s.get("notes") or s["rows"] or 1))
+                   for s in m["segments"])
+        return len(self._map(m.get("matrix"), int(m.get("dim") or 0))) > 2 * max(1024, rows)
+
+    def _merge_plan(self, m: Dict) -> List[Dict]:
+        # sidecars are only joined over one file; anything else waits for a rewrite
+        return [] if self._spans_files(m) else super()._merge_plan(m)
+
+    def needs_merge(self, m: Optional[Dict] = None) -> bool:
+        m = m or self.manifest()
+        return self._needs_rewrite(m) or super().needs_merge(m)
+
+    def _merged_rows(self, m: Dict, segs: List[Dict], budget=None) -> pd.DataFrame:
+        # the sidecars alone: their offsets stay valid in the shared file
+        parts = []
+        for seg in segs:
+            side = pd.read_parquet(self._segment_path(seg["file"]), engine="pyarrow")
+            spend(budget, self._file_size(seg["file"]))
+            parts.append(side[side["note_id"].map(m["notes"]).eq(seg["seq"]).to_numpy(dtype=bool)])
+        parts = [p for p in parts if not p.empty]
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=SIDECAR_COLUMNS)
+
+    def _write_merged(self, name: str, df: pd.DataFrame, m: Dict) -> Dict:
+        atomic_replace(self._segment_path(name), df.reindex(columns=SIDECAR_COLUMNS))
+        return {"matrix": m.get("matrix"), "dim": int(m.get("dim") or 0)}
+
+    def merge(self, full: bool = False, budget=None) -> int:
+        """Join sidecars by the tiering policy of ``SegmentStore.merge``; the
+        vectors stay where they are in the shared file. The file itself is
+        rewritten with the live rows only (always with ``full``) once dead rows
+        outnumber live ones or live segments span several files.
+
+        The rewrite copies rows from the mapped file without blocking writers;
+        whatever they appended meanwhile is copied over under the write lock
+        right before the manifest swap. ``budget`` is charged per block copied.
+        """
+        with self._merge_lock:
+            m = self.manifest()
+            if full or self._needs_rewrite(m):
+                return self._rewrite(m, budget)
+        return super().merge(budget=budget)
+
+    def _copy_live(self, m: Dict, segs: List[Dict], f, dim: int, start: int, budget=None) -> pd.DataFrame:
+        """Append the live rows of ``segs`` to open file ``f`` (``start`` rows in);
+        returns their sidecar rows with the new offsets."""
+        parts = []
+        for seg in segs:
+            side = pd.read_parquet(self._segment_path(seg["file"]), engine="pyarrow")
+            side = side[side["note_id"].map(m["notes"]).eq(seg["seq"]).to_numpy(dtype=bool)]
+            if side.empty:
+                continue
+            rows = side["row"].to_numpy(dtype=np.int64)
+            # rows of an older embedding width are dropped, as a write would
+            has = (rows >= 0) & (int(seg.get("dim") or 0) == dim)
+            src, idx = self.matrix(seg), rows[has]
+            offsets = np.full(len(rows), -1, dtype=np.int64)
+            offsets[has] = start + np.arange(len(idx))
+            for lo in range(0, len(idx), COPY_ROWS):
+                block = np.asarray(src[idx[lo:lo + COPY_ROWS]], dtype=np.float32)
+                # rows of files from before unit-normalized storage are normalized here
+                norms = np.linalg.norm(block, axis=1, keepdims=True)
+                f.write(np.ascontiguousarray(block / np.where(norms > 0, norms, 1.0), dtype=np.float32).tobytes())
+                # read and written
+                spend(budget, 2 * block.nbytes)
+            start += len(idx)
+            parts.append(side.assign(row=offsets))
+        if not parts:
+            return pd.DataFrame(columns=SIDECAR_COLUMNS)
+        return pd.concat(parts, ignore_index=True).reindex(columns=SIDECAR_COLUMNS)
+
+    def _rewrite(self, m0: Dict, budget=None) -> int:
+        """Rewrite the live rows of manifest ``m0`` (and of writes landing
+        meanwhile) over a fresh matrix file. Caller holds ``_merge_lock``."""
+        if len(m0["segments"]) <= 1 and not m0["tombstones"] and not self._needs_rewrite(m0):
+            return 0
+        # the newest segment has the current width (an adopted manifest records none)
+        newest = max(m0["segments"], key=lambda s: s["seq"], default=m0)
+        dim = int(newest.get("dim") or m0.get("dim") or 0)
+        fname = f"vectors-{uuid.uuid4().hex}.f32"
+        name, delta_name = (f"merged-{uuid.uuid4().hex}.parquet" for _ in range(2))
+        path = self._segment_path(fname)
+        with open(path, "wb") as f:
+            side = self._copy_live(m0, m0["segments"], f, dim, 0, budget)
+            with self._lock:
+                m = self._read_manifest()
+                old = {s["seq"] for s in m0["segments"]}
+                newer = [s for s in m["segments"] if s["seq"] not in old]
+                if any(int(s.get("dim") or dim) != dim for s in newer):
+                    # the embedding width changed meanwhile: the next merge starts over
+                    f.close()
+                    self._unlink([fname])
+                    return 0
+                # not charged to the budget: writers wait for this part
+                delta = self._copy_live(m, newer, f, dim, f.tell() // (4 * dim) if dim else 0)
+                f.flush()
+                os.fsync(f.fileno())
+                # sidecars go last: their offsets only point at rows already on disk
+                atomic_replace(self._segment_path(name), side)
+                seq = int(m["seq"]) + 1
+                segments = [{"file": name, "seq": seq, "rows": int(len(side)),
+                             "notes": int(side["note_id"].nunique()), "matrix": fname, "dim": dim}]
+                if not delta.empty:
+                    atomic_replace(self._segment_path(delta_name), delta)
+                    segments.append({"file": delta_name, "seq": seq + 1, "rows": int(len(delta)),
+                                     "notes": int(delta["note_id"].nunique()), "matrix": fname, "dim": dim})
+                newer_seqs = {s["seq"] for s in newer}
+                m["notes"] = {nid: seq + 1 if s in newer_seqs else seq for nid, s in m["notes"].items()}
+                m["seq"] = seq + 1
+                retired, m["segments"] = m["segments"], segments
+                m["matrix"], m["dim"], m["tombstones"] = fname, dim, {}
+                before = self.file_stat()
+                self._write_manifest(m)
+                self._merged(before, remapped=True)
+        self._remove_segments(retired)
+        return len(retired)
+
+    def adopt(self, other: "SegmentStore", keep: Iterable[str] = (), skip: Iterable[str] = (),
+              tag: Optional[str] = None) -> None:
+        super().adopt(other, keep=keep, skip=skip, tag=tag)
+        # adopted segments point at the other store's file: rewrite them into one again
+        self.merge(full=True)
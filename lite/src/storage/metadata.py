@@ -0,0 +1,91 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Union
+
+from .config import META_DIR
+from .journal import JournaledTable, journaled
+from .parquet_util import table_path
+from .sqlite_store import SqliteDB, SqliteTable
+
+
+# "parquet" (journaled parquet files) or "sqlite" (one WAL database); switch with `python -m lite.src.storage.migrate`
+METADATA_BACKEND = os.getenv("METADATA_BACKEND", "parquet").strip().lower()
+BACKENDS = ("parquet", "sqlite")
+SQLITE_PATH = os.path.join(META_DIR, "metadata.sqlite3")
+
+# key = primary key (sqlite) / upsert key; indexes serve the point lookups in notes.py and groups.py
+SCHEMAS: Dict[str, Dict] = {
+    "notes_index": {
+        "columns": ["note_id", "title", "path", "updated_at", "size", "sha256"],
+        "key": ["note_id"],
+        "indexes": [["updated_at"]],
+    },
+    "groups": {
+        "columns": ["group_id", "name", "created_at", "updated_at", "position"],
+        "key": ["group_id"],
+        "indexes": [],
+    },
+    "group_notes": {
+        "columns": ["group_id", "note_id", "position", "added_at"],
+        "key": ["group_id", "note_id"],
+        "indexes": [["note_id"]],
+    },
+    "tabs": {
+        "columns": ["session_id", "tab_id", "note_id", "stack_id", "position", "created_at"],
+        "key": ["session_id", "tab_id"],
+        "indexes": [],
+    },
+}
+
+MetadataTable = Union[JournaledTable, SqliteTable]
+
+_db: Optional[SqliteDB] = None
+_db_lock = threading.Lock()
+
+
+def sqlite_db(path: Optional[str] = None) -> SqliteDB:
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = SqliteDB(path or SQLITE_PATH, SCHEMAS)
+        return _db
+
+
+def table(name: str) -> MetadataTable:
+    """The ``name`` metadata table in the configured backend."""
+    if METADATA_BACKEND == "sqlite":
+        return sqlite_db().table(name)
+    if METADATA_BACKEND != "parquet":
+        raise ValueError(f"METADATA_BACKEND must be one of: {', '.join(BACKENDS)}")
+    return journaled(table_path(name), SCHEMAS[name]["columns"])
+
+
+@contextmanager
+def transaction():
+    """Commit the writes made inside as one unit.
+
+    With sqlite this is a real multi-table transaction. Parquet journals
+    have no cross-table atomicity, so callers should still hand each table
+    all of its ops in one ``append`` (one fsynced journal line per table).
+    """
+    if METADATA_BACKEND == "sqlite":
+        with sqlite_db().transaction():
+            yield
+    else:
+        yield
+
+
+def checkpoint_all(budget=None) -> int:
+    """Fold parquet journals and, with the sqlite backend, the WAL; ``budget`` is charged before each."""
+    from .journal import checkpoint_all as checkpoint_journals
+
+    n = checkpoint_journals(budget)
+    if METADATA_BACKEND == "sqlite":
+        if budget is not None and os.path.exists(SQLITE_PATH + "-wal"):
+            budget.spend(os.path.getsize(SQLITE_PATH + "-wal"))
+        try:
+            n += int(sqlite_db().checkpoint())
+        except Exception:
+            pass
+    return n
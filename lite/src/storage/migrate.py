@@ -0,0 +1,95 @@
+"""Copy metadata tables between the parquet and sqlite backends.
+
+    python -m lite.src.storage.migrate --to sqlite
+    python -m lite.src.storage.migrate --to parquet
+
+Stop the app first, then start it again with ``METADATA_BACKEND`` set to the
+target backend. The source tables are left in place.
+"""
+import argparse
+import os
+from typing import Dict, List
+
+import pandas as pd
+
+from .config import META_DIR, ensure_storage_dirs
+from .journal import JournaledTable
+from .metadata import METADATA_BACKEND, SCHEMAS, SQLITE_PATH, sqlite_db
+from .parquet_util import atomic_replace
+from .sqlite_store import SqliteDB
+
+
+def _parquet_path(meta_dir: str, name: str) -> str:
+    return os.path.join(meta_dir, f"{name}.parquet")
+
+
+def _rows(name: str, df: pd.DataFrame) -> List[Dict]:
+    if df.empty:
+        return []
+    if name == "groups" and "group_id" not in df.columns and "id" in df.columns:
+        # legacy groups schema
+        df = df.rename(columns={"id": "group_id"})
+    sc = SCHEMAS[name]
+    df = df.reindex(columns=sc["columns"]).dropna(subset=sc["key"])
+    df = df.drop_duplicates(subset=sc["key"], keep="last")
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+def parquet_to_sqlite(db: SqliteDB, meta_dir: str = META_DIR) -> Dict[str, int]:
+    """Replace the sqlite tables with the parquet ones (journals replayed). Returns rows per table."""
+    counts: Dict[str, int] = {}
+    with db.transaction():
+        for name, sc in SCHEMAS.items():
+            # no column hint: a legacy groups table must keep its own "id" column
+            df = JournaledTable(_parquet_path(meta_dir, name)).read()
+            rows = _rows(name, df)
+            db.table(name).append([{"op": "delete", "match": {}}, {"op": "upsert", "key": sc["key"], "rows": rows}])
+            counts[name] = len(rows)
+    return counts
+
+
+def sqlite_to_parquet(db: SqliteDB, meta_dir: str = META_DIR) -> Dict[str, int]:
+    """Rewrite the parquet tables from sqlite. Returns rows per table."""
+    counts: Dict[str, int] = {}
+    for name in SCHEMAS:
+        df = db.table(name).read()
+        path = _parquet_path(meta_dir, name)
+        atomic_replace(path, df)
+        # pending journal ops belong to the replaced table
+        for p in (path + ".journal", path + ".journal.bak"):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+        counts[name] = len(df)
+    return counts
+
+
+def auto_migrate() -> Dict[str, int]:
+    """First start on the sqlite backend: import existing parquet tables. Returns rows per table ({} if skipped)."""
+    if METADATA_BACKEND != "sqlite" or os.path.exists(SQLITE_PATH):
+        return {}
+    if not any(os.path.exists(_parquet_path(META_DIR, n)) or os.path.exists(_parquet_path(META_DIR, n) + ".journal")
+               for n in SCHEMAS):
+        return {}
+    return parquet_to_sqlite(sqlite_db())
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description="Copy metadata tables between storage backends.")
+    ap.add_argument("--to", choices=("sqlite", "parquet"), required=True)
+    ap.add_argument("--db", default=SQLITE_PATH, help="sqlite database path")
+    args = ap.parse_args(argv)
+    ensure_storage_dirs()
+    db = SqliteDB(args.db, SCHEMAS)
+    try:
+        counts = parquet_to_sqlite(db) if args.to == "sqlite" else sqlite_to_parquet(db)
+    finally:
+        db.close()
+    for name, n in counts.items():
+        print(f"{name}: {n} rows")
+    print(f"Set METADATA_BACKEND={args.to} to use the migrated tables.")
+
+
+if __name__ == "__main__":
+    main()
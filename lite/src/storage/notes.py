@@ -4,15 +4,17 @@ import uuid
 import hashlib
 from typing import Dict, List, Optional, Tuple
 
-import pandas as pd
-
+from ..caches import bump_generation
 from .config import NOTES_DIR, load_settings, _atomic_write
-from .parquet_util import atomic_replace, read_parquet_safe, table_path
+from .bm25 import bm25_index
+from .metadata import table, transaction
+from .trigram import trigram_index
 
+# keyword candidates up to this many are looked up by id; more read the whole notes index
+KEYWORD_LOOKUP_ROWS = 500
 
-NOTES_INDEX_TABLE = table_path("notes_index")
-GROUPS_TABLE = table_path("groups")
-GROUP_NOTES_TABLE = table_path("group_notes")
+def _index():
+    return table("notes_index")
 
 
 def _normalize_title(title: Optional[str], content: str) -> str:
@@ -26,6 +28,14 @@ def _normalize_title(title: Optional[str], content: str) -> str:
     return "Untitled"
 
 
+def _index_text(note_id: str, title: str, body: str, sha: str) -> None:
+    # keep the keyword indexes (substring + BM25) current with the note body
+    for ix in (trigram_index(), bm25_index()):
+        ix.update(note_id, title, body, sha)
+    # titles, dates and keyword ranks of cached results may have changed
+    bump_generation()
+
+
 def _now() -> int:
     return int(time.time() * 1000)
 
@@ -42,19 +52,27 @@ def _sha256(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
 
 
+def _frontmatter_span(raw: str) -> Optional[Tuple[int, int, int]]:
+    """(header start, header end, body start) of a leading ``---`` block, with LF or CRLF line ends."""
+    for nl in ("\n", "\r\n"):
+        if raw.startswith("---" + nl):
+            end = raw.find(nl + "---" + nl, 3 + len(nl))
+            if end != -1:
+                return 3 + len(nl), end, end + 3 + 2 * len(nl)
+    return None
+
+
 def _split_frontmatter(raw: str) -> Tuple[Dict, str]:
-    if raw.startswith("---\n"):
-        end = raw.find("\n---\n", 4)
-        if end != -1:
-            header = raw[4:end].strip()
-            body = raw[end + 5 :]
-            meta: Dict[str, str] = {}
-            for line in header.splitlines():
-                if ":" in line:
-                    k, v = line.split(":", 1)
-                    meta[k.strip()] = v.strip()
-            return meta, body
-    return {}, raw
+    span = _frontmatter_span(raw)
+    if span is None:
+        return {}, raw
+    header = raw[span[0]:span[1]].strip()
+    meta: Dict[str, str] = {}
+    for line in header.splitlines():
+        if ":" in line:
+            k, v = line.split(":", 1)
+            meta[k.strip()] = v.strip()
+    return meta, raw[span[2]:]
 
 
 def _render_frontmatter(meta: Dict[str, str]) -> str:
@@ -63,7 +81,7 @@ def _render_frontmatter(meta: Dict[str, str]) -> str:
 
 
 def list_notes() -> List[Dict]:
-    df = read_parquet_safe(NOTES_INDEX_TABLE)
+    df = _index().read()
     if df.empty:
         return []
     # Map storage columns to API shape
@@ -78,10 +96,14 @@ def list_notes() -> List[Dict]:
     return out
 
 
+def note_titles(note_ids: List[str]) -> Dict[str, str]:
+    rows = _index().rows({"note_id": list(note_ids)}) if note_ids else []
+    return {r["note_id"]: r.get("title") or "" for r in rows}
+
+
 def get_note(note_id: str) -> Dict:
-    df = read_parquet_safe(NOTES_INDEX_TABLE)
-    row = df[df["note_id"] == note_id]
-    if row.empty:
+    rows = _index().rows({"note_id": note_id}, limit=1)
+    if not rows:
         # try legacy
         path = _note_path_legacy(note_id)
         try:
@@ -92,98 +114,72 @@ def get_note(note_id: str) -> Dict:
         # synthesize
         title = _normalize_title(None, raw)
         return {"id": note_id, "title": title, "content": raw, "updated_at": _now()}
-    path = row.iloc[0]["path"]
+    row = rows[0]
     try:
-        with open(path, "r", encoding="utf-8") as f:
+        with open(row["path"], "r", encoding="utf-8") as f:
             raw = f.read()
     except FileNotFoundError:
         raw = ""
     meta, body = _split_frontmatter(raw)
-    title = row.iloc[0].get("title") or meta.get("title") or _normalize_title(None, body)
-    return {"id": note_id, "title": title, "content": body, "updated_at": int(row.iloc[0].get("updated_at") or _now())}
+    title = row.get("title") or meta.get("title") or _normalize_title(None, body)
+    return {"id": note_id, "title": title, "content": body, "updated_at": int(row.get("updated_at") or _now())}
 
 
-def create_note(title: Optional[str] = None, content: str = "") -> Dict:
-    os.makedirs(NOTES_DIR, exist_ok=True)
-    note_id = str(uuid.uuid4())
-    title = _normalize_title(title, content)
-    ts = _now()
-    meta = {"id": note_id, "title": title}
-    raw = _render_frontmatter(meta) + content
+def _write_note(note_id: str, title: str, body: str, ts: int) -> Dict:
+    """Write the note file; returns its notes_index row."""
     path = _note_path(note_id)
-    _atomic_write(path, raw)
-    size = os.path.getsize(path)
-    sha = _sha256(content)
-    # update parquet index
-    df = read_parquet_safe(NOTES_INDEX_TABLE)
-    if df.empty:
-        df = pd.DataFrame(columns=["note_id", "title", "path", "updated_at", "size", "sha256"])
-    rec = {
+    _atomic_write(path, _render_frontmatter({"id": note_id, "title": title}) + body)
+    return {
         "note_id": note_id,
         "title": title,
         "path": path,
         "updated_at": ts,
-        "size": int(size),
-        "sha256": sha,
+        "size": int(os.path.getsize(path)),
+        "sha256": _sha256(body),
     }
-    df = pd.concat([df, pd.DataFrame([rec])], ignore_index=True)
-    atomic_replace(NOTES_INDEX_TABLE, df)
-    return {"id": note_id, "title": title, "updated_at": ts}
 
 
-def update_note(note_id: str, title: Optional[str], content: Optional[str]) -> Dict:
-    df = read_parquet_safe(NOTES_INDEX_TABLE)
-    idx = df.index[df["note_id"] == note_id]
-    if len(idx) == 0:
-        # allow legacy file fallback
-        path = _note_path(note_id)
-    else:
-        path = df.loc[idx, "path"].iloc[0]
-    # read existing
-    raw = ""
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            raw = f.read()
-    except FileNotFoundError:
-        # attempt legacy .txt
+def _current(note_id: str, row: Optional[Dict]) -> Tuple[Optional[str], str, bool]:
+    """(title, body, exists) of a stored note; ``row`` is its notes_index row, if any."""
+    # missing row: allow legacy file fallback
+    path = row["path"] if row else _note_path(note_id)
+    raw, exists = "", True
+    for p in (path, _note_path_legacy(note_id)):
         try:
-            with open(_note_path_legacy(note_id), "r", encoding="utf-8") as f:
+            with open(p, "r", encoding="utf-8") as f:
                 raw = f.read()
+            break
         except FileNotFoundError:
-            raw = ""
+            continue
+    else:
+        exists = row is not None
     meta, body = _split_frontmatter(raw)
-    cur_title = meta.get("title") or (df.loc[idx, "title"].iloc[0] if len(idx) else None) or _normalize_title(None, body)
+    title = meta.get("title") or (row.get("title") if row else None) or _normalize_title(None, body)
+    return title, body, exists
+
+
+def create_note(title: Optional[str] = None, content: str = "") -> Dict:
+    os.makedirs(NOTES_DIR, exist_ok=True)
+    note_id = str(uuid.uuid4())
+    title = _normalize_title(title, content)
+    ts = _now()
+    # journal the new index row
+    rec = _write_note(note_id, title, content, ts)
+    _index().upsert([rec], key=["note_id"])
+    _index_text(note_id, title, content, rec["sha256"])
+    return {"id": note_id, "title": title, "updated_at": ts}
+
+
+def update_note(note_id: str, title: Optional[str], content: Optional[str]) -> Dict:
+    rows = _index().rows({"note_id": note_id}, limit=1)
+    cur_title, body, _ = _current(note_id, rows[0] if rows else None)
     new_title = title if title is not None else cur_title
     new_body = content if content is not None else body
-    new_meta = {"id": note_id, "title": new_title}
-    new_raw = _render_frontmatter(new_meta) + (new_body or "")
-    # write
-    _atomic_write(_note_path(note_id), new_raw)
     ts = _now()
-    size = os.path.getsize(_note_path(note_id))
-    sha = _sha256(new_body or "")
-    # update index parquet
-    dfi = read_parquet_safe(NOTES_INDEX_TABLE)
-    if dfi.empty:
-        dfi = pd.DataFrame(columns=["note_id", "title", "path", "updated_at", "size", "sha256"])
-    if len(idx) == 0:
-        # add
-        dfi = pd.concat([
-            dfi,
-            pd.DataFrame([
-                {
-                    "note_id": note_id,
-                    "title": new_title,
-                    "path": _note_path(note_id),
-                    "updated_at": ts,
-                    "size": int(size),
-                    "sha256": sha,
-                }
-            ])
-        ], ignore_index=True)
-    else:
-        dfi.loc[idx, ["title", "path", "updated_at", "size", "sha256"]] = [new_title, _note_path(note_id), ts, int(size), sha]
-    atomic_replace(NOTES_INDEX_TABLE, dfi)
+    # journal the index row (insert or replace)
+    rec = _write_note(note_id, new_title, new_body or "", ts)
+    _index().upsert([rec], key=["note_id"])
+    _index_text(note_id, new_title, new_body or "", rec["sha256"])
     return {"id": note_id, "title": new_title, "updated_at": ts}
 
 
@@ -194,21 +190,103 @@ def delete_note(note_id: str) -> bool:
             os.remove(p)
         except FileNotFoundError:
             pass
-    # remove from parquet
-    df = read_parquet_safe(NOTES_INDEX_TABLE)
-    if not df.empty:
-        df = df[df["note_id"] != note_id]
-        atomic_replace(NOTES_INDEX_TABLE, df)
-    # remove group mapping
-    gm = read_parquet_safe(GROUP_NOTES_TABLE)
-    if not gm.empty:
-        gm = gm[gm["note_id"] != note_id]
-        atomic_replace(GROUP_NOTES_TABLE, gm)
+    # remove from index and group mapping
+    _index().delete({"note_id": note_id})
+    table("group_notes").delete({"note_id": note_id})
+    for ix in (trigram_index(), bm25_index()):
+        ix.remove(note_id)
+    bump_generation()
     return True
 
 
+BATCH_OPS = ("create", "update", "delete")
+
+
+def apply_batch(items: List[Dict], atomic: bool = False) -> Dict:
+    """Apply create/update/delete ``items`` ({op, id, title, content}) in order.
+
+    Every item is checked before anything is written; with ``atomic`` one
+    bad item fails the whole batch. Note files are written first, then the
+    notes index and group mappings are committed together in one metadata
+    transaction and the keyword indexes take one journal append each.
+    Returns per-item ``results`` plus the ``written`` {id: (title, body)}
+    and ``deleted`` ids so the caller can reindex them in one pass.
+    """
+    ids = list({it.get("id") for it in items if it.get("id")})
+    rows = {r["note_id"]: r for r in _index().rows({"note_id": ids})} if ids else {}
+    # note_id -> (title, body) as of the current item; None once deleted in this batch
+    state: Dict[str, Optional[Tuple[str, str]]] = {}
+    results: List[Dict] = []
+    ts = _now()
+    for i, it in enumerate(items):
+        op, note_id = it.get("op"), it.get("id")
+        res: Dict = {"index": i, "op": op, "id": note_id, "ok": False}
+        results.append(res)
+        if op not in BATCH_OPS:
+            res["error"] = f"op must be one of: {', '.join(BATCH_OPS)}"
+            continue
+        if op == "create":
+            note_id = res["id"] = str(uuid.uuid4())
+            content = it.get("content") or ""
+            state[note_id] = (_normalize_title(it.get("title"), content), content)
+        elif not note_id:
+            res["error"] = "id is required"
+            continue
+        else:
+            if note_id in state:
+                cur = state[note_id]
+            else:
+                title, body, exists = _current(note_id, rows.get(note_id))
+                cur = (title, body) if exists else None
+            if cur is None:
+                res["error"] = f"Note not found: {note_id}"
+                continue
+            if op == "update":
+                title, content = it.get("title"), it.get("content")
+                state[note_id] = (title if title is not None else cur[0], content if content is not None else cur[1])
+            else:
+                state[note_id] = None
+        res["ok"] = True
+        if state[note_id] is not None:
+            res["title"] = state[note_id][0]
+            res["updated_at"] = ts
+
+    failed = any(not r["ok"] for r in results)
+    if atomic and failed:
+        for r in results:
+            if r["ok"]:
+                r.update({"ok": False, "error": "batch aborted"})
+        return {"results": results, "written": {}, "deleted": [], "applied": False}
+
+    written = {nid: v for nid, v in state.items() if v is not None}
+    deleted = [nid for nid, v in state.items() if v is None]
+    os.makedirs(NOTES_DIR, exist_ok=True)
+    recs = [_write_note(nid, title, body, ts) for nid, (title, body) in written.items()]
+    for nid in deleted:
+        for p in (_note_path(nid), _note_path_legacy(nid)):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+    ops: List[Dict] = []
+    if recs:
+        ops.append({"op": "upsert", "key": ["note_id"], "rows": recs})
+    if deleted:
+        ops.append({"op": "delete", "match": {"note_id": deleted}})
+    with transaction():
+        _index().append(ops)
+        if deleted:
+            table("group_notes").delete({"note_id": deleted})
+    if recs or deleted:
+        shas = {r["note_id"]: r["sha256"] for r in recs}
+        for ix in (trigram_index(), bm25_index()):
+            ix.apply([(nid, t, b, shas[nid]) for nid, (t, b) in written.items()], deleted)
+        bump_generation()
+    return {"results": results, "written": written, "deleted": deleted, "applied": True}
+
+
 def list_groups() -> List[Dict]:
-    df = read_parquet_safe(GROUPS_TABLE)
+    df = table("groups").read()
     if df.empty:
         return []
     # pass-through for compatibility if using old schema
@@ -223,32 +301,65 @@ def list_groups() -> List[Dict]:
     return []
 
 
+def _read_body(note_id: str, path: Optional[str] = None) -> str:
+    try:
+        with open(path or _note_path(note_id), "r", encoding="utf-8") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        # try legacy
+        try:
+            with open(_note_path_legacy(note_id), "r", encoding="utf-8") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            raw = ""
+    _, content = _split_frontmatter(raw)
+    return content
+
+
+def _synced(ix):
+    """``ix`` brought in line with the notes index; only reads the index when its version moved."""
+    table = _index()
+    if not ix.synced(table.version()):
+        df, version = table.read_versioned()
+        paths = dict(zip(df["note_id"], df["path"]))
+        ix.sync(version, zip(df["note_id"], df["title"], df["sha256"]), lambda nid: _read_body(nid, paths.get(nid)))
+    return ix
+
+
+def search_ranked(q: str, k: int = 10, note_ids: Optional[List[str]] = None) -> List[Dict]:
+    """BM25-ranked notes for ``q`` as [{id, title, score}], best first."""
+    if not q.strip():
+        return []
+    hits = _synced(bm25_index()).search(q, k, set(note_ids) if note_ids is not None else None)
+    if not hits:
+        return []
+    titles = {r["note_id"]: r["title"] for r in _index().rows({"note_id": [nid for nid, _ in hits]})}
+    return [{"id": nid, "title": titles.get(nid), "score": score} for nid, score in hits]
+
+
 def search_keyword(q: str, note_ids: Optional[List[str]] = None) -> List[Dict]:
-    # naive search across selected notes
+    # substring search; the trigram index narrows which note files are opened
     ql = q.lower().strip()
     if not ql:
         return []
-    df = read_parquet_safe(NOTES_INDEX_TABLE)
-    if df.empty:
-        return []
-    if note_ids:
-        df = df[df["note_id"].isin(note_ids)]
+    cands = _synced(trigram_index()).candidates(ql)
+    if cands is not None and note_ids:
+        cands &= set(note_ids)
+    if cands is not None and len(cands) <= KEYWORD_LOOKUP_ROWS:
+        if not cands:
+            return []
+        rows = _index().rows({"note_id": sorted(cands)})
+        hits = [(r["note_id"], r["title"], r["path"]) for r in rows]
+    else:
+        df = _index().read()
+        if note_ids:
+            df = df[df["note_id"].isin(note_ids)]
+        if cands is not None:
+            df = df[df["note_id"].isin(list(cands))]
+        hits = zip(df["note_id"], df["title"], df["path"])
     out: List[Dict] = []
-    for _, row in df.iterrows():
-        nid = row["note_id"]
-        title = row.get("title")
-        path = row.get("path") or _note_path(nid)
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                raw = f.read()
-        except FileNotFoundError:
-            # try legacy
-            try:
-                with open(_note_path_legacy(nid), "r", encoding="utf-8") as f:
-                    raw = f.read()
-            except FileNotFoundError:
-                raw = ""
-        _, content = _split_frontmatter(raw)
+    for nid, title, path in hits:
+        content = _read_body(nid, path)
         idx = content.lower().find(ql)
         if idx >= 0 or ql in (title or "").lower():
             start = max(0, idx - 40)
@@ -1,5 +1,7 @@
 import os
 import errno
+from typing import Optional
+
 import pandas as pd
 from .config import META_DIR
 
@@ -26,7 +28,7 @@ def _fsync_dir(p: str) -> None:
         pass
 
 
-def atomic_replace(path: str, df: pd.DataFrame) -> None:
+def atomic_replace(path: str, df: pd.DataFrame, row_group_size: Optional[int] = None) -> None:
     """Atomically replace a parquet file with backup rotation (.bak).
 
     Pattern: write .tmp -> fsync -> rotate .bak -> rename -> fsync dir.
@@ -34,7 +36,7 @@ def atomic_replace(path: str, df: pd.DataFrame) -> None:
     tmp = path + ".tmp"
     bak = path + ".bak"
     # Use pyarrow engine by default
-    df.to_parquet(tmp, engine="pyarrow", index=False)
+    df.to_parquet(tmp, engine="pyarrow", index=False, row_group_size=row_group_size)
     _fsync_file(tmp)
     # rotate backup
     if os.path.exists(path):
@@ -73,6 +75,30 @@ def table_path(name: str) -> str:
     return os.path.join(META_DIR, f"{name}.parquet")
 
 
+def _restore_journal_backup(path: str) -> None:
+    """After rolling a table back to .bak, put the journal that was folded into
+    the lost base back in front of the live journal so it is replayed again."""
+    jbak = path + ".journal.bak"
+    if not os.path.exists(jbak):
+        return
+    journal = path + ".journal"
+    with open(jbak, "rb") as f:
+        data = f.read()
+    if data and not data.endswith(b"\n"):
+        data += b"\n"
+    if os.path.exists(journal):
+        with open(journal, "rb") as f:
+            data += f.read()
+    tmp = journal + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, journal)
+    os.remove(jbak)
+    _fsync_dir(journal)
+
+
 def repair_parquet_if_needed(path: str, required_columns: list[str] | None = None) -> None:
     """If main parquet is corrupt but .bak is valid (and schema matches), restore from .bak."""
     if not os.path.exists(path):
@@ -81,6 +107,7 @@ def repair_parquet_if_needed(path: str, required_columns: list[str] | None = Non
         if os.path.exists(bak):
             try:
                 os.replace(bak, path)
+                _restore_journal_backup(path)
             except Exception:
                 pass
         return
@@ -98,5 +125,6 @@ def repair_parquet_if_needed(path: str, required_columns: list[str] | None = Non
                 if required_columns and any(c not in bdf.columns for c in required_columns):
                     return
                 os.replace(bak, path)
+                _restore_journal_backup(path)
             except Exception:
                 pass
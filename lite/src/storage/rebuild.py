@@ -0,0 +1,209 @@
+"""Rebuild every note's chunks and embeddings with the current settings.
+
+    python -m lite.src.storage.rebuild [--workers 8] [--restart]
+
+Run after changing ``CHUNK_SIZE``, ``CHUNK_OVERLAP``, ``CHUNKER`` or the
+embedding model. Notes are chunked by a process pool while their chunks are
+embedded in large batches and committed to a side embedding store under
+``embeddings.rebuild``; every committed batch is a checkpoint, so a rebuild
+that was interrupted picks up with the notes it has not done yet. Once all
+notes are done the vector backend adopts the side store: the flat and mmap
+backends in a single manifest swap, Chroma by rewriting its note chunks.
+Notes edited or deleted while the rebuild runs keep their live state.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..caches import bump_generation
+from ..ollama_client import EMBED_MODEL
+from ..vector_backends import VECTOR_BACKEND, vector_backend
+from .config import META_DIR, _atomic_write, ensure_storage_dirs, load_settings
+from .metadata import table
+from .segments import SegmentStore
+
+
+REBUILD_DIR = os.path.join(META_DIR, "embeddings.rebuild")
+# Chunks embedded and committed to the side store per checkpoint
+REBUILD_BATCH_CHUNKS = max(1, int(os.getenv("REBUILD_BATCH_CHUNKS", "2048")))
+
+
+def _params() -> Dict:
+    s = load_settings()
+    # the side store is written in the backend's segment format
+    return {"chunk_size": int(s["CHUNK_SIZE"]), "overlap": int(s["CHUNK_OVERLAP"]),
+            "chunker": s.get("CHUNKER", "fixed"), "model": EMBED_MODEL, "backend": VECTOR_BACKEND}
+
+
+def _chunk(task: Tuple[str, str, int, int, str]) -> Tuple[str, List[str]]:
+    """Pool worker: read one note and split it with the rebuild's settings."""
+    from .chunking import chunk_text
+    from .notes import _read_body
+
+    note_id, path, chunk_size, overlap, chunker = task
+    text = _read_body(note_id, path)
+    return note_id, chunk_text(text, chunk_size, overlap, chunker) if text else []
+
+
+def _read_state(root: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(root, "rebuild.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def _write_state(root: str, state: Dict) -> None:
+    _atomic_write(os.path.join(root, "rebuild.json"), json.dumps(state))
+
+
+def _commit(side: SegmentStore, batch: Dict[str, List[str]]) -> int:
+    from ..vectorstore import embed_texts
+    from .embed_cache import embed_cache
+
+    flat = [c for chunks in batch.values() for c in chunks]
+    vecs = embed_cache().embed(EMBED_MODEL, flat, embed_texts) if flat else []
+    ts = int(time.time() * 1000)
+    rows: Dict[str, List[Dict]] = {}
+    i = 0
+    for nid, chunks in batch.items():
+        rows[nid] = [{"note_id": nid, "chunk_index": j, "text": c, "embedding": list(vecs[i + j]), "updated_at": ts}
+                     for j, c in enumerate(chunks)]
+        i += len(chunks)
+    side.put_notes({nid: r for nid, r in rows.items() if r})
+    return len(flat)
+
+
+def _swap(side: SegmentStore, state: Dict, root: str) -> None:
+    """Hand the side store to the vector backend; safe to repeat after a crash."""
+    if "keep" not in state:
+        df = table("notes_index").read()
+        # notes deleted while the rebuild ran are not brought back
+        current = set(df["note_id"]) if not df.empty else set()
+        # notes edited after the rebuild started are reindexed with the new settings by the queue
+        fresh = set(df.loc[df["updated_at"].fillna(0).astype("int64") > int(state["started_at"]), "note_id"]) \
+            if not df.empty else set()
+        built = set(side.manifest()["notes"])
+        state.update({"phase": "swap", "keep": sorted(fresh), "skip": sorted(built - current)})
+        _write_state(root, state)
+    vector_backend().adopt_notes(side, keep=state["keep"], skip=state["skip"], tag=state["id"])
+    bump_generation()
+
+
+def rebuild_index(workers: Optional[int] = None, restart: bool = False, root: str = REBUILD_DIR,
+                  progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Re-chunk and re-embed every note; resumes an interrupted rebuild with the same settings."""
+    t0 = time.time()
+    ensure_storage_dirs()
+    params = _params()
+    state = _read_state(root)
+    if restart or state is None or state.get("params") != params:
+        # new settings (or nothing to resume): start over
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root, exist_ok=True)
+        state = {"id": uuid.uuid4().hex, "params": params, "started_at": int(time.time() * 1000), "phase": "embed"}
+        _write_state(root, state)
+    side = vector_backend().side_store(root)
+    df = table("notes_index").read()
+    notes = list(zip(df["note_id"], df["title"], df["path"])) if not df.empty else []
+    stats = {"notes": len(notes), "resumed": 0, "done": 0, "chunks": 0}
+
+    def report(phase: str) -> None:
+        if progress is not None:
+            progress({"phase": phase, **stats})
+
+    if state.get("phase") == "embed":
+        done = set(side.manifest()["notes"])
+        todo = [(nid, path, params["chunk_size"], params["overlap"], params["chunker"])
+                for nid, _, path in notes if nid not in done]
+        stats["resumed"] = stats["done"] = len(notes) - len(todo)
+        report("embed")
+        batch: Dict[str, List[str]] = {}
+        pending = 0
+        if todo:
+            # spawn: forking a server process that runs other threads can inherit held locks
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=ctx) as pool:
+                # chunking runs ahead in the pool while full batches are embedded here
+                for nid, chunks in pool.map(_chunk, todo, chunksize=16):
+                    batch[nid] = chunks
+                    pending += len(chunks)
+                    if pending >= REBUILD_BATCH_CHUNKS:
+                        stats["chunks"] += _commit(side, batch)
+                        stats["done"] += len(batch)
+                        batch, pending = {}, 0
+                        report("embed")
+        stats["chunks"] += _commit(side, batch)
+        stats["done"] += len(batch)
+        # one segment to link in; also waits out a background merge of the side store
+        side.merge()
+    # a crash during the swap repeats it on the next start
+    report("swap")
+    _swap(side, state, root)
+    shutil.rmtree(root, ignore_errors=True)
+    stats["seconds"] = round(time.time() - t0, 3)
+    report("done")
+    return stats
+
+
+_status: Dict = {"running": False}
+_status_lock = threading.Lock()
+
+
+def start_rebuild(workers: Optional[int] = None, restart: bool = False) -> bool:
+    """Run ``rebuild_index`` on a background thread; False if one is already running."""
+    with _status_lock:
+        if _status.get("running"):
+            return False
+        _status.clear()
+        _status.update({"running": True, "started_at": int(time.time() * 1000)})
+
+    def progress(p: Dict) -> None:
+        with _status_lock:
+            _status["progress"] = p
+
+    def run() -> None:
+        try:
+            result, error = rebuild_index(workers, restart, progress=progress), None
+        except Exception as e:
+            result, error = None, str(e)
+        with _status_lock:
+            _status.update({"running": False, "result": result, "error": error,
+                            "finished_at": int(time.time() * 1000)})
+
+    threading.Thread(target=run, name="index-rebuild", daemon=True).start()
+    return True
+
+
+def rebuild_status() -> Dict:
+    with _status_lock:
+        out = dict(_status)
+    state = _read_state(REBUILD_DIR)
+    if state is not None and not out.get("running"):
+        # checkpoint of an interrupted rebuild, resumed by the next start
+        out["interrupted"] = {"params": state.get("params"), "phase": state.get("phase"),
+                              "done": len(SegmentStore(REBUILD_DIR).manifest()["notes"])}
+    return out
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description="Re-chunk and re-embed every note with the current settings.")
+    ap.add_argument("--workers", type=int, default=None, help="chunking processes (default: CPU count)")
+    ap.add_argument("--restart", action="store_true", help="discard an interrupted rebuild instead of resuming it")
+    args = ap.parse_args(argv)
+
+    def progress(p: Dict) -> None:
+        print(f"[{p['phase']}] {p['done']}/{p['notes']} notes, {p['chunks']} chunks", flush=True)
+
+    print(rebuild_index(args.workers, args.restart, progress=progress))
+
+
+if __name__ == "__main__":
+    main()
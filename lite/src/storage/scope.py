@@ -0,0 +1,234 @@
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .metadata import MetadataTable, table
+
+
+class NoteOrdinals:
+    """Append-only note_id <-> dense integer ordinal registry.
+
+    Ordinals are never reused within a process, so arrays indexed by ordinal
+    (scope bitmaps, per-row ordinals in the embedding index) stay valid.
+    """
+
+    def __init__(self):
+        self._ord: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def get(self, note_ids: Iterable[str], create: bool = True) -> np.ndarray:
+        """Ordinals of ``note_ids``; unknown ids get a new ordinal, or -1 when ``create`` is False."""
+        out: List[int] = []
+        with self._lock:
+            for nid in note_ids:
+                o = self._ord.get(nid)
+                if o is None:
+                    if not create:
+                        out.append(-1)
+                        continue
+                    o = self._ord[nid] = len(self._ids)
+                    self._ids.append(nid)
+                out.append(o)
+        return np.asarray(out, dtype=np.int64)
+
+    def ids(self, ords: Iterable[int]) -> List[str]:
+        ids = self._ids
+        return [ids[o] for o in ords]
+
+
+_ordinals = NoteOrdinals()
+
+
+def note_ordinals() -> NoteOrdinals:
+    return _ordinals
+
+
+def _fit(b: np.ndarray, n: int) -> np.ndarray:
+    if b.size >= n:
+        return b
+    out = np.zeros(n, dtype=bool)
+    out[: b.size] = b
+    return out
+
+
+class ScopeResolver:
+    """Resolves note/group/date scope filters to a bitmap over note ordinals.
+
+    Keeps one membership bitmap per group and each note's ``updated_at``
+    (sorted lazily for date-range lookups). Journal appends to the notes
+    index and group membership tables are applied incrementally; anything
+    it cannot follow (writes by another process, unexpected ops) triggers a
+    rebuild on the next ``resolve``.
+    """
+
+    def __init__(self, notes: MetadataTable, members: MetadataTable):
+        self._tables = {"notes": notes, "members": members}
+        self._lock = threading.RLock()
+        self._pending: Deque[Tuple[str, Tuple, Tuple, Optional[List[Dict]]]] = deque()
+        self._versions: Dict[str, Optional[Tuple]] = {"notes": None, "members": None}
+        self._loaded = False
+        self._present = np.zeros(0, dtype=bool)
+        self._updated = np.zeros(0, dtype=np.int64)
+        self._groups: Dict[str, np.ndarray] = {}
+        self._sorted: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        for name, tbl in self._tables.items():
+            tbl.subscribe(lambda before, after, ops, name=name: self._pending.append((name, before, after, ops)))
+
+    # -- maintenance --------------------------------------------------------
+    def _ensure(self, n: int) -> None:
+        if self._present.size < n:
+            cap = max(n, 2 * self._present.size, 1024)
+            self._present = _fit(self._present, cap)
+            updated = np.zeros(cap, dtype=np.int64)
+            updated[: self._updated.size] = self._updated
+            self._updated = updated
+
+    def _rebuild(self) -> None:
+        self._pending.clear()
+        ords = note_ordinals()
+        notes, nv = self._tables["notes"].read_versioned()
+        members, mv = self._tables["members"].read_versioned()
+        self._present = np.zeros(0, dtype=bool)
+        self._updated = np.zeros(0, dtype=np.int64)
+        self._groups = {}
+        if not notes.empty and "note_id" in notes.columns:
+            o = ords.get(notes["note_id"])
+            self._ensure(len(ords))
+            self._present[o] = True
+            if "updated_at" in notes.columns:
+                self._updated[o] = notes["updated_at"].fillna(0).astype("int64").to_numpy()
+        if not members.empty and {"group_id", "note_id"} <= set(members.columns):
+            for gid, sub in members.dropna(subset=["note_id"]).groupby("group_id"):
+                o = ords.get(sub["note_id"])
+                b = np.zeros(len(ords), dtype=bool)
+                b[o] = True
+                self._groups[gid] = b
+        self._sorted = None
+        self._versions = {"notes": nv, "members": mv}
+        self._loaded = True
+
+    def _apply(self, name: str, ops: List[Dict]) -> bool:
+        """Apply journal ops; False if one of them cannot be followed incrementally."""
+        ords = note_ordinals()
+        for op in ops:
+            kind = op.get("op")
+            if kind == "upsert":
+                rows = op.get("rows") or []
+                o = ords.get([r.get("note_id") for r in rows])
+                if name == "notes":
+                    self._ensure(len(ords))
+                    self._present[o] = True
+                    self._updated[o] = [int(r.get("updated_at") or 0) for r in rows]
+                    self._sorted = None
+                else:
+                    for r, oi in zip(rows, o.tolist()):
+                        gid = r.get("group_id")
+                        b = self._groups[gid] = _fit(self._groups.get(gid, np.zeros(0, dtype=bool)), len(ords))
+                        b[oi] = True
+            elif kind == "delete":
+                match = op.get("match") or {}
+                keys = set(match)
+                if name == "notes" and keys == {"note_id"}:
+                    o = int(ords.get([match["note_id"]])[0])
+                    self._ensure(len(ords))
+                    self._present[o] = False
+                    self._sorted = None
+                elif name == "members" and keys == {"group_id"}:
+                    self._groups.pop(match["group_id"], None)
+                elif name == "members" and keys in ({"note_id"}, {"group_id", "note_id"}):
+                    o = int(ords.get([match["note_id"]])[0])
+                    targets = [match["group_id"]] if "group_id" in keys else list(self._groups)
+                    for gid in targets:
+                        b = self._groups.get(gid)
+                        if b is not None and o < b.size:
+                            b[o] = False
+                else:
+                    return False
+            elif kind == "update":
+                touched = set(op.get("set") or {})
+                watched = {"note_id", "updated_at"} if name == "notes" else {"note_id", "group_id"}
+                if touched & watched:
+                    return False
+        return True
+
+    def _sync(self) -> None:
+        if not self._loaded:
+            self._rebuild()
+            return
+        while self._pending:
+            name, before, after, ops = self._pending.popleft()
+            cur = self._versions[name]
+            if cur == after:
+                continue
+            if ops is None or cur != before or not self._apply(name, ops):
+                self._rebuild()
+                return
+            self._versions[name] = after
+        for name, tbl in self._tables.items():
+            if tbl.version() != self._versions[name]:
+                # changed behind our back (another process)
+                self._rebuild()
+                return
+
+    # -- queries ------------------------------------------------------------
+    def resolve(self, note_ids: Optional[List[str]] = None, group_ids: Optional[List[str]] = None,
+                date_start: Optional[int] = None, date_end: Optional[int] = None) -> Optional[np.ndarray]:
+        """Bitmap over note ordinals of the notes in scope; None when nothing restricts the scope.
+
+        Filters intersect: members of any of ``group_ids``, among ``note_ids``,
+        with ``updated_at`` within [date_start, date_end].
+        """
+        if not (note_ids or group_ids or date_start or date_end):
+            return None
+        with self._lock:
+            self._sync()
+            n = len(note_ordinals())
+            m: Optional[np.ndarray] = None
+            if group_ids:
+                m = np.zeros(n, dtype=bool)
+                for gid in group_ids:
+                    b = self._groups.get(gid)
+                    if b is not None:
+                        m[: b.size] |= b
+            if note_ids:
+                o = note_ordinals().get(note_ids, create=False)
+                nb = np.zeros(n, dtype=bool)
+                nb[o[o >= 0]] = True
+                m = nb if m is None else (m & nb)
+            if date_start or date_end:
+                times, order = self._by_time()
+                lo = int(np.searchsorted(times, int(date_start), "left")) if date_start else 0
+                hi = int(np.searchsorted(times, int(date_end), "right")) if date_end else times.size
+                db = np.zeros(n, dtype=bool)
+                db[order[lo:hi]] = True
+                m = db if m is None else (m & db)
+            return m
+
+    def _by_time(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._sorted is None:
+            live = np.flatnonzero(self._present)
+            order = live[np.argsort(self._updated[live], kind="stable")]
+            self._sorted = (self._updated[order], order)
+        return self._sorted
+
+    @staticmethod
+    def ids(bitmap: np.ndarray) -> List[str]:
+        return note_ordinals().ids(np.flatnonzero(bitmap).tolist())
+
+
+_resolver: Optional[ScopeResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def scope_resolver() -> ScopeResolver:
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = ScopeResolver(table("notes_index"), table("group_notes"))
+        return _resolver
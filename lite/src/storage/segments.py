@@ -0,0 +1,567 @@
+import collections
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from .config import META_DIR, _atomic_write
+from .journal import read_ops
+from .parquet_util import _fsync_dir, atomic_replace, table_path
+
+
+SEGMENT_COLUMNS = ["note_id", "chunk_index", "text", "embedding", "updated_at"]
+# Size-tiered merging: tier k holds segments of up to TIER_BASE_ROWS * TIER_FACTOR**k rows,
+# and TIER_WIDTH segments of one tier merge into one of the next, so a row is rewritten
+# O(log n) times and an edit never rewrites the large base segment
+TIER_BASE_ROWS = 16
+TIER_FACTOR = 4
+TIER_WIDTH = 4
+# A segment whose notes were mostly rewritten elsewhere or deleted is compacted on its own
+MAX_DEAD_FRACTION = 0.5
+# Retired files whose removal failed, retried by ``sweep``
+PENDING_REMOVALS = "pending_removal.json"
+# The manifest journal is folded into manifest.json once it grows past this
+MANIFEST_JOURNAL_BYTES = 1 << 20
+
+
+def _empty_manifest() -> Dict:
+    return {"seq": 0, "segments": [], "notes": {}, "tombstones": {}}
+
+
+def _copy(m: Dict) -> Dict:
+    return {**m, "segments": list(m["segments"]), "notes": dict(m["notes"]), "tombstones": dict(m["tombstones"])}
+
+
+def _replay(m: Dict, op: Dict) -> None:
+    """Apply one manifest journal line to ``m``; lines already in it (by ``seq``) are skipped."""
+    if int(op.get("seq") or 0) <= int(m["seq"]):
+        return
+    seg = op.get("segment")
+    if seg:
+        m["segments"].append(seg)
+        for nid in op.get("notes") or ():
+            m["notes"][nid] = seg["seq"]
+            m["tombstones"].pop(nid, None)
+    for nid, t in (op.get("dead") or {}).items():
+        m["notes"].pop(nid, None)
+        m["tombstones"][nid] = t
+    m.update(op.get("meta") or {})
+    m["seq"] = int(op["seq"])
+
+
+class SegmentStore:
+    """Append-only embeddings store: immutable segment files plus a manifest.
+
+    The manifest maps each live note to the sequence number of the segment
+    that owns its rows; rows in any other segment are dead and deleted notes
+    are recorded as tombstones. Every write creates one small parquet segment
+    holding the new rows of the notes it touches and appends what changed as
+    one fsynced line to ``manifest.json.journal``, so it costs the size of the
+    write, not of the manifest. Merges and adoptions swap in a whole new
+    ``manifest.json`` and start the journal over (the folded one is kept as
+    ``.journal.bak`` next to ``manifest.json.bak``). A background merge
+    rewrites runs of similarly sized segments into one, and a segment on its
+    own once most of its notes are dead.
+    """
+
+    def __init__(self, root: str, legacy_path: Optional[str] = None):
+        self.root = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.journal_path = self.manifest_path + ".journal"
+        self.legacy_path = legacy_path
+        self._lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+        self._merging: Optional[threading.Thread] = None
+        self._pending_lock = threading.Lock()
+        self._merge_listeners: List[Callable[[Optional[Tuple], Optional[Tuple], bool], None]] = []
+        # (manifest.json stat, journal bytes replayed, manifest) of the last read
+        self._cached: Optional[Tuple[Optional[Tuple[int, int]], int, Dict]] = None
+
+    # -- manifest -------------------------------------------------------
+    @staticmethod
+    def _stat(p: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(p)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _journal_size(self) -> int:
+        return (self._stat(self.journal_path) or (0, 0))[1]
+
+    def _load_manifest(self) -> Tuple[Dict, int]:
+        """manifest.json with its journal replayed, or ``.bak`` with the folded journal and then the live one."""
+        journal = self.journal_path
+        for p, journals in ((self.manifest_path, [journal]), (self.manifest_path + ".bak", [journal + ".bak", journal])):
+            try:
+                with open(p, "r", encoding="utf-8") as f:
+                    m = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            for k, v in _empty_manifest().items():
+                m.setdefault(k, v)
+            pos = 0
+            for jp in journals:
+                ops, pos = read_ops(jp)
+                for op in ops:
+                    _replay(m, op)
+            return m, pos
+        return _empty_manifest(), 0
+
+    def _read_manifest(self) -> Dict:
+        """A copy of the current manifest; only journal lines appended since the last read are decoded."""
+        with self._lock:
+            base, size = self._stat(self.manifest_path), self._journal_size()
+            cached = self._cached
+            if cached is None or cached[0] != base or size < cached[1]:
+                m, pos = self._load_manifest()
+                cached = self._cached = (base, pos, m)
+            elif size > cached[1]:
+                # written by another process
+                ops, pos = read_ops(self.journal_path, cached[1])
+                for op in ops:
+                    _replay(cached[2], op)
+                cached = self._cached = (base, pos, cached[2])
+            return _copy(cached[2])
+
+    def _write_manifest(self, m: Dict) -> None:
+        """Replace manifest.json with ``m`` and start the journal over."""
+        _atomic_write(self.manifest_path, json.dumps(m, ensure_ascii=False))
+        try:
+            os.replace(self.journal_path, self.journal_path + ".bak")
+        except FileNotFoundError:
+            pass
+        _fsync_dir(self.journal_path)
+        self._cached = (self._stat(self.manifest_path), 0, _copy(m))
+
+    def _log(self, m: Dict, segment: Optional[Dict] = None, notes: Iterable[str] = (),
+             dead: Iterable[str] = ()) -> None:
+        """Append one write already applied to ``m`` (a new segment owning ``notes``,
+        tombstones for ``dead``) to the manifest journal; ``m`` becomes the cached manifest."""
+        op = {"seq": int(m["seq"]), "segment": segment, "notes": list(notes),
+              "dead": {nid: m["tombstones"][nid] for nid in dead},
+              "meta": {k: v for k, v in m.items() if k not in _empty_manifest()}}
+        payload = (json.dumps(op, ensure_ascii=False) + "\n").encode("utf-8")
+        cached = self._cached
+        created = not os.path.exists(self.journal_path)
+        with open(self.journal_path, "ab") as f:
+            start = f.tell()
+            if cached is not None and start > cached[1]:
+                # torn line from a crashed writer: terminate it so ours starts clean
+                f.write(b"\n")
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+            end = f.tell()
+        if created:
+            _fsync_dir(self.journal_path)
+        # another process appending meanwhile makes the next read replay from disk
+        exact = cached is not None and cached[1] == start and cached[0] == self._stat(self.manifest_path)
+        self._cached = (cached[0], end, m) if exact else None
+
+    def fold(self) -> bool:
+        """Fold the manifest journal into manifest.json; False if there was nothing to fold."""
+        with self._lock:
+            if not self._journal_size():
+                return False
+            self._write_manifest(self._read_manifest())
+            return True
+
+    def manifest(self) -> Dict:
+        with self._lock:
+            if not os.path.exists(self.manifest_path) and not os.path.exists(self.manifest_path + ".bak"):
+                self._migrate_legacy()
+            return self._read_manifest()
+
+    def _migrate_legacy(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        m = _empty_manifest()
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            from .parquet_util import read_parquet_safe
+
+            df = read_parquet_safe(self.legacy_path)
+            if not df.empty:
+                self._commit_segment(m, df, df["note_id"].dropna().unique().tolist())
+        self._write_manifest(m)
+
+    def file_stat(self) -> Optional[Tuple[int, int, int]]:
+        """Version of the manifest: changes with every write and merge."""
+        st = self._stat(self.manifest_path)
+        return None if st is None else (*st, self._journal_size())
+
+    # -- segment files ----------------------------------------------------
+    # Suffixes of the files a segment is made of (``sweep`` only looks at these)
+    SUFFIXES: Tuple[str, ...] = (".parquet",)
+
+    def _segment_path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _files(self, seg: Dict) -> List[str]:
+        """Names of the files making up ``seg``; the first is ``seg["file"]``."""
+        return [seg["file"]]
+
+    def _write_segment(self, name: str, df: pd.DataFrame, m: Dict) -> Dict:
+        """Write rows as segment ``name`` of manifest ``m`` (which may be updated in
+        place); returns extra fields for its manifest entry."""
+        atomic_replace(self._segment_path(name), df.reindex(columns=SEGMENT_COLUMNS))
+        return {}
+
+    def _load(self, seg: Dict) -> pd.DataFrame:
+        """Every row of ``seg``, live or not."""
+        return pd.read_parquet(self._segment_path(seg["file"]), engine="pyarrow")
+
+    def _file_size(self, name: str) -> int:
+        try:
+            return os.path.getsize(self._segment_path(name))
+        except OSError:
+            return 0
+
+    def _remove_segments(self, segs: Iterable[Dict]) -> None:
+        self._unlink([f for seg in segs for f in self._files(seg)])
+
+    def _unlink(self, names: Iterable[str]) -> None:
+        """Remove retired files; the ones that cannot be removed yet (e.g. still
+        mapped on Windows) are recorded and retried by ``sweep``."""
+        failed = []
+        for name in names:
+            try:
+                os.remove(self._segment_path(name))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                failed.append(name)
+        if failed:
+            with self._pending_lock:
+                self._write_pending(sorted(set(self.pending_removals()) | set(failed)))
+
+    def pending_removals(self) -> List[str]:
+        try:
+            with open(os.path.join(self.root, PENDING_REMOVALS), "r", encoding="utf-8") as f:
+                return list(json.load(f))
+        except (OSError, ValueError):
+            return []
+
+    def _write_pending(self, names: List[str]) -> None:
+        path = os.path.join(self.root, PENDING_REMOVALS)
+        if names:
+            _atomic_write(path, json.dumps(names))
+        elif os.path.exists(path):
+            os.remove(path)
+
+    # -- writes ---------------------------------------------------------
+    def _commit_segment(self, m: Dict, df: pd.DataFrame, note_ids: Iterable[str]) -> Dict:
+        """Write rows as a new segment owning ``note_ids`` and add it to ``m``; returns its entry."""
+        seq = int(m["seq"]) + 1
+        name = f"seg-{seq:08d}-{uuid.uuid4().hex[:8]}.parquet"
+        extra = self._write_segment(name, df, m)
+        m["seq"] = seq
+        note_ids = list(note_ids)
+        seg = {"file": name, "seq": seq, "rows": int(len(df)), "notes": len(note_ids), **extra}
+        m["segments"].append(seg)
+        for nid in note_ids:
+            m["notes"][nid] = seq
+            m["tombstones"].pop(nid, None)
+        return seg
+
+    def put_notes(self, rows_by_note: Dict[str, List[Dict]]) -> Optional[Tuple]:
+        """Write the complete new chunk rows for each note as one segment.
+
+        Notes mapped to an empty list are tombstoned instead. Returns the
+        manifest stat right after this write (before any merge it triggers).
+        """
+        live = {nid: rows for nid, rows in rows_by_note.items() if rows}
+        dead = [nid for nid, rows in rows_by_note.items() if not rows]
+        with self._lock:
+            m = self.manifest()
+            dead = self._tombstone(m, dead)
+            seg = None
+            if live:
+                df = pd.DataFrame([r for rows in live.values() for r in rows])
+                seg = self._commit_segment(m, df, live.keys())
+            if seg is not None or dead:
+                self._log(m, seg, live.keys() if seg is not None else (), dead)
+            after = self.file_stat()
+        self.maybe_merge()
+        return after
+
+    def delete_notes(self, note_ids: Iterable[str]) -> Optional[Tuple]:
+        with self._lock:
+            m = self.manifest()
+            dead = self._tombstone(m, note_ids)
+            if dead:
+                self._log(m, dead=dead)
+            after = self.file_stat()
+        self.maybe_merge()
+        return after
+
+    def _tombstone(self, m: Dict, note_ids: Iterable[str]) -> List[str]:
+        """Tombstone the live ones of ``note_ids`` in ``m``; returns them."""
+        dead = []
+        for nid in note_ids:
+            if nid in m["notes"]:
+                m["seq"] = int(m["seq"]) + 1
+                m["tombstones"][nid] = m["seq"]
+                del m["notes"][nid]
+                dead.append(nid)
+        return dead
+
+    def adopt(self, other: "SegmentStore", keep: Iterable[str] = (), skip: Iterable[str] = (),
+              tag: Optional[str] = None) -> None:
+        """Replace this store's contents with ``other``'s in one manifest swap.
+
+        Notes in ``keep`` stay as they are here and notes of ``other`` in
+        ``skip`` are left out. Segment files are hard-linked (copied where
+        links fail), so ``other`` stays intact until the new manifest is
+        written; ``tag`` is recorded in it as ``adopted``.
+        """
+        keep, skip = set(keep), set(skip)
+        o = other.manifest()
+        owners: Dict[int, List[str]] = {}
+        for nid, seq in o["notes"].items():
+            owners.setdefault(seq, []).append(nid)
+        with self._merge_lock, self._lock:
+            m = self.manifest()
+            notes = {nid: seq for nid, seq in m["notes"].items() if nid in keep}
+            kept = set(notes.values())
+            new = {"seq": int(m["seq"]), "segments": [s for s in m["segments"] if s["seq"] in kept],
+                   "notes": notes, "tombstones": {}, "adopted": tag}
+            for seg in o["segments"]:
+                ids = [nid for nid in owners.get(seg["seq"], []) if nid not in notes and nid not in skip]
+                if not ids:
+                    continue
+                for f in other._files(seg):
+                    src, dest = other._segment_path(f), self._segment_path(f)
+                    if not os.path.exists(dest):
+                        try:
+                            os.link(src, dest)
+                        except OSError:
+                            shutil.copyfile(src, dest + ".tmp")
+                            os.replace(dest + ".tmp", dest)
+                new["seq"] += 1
+                new["segments"].append({**seg, "seq": new["seq"]})
+                for nid in ids:
+                    new["notes"][nid] = new["seq"]
+            self._write_manifest(new)
+            live = {s["file"] for s in new["segments"]}
+            retired = [s for s in m["segments"] if s["file"] not in live]
+        self._remove_segments(retired)
+
+    def sweep(self, min_age_s: float = 3600) -> Tuple[int, int]:
+        """Remove segment files the manifest does not reference (left by crashes),
+        and retry retired files whose removal failed before.
+
+        Returns (files, bytes) removed.
+        """
+        files = n_bytes = 0
+        now = time.time()
+        # the locks keep out a merge or adopt whose new file is not in the manifest yet
+        with self._merge_lock, self._lock:
+            with self._pending_lock:
+                pending = self.pending_removals()
+                left = []
+                for name in pending:
+                    path = self._segment_path(name)
+                    try:
+                        size = os.path.getsize(path)
+                        os.remove(path)
+                    except FileNotFoundError:
+                        continue
+                    except OSError:
+                        left.append(name)
+                        continue
+                    files += 1
+                    n_bytes += size
+                if pending:
+                    self._write_pending(left)
+            live = {f for s in self.manifest()["segments"] for f in self._files(s)}
+            try:
+                names = os.listdir(self.root)
+            except FileNotFoundError:
+                return 0, 0
+            for name in names:
+                path = self._segment_path(name)
+                if not name.endswith(self.SUFFIXES) or name in live:
+                    continue
+                try:
+                    st = os.stat(path)
+                    if now - st.st_mtime < min_age_s:
+                        continue
+                    os.remove(path)
+                except OSError:
+                    continue
+                files += 1
+                n_bytes += st.st_size
+        return files, n_bytes
+
+    # -- reads ----------------------------------------------------------
+    def _read_segment(self, seg: Dict, owners: Dict[str, int]) -> pd.DataFrame:
+        df = self._load(seg)
+        if df.empty:
+            return df
+        keep = df["note_id"].map(owners).eq(seg["seq"])
+        return df[keep.to_numpy(dtype=bool)]
+
+    def read(self) -> pd.DataFrame:
+        """All live rows as one DataFrame, read against a single manifest snapshot."""
+        for _ in range(3):
+            m = self.manifest()
+            try:
+                parts = [self._read_segment(s, m["notes"]) for s in m["segments"]]
+            except FileNotFoundError:
+                # a concurrent merge retired a segment; retry with the new manifest
+                continue
+            parts = [p for p in parts if not p.empty]
+            if not parts:
+                return pd.DataFrame(columns=SEGMENT_COLUMNS)
+            return pd.concat(parts, ignore_index=True)
+        raise RuntimeError("embeddings manifest kept changing while reading")
+
+    def read_note(self, note_id: str) -> pd.DataFrame:
+        """Live rows for one note, read from the single segment that owns them."""
+        m = self.manifest()
+        seq = m["notes"].get(note_id)
+        for seg in m["segments"]:
+            if seg["seq"] == seq:
+                df = self._load(seg)
+                return df[df["note_id"] == note_id].sort_values("chunk_index")
+        return pd.DataFrame(columns=SEGMENT_COLUMNS)
+
+    # -- merging --------------------------------------------------------
+    @staticmethod
+    def _tier(seg: Dict) -> int:
+        rows, cap, tier = int(seg.get("rows") or 0), TIER_BASE_ROWS, 0
+        while rows > cap:
+            cap *= TIER_FACTOR
+            tier += 1
+        return tier
+
+    def _merge_plan(self, m: Dict) -> List[Dict]:
+        """Segments the next merge rewrites: those without live notes (just dropped),
+        those mostly dead, and every tier holding ``TIER_WIDTH`` segments."""
+        live = collections.Counter(m["notes"].values())
+        picked: Dict[int, Dict] = {}
+        tiers: Dict[int, List[Dict]] = {}
+        for seg in m["segments"]:
+            n = live.get(seg["seq"], 0)
+            # segments from before per-segment note counts: rows bound the notes written
+            written = int(seg.get("notes") or seg.get("rows") or 0)
+            if not n or (written and 1 - n / written > MAX_DEAD_FRACTION):
+                picked[seg["seq"]] = seg
+            else:
+                tiers.setdefault(self._tier(seg), []).append(seg)
+        for segs in tiers.values():
+            if len(segs) >= TIER_WIDTH:
+                picked.update((s["seq"], s) for s in segs)
+        return sorted(picked.values(), key=lambda s: s["seq"])
+
+    def needs_merge(self, m: Optional[Dict] = None) -> bool:
+        return bool(self._merge_plan(m or self.manifest()))
+
+    def _merged_rows(self, m: Dict, segs: List[Dict], budget=None) -> pd.DataFrame:
+        """Live rows of ``segs`` for a merge."""
+        parts = []
+        for seg in segs:
+            parts.append(self._read_segment(seg, m["notes"]))
+            spend(budget, sum(self._file_size(f) for f in self._files(seg)))
+        parts = [p for p in parts if not p.empty]
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=SEGMENT_COLUMNS)
+
+    def _write_merged(self, name: str, df: pd.DataFrame, m: Dict) -> Dict:
+        return self._write_segment(name, df, m)
+
+    def on_merge(self, fn: Callable[[Optional[Tuple], Optional[Tuple], bool], None]) -> None:
+        """Call ``fn(before, after, remapped)`` with the manifest stats around every
+        merge; the live rows stay the same, but ``remapped`` ones moved them to
+        other files. Called under the write lock, so no write comes in between."""
+        self._merge_listeners.append(fn)
+
+    def _merged(self, before: Optional[Tuple], remapped: bool = False) -> None:
+        after = self.file_stat()
+        for fn in self._merge_listeners:
+            fn(before, after, remapped)
+
+    def maybe_merge(self) -> None:
+        if not self.needs_merge() and self._journal_size() < MANIFEST_JOURNAL_BYTES:
+            return
+        if self._merging is not None and self._merging.is_alive():
+            return
+        self._merging = threading.Thread(target=self._merge_quietly, name="segment-merge", daemon=True)
+        self._merging.start()
+
+    def _merge_quietly(self) -> None:
+        try:
+            # a merged run can fill the next tier
+            for _ in range(8):
+                if not self.merge():
+                    break
+            # writes that leave nothing to merge (deletes) still grow the journal
+            if self._journal_size() >= MANIFEST_JOURNAL_BYTES:
+                self.fold()
+        except Exception:
+            pass
+
+    def merge(self, full: bool = False, budget=None) -> int:
+        """Rewrite the segments picked by the tiering policy (all of them with
+        ``full``) as one; returns how many were retired. Writers are only blocked
+        for the manifest swap. ``budget`` (e.g. ``maintenance.IOBudget``) is
+        charged for every segment read and the one written."""
+        with self._merge_lock:
+            m0 = self.manifest()
+            if full:
+                segs = m0["segments"]
+                if len(segs) <= 1 and not m0["tombstones"]:
+                    return 0
+            else:
+                segs = self._merge_plan(m0)
+                if not segs:
+                    return 0
+            merged = {s["seq"] for s in segs}
+            df = self._merged_rows(m0, segs, budget)
+            name = f"merged-{uuid.uuid4().hex}.parquet"
+            # segments without live rows are only dropped
+            extra = self._write_merged(name, df, m0) if not df.empty else None
+            spend(budget, self._file_size(name))
+            with self._lock:
+                m = self._read_manifest()
+                seq = int(m["seq"]) + 1
+                m["seq"] = seq
+                # notes rewritten since the snapshot keep pointing at their newer segment
+                for nid, s in list(m["notes"].items()):
+                    if s in merged:
+                        m["notes"][nid] = seq
+                retired = [s for s in m["segments"] if s["seq"] in merged]
+                m["segments"] = [s for s in m["segments"] if s["seq"] not in merged]
+                # a tombstone matters while an older segment may still hold the note's rows
+                m["tombstones"] = {n: t for n, t in m["tombstones"].items()
+                                   if any(s["seq"] < t for s in m["segments"])}
+                if extra is not None:
+                    m["segments"].append({"file": name, "seq": seq, "rows": int(len(df)),
+                                          "notes": int(df["note_id"].nunique()), **extra})
+                before = self.file_stat()
+                self._write_manifest(m)
+                self._merged(before)
+            self._remove_segments(retired)
+            return len(retired)
+
+
+def spend(budget, n: int) -> None:
+    """Charge ``n`` bytes of disk work to ``budget`` (anything with ``spend``), if any."""
+    if budget is not None and n:
+        budget.spend(n)
+
+
+_store: Optional[SegmentStore] = None
+_store_lock = threading.Lock()
+
+
+def embedding_store() -> SegmentStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SegmentStore(os.path.join(META_DIR, "embeddings"), legacy_path=table_path("embeddings"))
+        return _store
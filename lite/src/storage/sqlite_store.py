@@ -0,0 +1,262 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def _py(v):
+    # sqlite3 only binds builtin scalars
+    if isinstance(v, np.generic):
+        v = v.item()
+    if v is None or v is pd.NA or v is pd.NaT or (isinstance(v, float) and v != v):
+        return None
+    return v
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SqliteDB:
+    """One SQLite database in WAL mode holding several metadata tables.
+
+    A single connection is shared by every thread behind ``lock``; WAL keeps
+    readers in other processes from blocking on our writes. ``schemas`` maps
+    table name -> {"columns", "key", "indexes"}; ``key`` becomes the primary
+    key and every entry of ``indexes`` a secondary index.
+    """
+
+    def __init__(self, path: str, schemas: Dict[str, Dict]):
+        self.path = path
+        self.schemas = schemas
+        self.lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._tables: Dict[str, "SqliteTable"] = {}
+        self._depth = 0
+        self._deferred: List[Tuple["SqliteTable", Tuple, List[Dict]]] = []
+
+    def conn(self) -> sqlite3.Connection:
+        with self.lock:
+            if self._conn is None:
+                c = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+                c.execute("PRAGMA journal_mode=WAL")
+                # fsync on every commit, like the parquet journals
+                c.execute("PRAGMA synchronous=FULL")
+                for name, sc in self.schemas.items():
+                    cols = ", ".join(_q(col) for col in sc["columns"])
+                    key = ", ".join(_q(k) for k in sc["key"])
+                    c.execute(f"CREATE TABLE IF NOT EXISTS {_q(name)} ({cols}, PRIMARY KEY ({key}))")
+                    for ix in sc.get("indexes") or []:
+                        c.execute(
+                            f"CREATE INDEX IF NOT EXISTS {_q(name + '_' + '_'.join(ix))} "
+                            f"ON {_q(name)} ({', '.join(_q(col) for col in ix)})"
+                        )
+                self._conn = c
+            return self._conn
+
+    def table(self, name: str) -> "SqliteTable":
+        with self.lock:
+            t = self._tables.get(name)
+            if t is None:
+                t = self._tables[name] = SqliteTable(self, name, self.schemas[name])
+            return t
+
+    def data_version(self) -> int:
+        """Changes when another connection (process) commits."""
+        with self.lock:
+            return int(self.conn().execute("PRAGMA data_version").fetchone()[0])
+
+    @contextmanager
+    def transaction(self):
+        """Group writes to any tables of this database into one atomic commit.
+
+        Nests; subscribers are told about the writes once the outermost
+        transaction commits.
+        """
+        with self.lock:
+            c = self.conn()
+            if self._depth == 0:
+                c.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    c.execute("ROLLBACK")
+                    self._deferred = []
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                c.execute("COMMIT")
+                deferred, self._deferred = self._deferred, []
+                for t, before, ops in deferred:
+                    t._notify(before, ops)
+
+    def checkpoint(self) -> bool:
+        """Copy WAL frames back into the database file. False if the WAL was empty."""
+        with self.lock:
+            busy, frames, _ = self.conn().execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            return not busy and frames > 0
+
+    def vacuum(self, min_free: float = 0.25, budget=None) -> int:
+        """Rewrite the file if at least ``min_free`` of its pages are free, then truncate the WAL.
+
+        ``budget`` (e.g. ``maintenance.IOBudget``) is charged for the rewrite
+        before it starts, without holding the lock. Returns the bytes given
+        back to the filesystem.
+        """
+        def size() -> int:
+            return sum(os.path.getsize(p) for p in (self.path, self.path + "-wal") if os.path.exists(p))
+
+        def fragmented(c: sqlite3.Connection) -> bool:
+            pages = int(c.execute("PRAGMA page_count").fetchone()[0])
+            free = int(c.execute("PRAGMA freelist_count").fetchone()[0])
+            return bool(pages) and free / pages >= min_free
+
+        if budget is not None:
+            with self.lock:
+                rewrite = fragmented(self.conn())
+            if rewrite:
+                budget.spend(2 * size())
+        with self.lock:
+            c = self.conn()
+            before = size()
+            if fragmented(c):
+                c.execute("VACUUM")
+            c.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return max(0, before - size())
+
+    def close(self) -> None:
+        with self.lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class SqliteTable:
+    """A metadata table in a ``SqliteDB`` with the ``JournaledTable`` interface.
+
+    Writes take the same op dicts as the parquet journal (upsert / update /
+    delete) and apply them with indexed row-level statements; ``rows`` is a
+    point lookup through the primary key or a secondary index.
+    """
+
+    def __init__(self, db: SqliteDB, name: str, schema: Dict):
+        self.db = db
+        self.name = name
+        self.columns: List[str] = list(schema["columns"])
+        self.key: List[str] = list(schema["key"])
+        self._writes = 0
+        self._listeners: List[Callable[[Tuple, Tuple, Optional[List[Dict]]], None]] = []
+
+    def subscribe(self, fn: Callable[[Tuple, Tuple, Optional[List[Dict]]], None]) -> None:
+        with self.db.lock:
+            self._listeners.append(fn)
+
+    def _notify(self, before: Tuple, ops: Optional[List[Dict]]) -> None:
+        after = (self._writes, self.db.data_version())
+        for fn in list(self._listeners):
+            try:
+                fn(before, after, ops)
+            except Exception:
+                pass
+
+    def version(self) -> Tuple:
+        with self.db.lock:
+            return (self._writes, self.db.data_version())
+
+    def _where(self, match: Dict) -> Optional[Tuple[str, List]]:
+        """SQL condition for ``match``; None if it names a column the table lacks (matches nothing)."""
+        parts: List[str] = []
+        params: List = []
+        for k, v in match.items():
+            if k not in self.columns:
+                return None
+            if isinstance(v, (list, tuple, set)):
+                v = [_py(x) for x in v]
+                if not v:
+                    return None
+                parts.append(f"{_q(k)} IN ({', '.join('?' * len(v))})")
+                params.extend(v)
+            else:
+                parts.append(f"{_q(k)} = ?")
+                params.append(_py(v))
+        return (" AND ".join(parts) or "1", params)
+
+    def _select(self, where: Tuple[str, List], limit: Optional[int] = None) -> List[Tuple]:
+        sql = f"SELECT {', '.join(_q(c) for c in self.columns)} FROM {_q(self.name)} WHERE {where[0]} ORDER BY rowid"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self.db.lock:
+            return self.db.conn().execute(sql, where[1]).fetchall()
+
+    def read(self) -> pd.DataFrame:
+        return pd.DataFrame.from_records(self._select(("1", [])), columns=self.columns)
+
+    def read_versioned(self) -> Tuple[pd.DataFrame, Tuple]:
+        with self.db.lock:
+            return self.read(), self.version()
+
+    def rows(self, match: Dict, limit: Optional[int] = None) -> List[Dict]:
+        where = self._where(match)
+        if where is None:
+            return []
+        return [dict(zip(self.columns, r)) for r in self._select(where, limit)]
+
+    def _apply(self, c: sqlite3.Connection, op: Dict) -> None:
+        kind = op.get("op")
+        t = _q(self.name)
+        if kind == "upsert":
+            rows = op.get("rows") or []
+            if not rows:
+                return
+            key = [k for k in (op.get("key") or []) if k in self.columns]
+            if key:
+                # replace whole rows, like the parquet journal; also covers keys other than the primary key
+                cond = " AND ".join(f"{_q(k)} = ?" for k in key)
+                c.executemany(f"DELETE FROM {t} WHERE {cond}", [[_py(r.get(k)) for k in key] for r in rows])
+            cols = ", ".join(_q(col) for col in self.columns)
+            c.executemany(
+                f"INSERT OR REPLACE INTO {t} ({cols}) VALUES ({', '.join('?' * len(self.columns))})",
+                [[_py(r.get(col)) for col in self.columns] for r in rows],
+            )
+        elif kind == "update":
+            values = {k: v for k, v in (op.get("set") or {}).items() if k in self.columns}
+            where = self._where(op.get("match") or {})
+            if values and where is not None:
+                sets = ", ".join(f"{_q(k)} = ?" for k in values)
+                c.execute(f"UPDATE {t} SET {sets} WHERE {where[0]}", [_py(v) for v in values.values()] + where[1])
+        elif kind == "delete":
+            where = self._where(op.get("match") or {})
+            if where is not None:
+                c.execute(f"DELETE FROM {t} WHERE {where[0]}", where[1])
+
+    def append(self, ops: Iterable[Dict]) -> None:
+        ops = list(ops)
+        if not ops:
+            return
+        db = self.db
+        with db.transaction():
+            before = self.version()
+            c = db.conn()
+            for op in ops:
+                self._apply(c, op)
+            self._writes += 1
+            db._deferred.append((self, before, ops))
+
+    def upsert(self, rows: List[Dict], key: List[str]) -> None:
+        self.append([{"op": "upsert", "key": key, "rows": rows}])
+
+    def update(self, match: Dict, values: Dict) -> None:
+        self.append([{"op": "update", "match": match, "set": values}])
+
+    def delete(self, match: Dict) -> None:
+        self.append([{"op": "delete", "match": match}])
+
+    def checkpoint(self) -> bool:
+        return self.db.checkpoint()
@@ -1,13 +1,8 @@
 import time
 import uuid
-from typing import Dict, List, Optional
+from typing import Dict, List
 
-import pandas as pd
-
-from .parquet_util import atomic_replace, read_parquet_safe, table_path
-
-
-TABS_TABLE = table_path("tabs")
+from .metadata import table
 
 
 def _now() -> int:
@@ -19,11 +14,6 @@ def save_session(session_id: str, tabs: List[Dict]) -> Dict:
 
     Each tab dict may include: { tab_id?, note_id, stack_id?, position? }.
     """
-    df = read_parquet_safe(TABS_TABLE)
-    if df.empty:
-        df = pd.DataFrame(columns=["session_id", "tab_id", "note_id", "stack_id", "position", "created_at"])
-    # Drop previous rows for this session
-    df = df[df["session_id"] != session_id]
     rows = []
     pos = 0
     for t in tabs:
@@ -36,20 +26,16 @@ def save_session(session_id: str, tabs: List[Dict]) -> Dict:
             "created_at": _now(),
         })
         pos += 1
+    # previous rows for this session go in the same write
+    ops = [{"op": "delete", "match": {"session_id": session_id}}]
     if rows:
-        df = pd.concat([df, pd.DataFrame(rows)], ignore_index=True)
-    atomic_replace(TABS_TABLE, df)
+        ops.append({"op": "upsert", "key": ["session_id", "tab_id"], "rows": rows})
+    table("tabs").append(ops)
     return {"ok": True, "count": len(rows)}
 
 
 def load_session(session_id: str) -> Dict:
-    df = read_parquet_safe(TABS_TABLE)
-    if df.empty:
-        return {"tabs": []}
-    cur = df[df["session_id"] == session_id]
-    if cur.empty:
-        return {"tabs": []}
-    cur = cur.sort_values("position")
-    tabs = cur.to_dict(orient="records")
+    tabs = table("tabs").rows({"session_id": session_id})
+    tabs.sort(key=lambda t: t.get("position") if t.get("position") is not None else 0)
     return {"tabs": tabs}
 
@@ -0,0 +1,182 @@
+import abc
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .parquet_util import _fsync_dir
+
+
+def pack_strings(strings: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """UTF-8 bytes of ``strings`` back to back, plus the start offset of each and the end."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    data, o = blob.tobytes(), offsets.tolist()
+    return [data[o[i]:o[i + 1]].decode("utf-8") for i in range(len(o) - 1)]
+
+
+def _write_snapshot(path: str, arrays: Dict[str, np.ndarray]) -> None:
+    tmp = path + ".tmp.npz"
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+
+class NoteTextIndex(abc.ABC):
+    """Base for in-memory note text indexes persisted as array snapshots.
+
+    Subclasses turn a note into fields (``_encode``), maintain their in-memory
+    structures from them (``_add_row`` / ``_remove_row``) and convert those
+    structures to and from flat arrays (``_dump`` / ``_restore``). Writes only
+    touch memory; ``save`` (run by the scheduled checkpoint and maintenance)
+    writes an ``.npz`` snapshot carrying each note's title and sha256, so after
+    a restart ``sync`` re-reads just the notes that changed since it was taken.
+    """
+
+    def __init__(self, path: str, legacy: Iterable[str] = ()):
+        self.path = path
+        self._legacy = list(legacy)
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._synced = None
+
+    # -- subclass hooks -------------------------------------------------
+    @abc.abstractmethod
+    def _encode(self, title: str, body: str) -> Dict:
+        """Fields the index keeps for a note."""
+
+    @abc.abstractmethod
+    def _add_row(self, note_id: str, row: Dict) -> None:
+        """Index ``row`` (from ``_encode``) under ``note_id``, replacing what it had."""
+
+    @abc.abstractmethod
+    def _remove_row(self, note_id: str) -> None:
+        """Drop ``note_id`` from the in-memory structures."""
+
+    @abc.abstractmethod
+    def _dump(self, order: Dict[str, int]) -> Dict[str, np.ndarray]:
+        """Arrays describing the index, with notes referred to by their position in ``order``."""
+
+    @abc.abstractmethod
+    def _restore(self, data: Dict[str, np.ndarray], note_ids: List[str]) -> None:
+        """Rebuild the in-memory structures from ``_dump`` arrays; positions index ``note_ids``."""
+
+    # -- shared plumbing ------------------------------------------------
+    def _put(self, note_id: str, title: str, sha: str, fields: Dict) -> None:
+        self._add_row(note_id, fields)
+        # re-inserted so ``_meta`` stays in write order, which snapshot positions follow
+        self._meta.pop(note_id, None)
+        self._meta[note_id] = (title, sha)
+        self._dirty = True
+
+    def _drop(self, note_id: str) -> None:
+        if self._meta.pop(note_id, None) is not None:
+            self._remove_row(note_id)
+            self._dirty = True
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        data = None
+        if os.path.exists(self.path):
+            try:
+                with np.load(self.path) as f:
+                    data = {k: f[k] for k in f.files}
+            except Exception:
+                data = None  # unreadable snapshot: sync re-reads every note
+        if data is not None:
+            ids = data["note_ids"].tolist()
+            titles = unpack_strings(data["titles"], data["title_offsets"])
+            self._meta = dict(zip(ids, zip(titles, data["shas"].tolist())))
+            self._restore(data, ids)
+        self._loaded = True
+
+    def synced(self, version) -> bool:
+        """Whether ``sync`` already ran for notes index ``version``."""
+        return version is not None and version == self._synced
+
+    def sync(self, version, notes: Iterable[Tuple[str, str, str]], read_body: Callable[[str], str]) -> None:
+        """Bring the index in line with ``notes`` (note_id, title, sha256) rows.
+
+        Only runs when the notes index ``version`` changed since the last sync;
+        notes written by another process, after the last snapshot or before
+        the index existed are re-read from disk.
+        """
+        with self._lock:
+            self._load()
+            if self.synced(version):
+                return
+            seen: Set[str] = set()
+            for nid, title, sha in notes:
+                title = title if isinstance(title, str) else ""
+                sha = sha if isinstance(sha, str) else ""
+                seen.add(nid)
+                if self._meta.get(nid) != (title, sha):
+                    self._put(nid, title, sha, self._encode(title, read_body(nid)))
+            for nid in [n for n in self._meta if n not in seen]:
+                self._drop(nid)
+            self._synced = version
+
+    def update(self, note_id: str, title: Optional[str], body: str, sha: Optional[str]) -> None:
+        with self._lock:
+            self._load()
+            self._put(note_id, title or "", sha or "", self._encode(title or "", body or ""))
+
+    def remove(self, note_id: str) -> None:
+        with self._lock:
+            self._load()
+            self._drop(note_id)
+
+    def apply(self, updates: Iterable[Tuple[str, str, str, str]], removed: Iterable[str] = ()) -> None:
+        """``update`` for each (note_id, title, body, sha256) and ``remove`` for each id."""
+        with self._lock:
+            self._load()
+            for nid, title, body, sha in updates:
+                self._put(nid, title or "", sha or "", self._encode(title or "", body or ""))
+            for nid in removed:
+                self._drop(nid)
+
+    def save(self, budget=None) -> bool:
+        """Snapshot the index if it changed since the last snapshot; False if it did not.
+
+        ``budget`` (e.g. ``maintenance.IOBudget``) is charged the size of the
+        previous snapshot before writing.
+        """
+        with self._save_lock:
+            if budget is not None and self._dirty and os.path.exists(self.path):
+                budget.spend(os.path.getsize(self.path))
+            with self._lock:
+                if not self._dirty:
+                    return False
+                ids = list(self._meta)
+                arrays = self._dump({nid: i for i, nid in enumerate(ids)})
+                arrays["note_ids"] = np.asarray(ids, dtype=str)
+                arrays["titles"], arrays["title_offsets"] = pack_strings(self._meta[n][0] for n in ids)
+                arrays["shas"] = np.asarray([self._meta[n][1] for n in ids], dtype=str)
+                self._dirty = False
+            try:
+                _write_snapshot(self.path, arrays)
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                raise
+            # the journaled per-note tables this snapshot replaces
+            for p in self._legacy:
+                for f in (p, p + ".bak", p + ".journal", p + ".journal.bak"):
+                    try:
+                        os.remove(f)
+                    except FileNotFoundError:
+                        pass
+            return True
@@ -0,0 +1,137 @@
+import os
+import threading
+from array import array
+from typing import Dict, List, Optional, Set, Union
+
+import numpy as np
+
+from .config import META_DIR
+from .parquet_util import table_path
+from .text_index import NoteTextIndex, pack_strings, unpack_strings
+
+
+TRIGRAMS_PATH = os.path.join(META_DIR, "trigrams.npz")
+
+
+def trigrams(text: str) -> Set[str]:
+    t = (text or "").lower()
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+
+def note_trigrams(title: Optional[str], body: str) -> Set[str]:
+    # title and body are indexed separately so no gram spans the two
+    return trigrams(title or "") | trigrams(body)
+
+
+class TrigramIndex(NoteTextIndex):
+    """Persistent trigram -> note postings used to pick keyword search candidates.
+
+    Each (re)indexed note gets a fresh ordinal; postings are append-only sorted
+    ``array('I')`` lists, so replacing a note only appends. Ordinals of old
+    versions are dropped from ``_live`` and swept out by ``_compact``. The
+    snapshot holds every posting in one uint32 array; after loading, postings
+    are read-only slices of it until a note appends to them.
+    """
+
+    def __init__(self, path: str = TRIGRAMS_PATH):
+        super().__init__(path, legacy=[table_path("trigrams")])
+        self._postings: Dict[str, Union[array, np.ndarray]] = {}
+        self._live: Dict[int, str] = {}
+        self._ord: Dict[str, int] = {}
+        self._next = 0
+        self._dead = 0
+
+    def _encode(self, title: str, body: str) -> Dict:
+        return {"grams": sorted(note_trigrams(title, body))}
+
+    def _add_row(self, note_id: str, row: Dict) -> None:
+        self._remove_row(note_id)
+        o = self._next
+        self._next += 1
+        self._ord[note_id] = o
+        self._live[o] = note_id
+        grams = row.get("grams")
+        for g in (grams if grams is not None else ()):
+            arr = self._postings.get(g)
+            if arr is None:
+                arr = self._postings[g] = array("I")
+            elif not isinstance(arr, array):
+                arr = self._postings[g] = array("I", arr.tobytes())
+            arr.append(o)
+        if self._dead > max(1000, len(self._live)):
+            self._compact()
+
+    def _remove_row(self, note_id: str) -> None:
+        old = self._ord.pop(note_id, None)
+        if old is not None:
+            self._live.pop(old, None)
+            self._dead += 1
+
+    def _compact(self) -> None:
+        for g, arr in list(self._postings.items()):
+            kept = array("I", (o for o in arr if o in self._live))
+            if kept:
+                self._postings[g] = kept
+            else:
+                del self._postings[g]
+        self._dead = 0
+
+    def _dump(self, order: Dict[str, int]) -> Dict[str, np.ndarray]:
+        pos = np.full(self._next, -1, dtype=np.int64)
+        for o, nid in self._live.items():
+            pos[o] = order[nid]
+        grams = list(self._postings)
+        lists = [np.frombuffer(self._postings[g], dtype=np.uint32) for g in grams]
+        flat = pos[np.concatenate(lists)] if lists else np.zeros(0, dtype=np.int64)
+        which = np.repeat(np.arange(len(grams)), [len(a) for a in lists])
+        keep = flat >= 0
+        flat, which = flat[keep], which[keep]
+        offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(which, minlength=len(grams)), out=offsets[1:])
+        packed, gram_offsets = pack_strings(grams)
+        return {"grams": packed, "gram_offsets": gram_offsets,
+                "postings": flat.astype(np.uint32), "posting_offsets": offsets}
+
+    def _restore(self, data: Dict[str, np.ndarray], note_ids: List[str]) -> None:
+        flat, offsets = data["postings"], data["posting_offsets"].tolist()
+        grams = unpack_strings(data["grams"], data["gram_offsets"])
+        self._postings = {g: flat[offsets[i]:offsets[i + 1]] for i, g in enumerate(grams)
+                          if offsets[i + 1] > offsets[i]}
+        self._ord = {nid: i for i, nid in enumerate(note_ids)}
+        self._live = dict(enumerate(note_ids))
+        self._next = len(note_ids)
+        self._dead = 0
+
+    def candidates(self, q: str) -> Optional[Set[str]]:
+        """Note ids containing every trigram of ``q``; None if ``q`` is too short to filter."""
+        grams = trigrams(q)
+        if not grams:
+            return None
+        with self._lock:
+            self._load()
+            lists = []
+            for g in grams:
+                arr = self._postings.get(g)
+                if arr is None:
+                    return set()
+                lists.append(arr)
+            lists.sort(key=len)
+            cand = np.frombuffer(lists[0], dtype=np.uint32)
+            for arr in lists[1:]:
+                if not cand.size:
+                    break
+                cand = np.intersect1d(cand, np.frombuffer(arr, dtype=np.uint32), assume_unique=True)
+            live = self._live
+            return {live[o] for o in cand.tolist() if o in live}
+
+
+_index: Optional[TrigramIndex] = None
+_index_lock = threading.Lock()
+
+
+def trigram_index() -> TrigramIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = TrigramIndex()
+        return _index
@@ -0,0 +1,216 @@
+"""Bulk import of a directory of markdown files as notes.
+
+    python -m lite.src.storage.vault_import /path/to/vault [--workers 8] [--no-index]
+
+Files are read, hashed and written as notes by a process pool, the notes
+index is committed once, and the new text is embedded in large batches.
+Note ids derive from the source path, so importing the same vault again
+updates its notes and skips the unchanged ones.
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..caches import bump_generation
+from .config import NOTES_DIR, VAULT_DIR, _atomic_write, ensure_storage_dirs, load_settings
+from .metadata import table
+
+
+VAULT_EXTENSIONS = (".md", ".markdown", ".txt")
+# Notes per reindex batch: their chunks share embedding requests and one embedding-store segment
+IMPORT_BATCH_NOTES = 256
+
+
+def _vault_id(path: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, "vault:" + os.path.abspath(path)))
+
+
+def vault_path(path: str, root: Optional[str] = None) -> Optional[str]:
+    """``path`` (absolute, or relative to ``root``, default ``VAULT_DIR``) with
+    symlinks resolved, or None unless it lies inside ``root``."""
+    root = root if root is not None else VAULT_DIR
+    if not root:
+        return None
+    root = os.path.realpath(root)
+    real = os.path.realpath(os.path.join(root, path))
+    return real if os.path.commonpath([root, real]) == root else None
+
+
+def scan_vault(root: str) -> List[str]:
+    out: List[str] = []
+    for d, dirs, files in os.walk(root):
+        # skip hidden folders (.obsidian, .git, .trash)
+        dirs[:] = sorted(x for x in dirs if not x.startswith("."))
+        out.extend(os.path.join(d, f) for f in sorted(files)
+                   if f.lower().endswith(VAULT_EXTENSIONS) and not f.startswith("."))
+    return out
+
+
+def _frontmatter(raw: str) -> Tuple[Dict[str, str], str]:
+    """(meta, body). Only flat ``key: value`` headers are split off; anything
+    richer (lists, nested YAML) stays in the body so nothing is lost."""
+    from .notes import _frontmatter_span, _split_frontmatter
+
+    meta, body = _split_frontmatter(raw)
+    if meta:
+        start, end, _ = _frontmatter_span(raw)
+        for line in raw[start:end].strip().splitlines():
+            k, sep, v = line.partition(":")
+            if not sep or not k.strip() or line[:1].isspace() or not v.strip():
+                return {}, raw
+    return meta, body
+
+
+def _prepare(task: Tuple[str, str, str, Optional[str], Optional[str]]) -> Dict:
+    """Pool worker: parse one vault file and write it as a note unless unchanged."""
+    from .notes import _render_frontmatter
+
+    src, note_id, dest, old_sha, old_title = task
+    with open(src, "r", encoding="utf-8", errors="ignore") as f:
+        raw = f.read()
+    meta, body = _frontmatter(raw)
+    title = (meta.pop("title", "") or "").strip() or os.path.splitext(os.path.basename(src))[0]
+    meta.pop("id", None)
+    sha = hashlib.sha256(body.encode("utf-8")).hexdigest()
+    rec = {"note_id": note_id, "title": title, "path": dest, "sha256": sha,
+           "updated_at": int(os.path.getmtime(src) * 1000)}
+    if sha == old_sha and title == old_title and os.path.exists(dest):
+        return {**rec, "unchanged": True}
+    _atomic_write(dest, _render_frontmatter({"id": note_id, "title": title, **meta}) + body)
+    return {**rec, "size": int(os.path.getsize(dest)), "unchanged": False}
+
+
+def import_vault(root: str, workers: Optional[int] = None, reindex: bool = True,
+                 progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Import every markdown file under ``root``; returns counts and timings."""
+    from .notes import _read_body, _synced
+    from .bm25 import bm25_index
+    from .trigram import trigram_index
+
+    t0 = time.time()
+    ensure_storage_dirs()
+    files = scan_vault(root)
+    notes_table = table("notes_index")
+    have: Dict[str, Tuple[str, str]] = {}
+    df = notes_table.read()
+    if not df.empty:
+        have = {nid: (sha, title) for nid, sha, title in zip(df["note_id"], df["sha256"], df["title"])}
+    tasks = []
+    for src in files:
+        nid = _vault_id(src)
+        old_sha, old_title = have.get(nid, (None, None))
+        tasks.append((src, nid, os.path.join(NOTES_DIR, f"{nid}.md"), old_sha, old_title))
+    stats = {"files": len(files), "imported": 0, "unchanged": 0, "failed": 0, "chunks": 0, "errors": []}
+
+    def report(phase: str, **kw) -> None:
+        if progress is not None:
+            progress({"phase": phase, **stats, **kw})
+
+    recs: List[Dict] = []
+    # spawn: forking a server process that runs other threads can inherit held locks
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=ctx) as pool:
+        futures = [pool.submit(_prepare, t) for t in tasks]
+        for i, (task, fut) in enumerate(zip(tasks, futures), start=1):
+            try:
+                rec = fut.result()
+            except Exception as e:
+                stats["failed"] += 1
+                if len(stats["errors"]) < 20:
+                    stats["errors"].append(f"{task[0]}: {e}")
+                continue
+            if rec.pop("unchanged"):
+                stats["unchanged"] += 1
+            else:
+                recs.append(rec)
+                stats["imported"] += 1
+            if i % 500 == 0:
+                report("files", done=i)
+    t_files = time.time()
+
+    if recs:
+        # one journal append (or sqlite transaction) for the whole vault, folded right away
+        notes_table.upsert(recs, key=["note_id"])
+        notes_table.checkpoint()
+        bump_generation()
+        for ix in (trigram_index(), bm25_index()):
+            _synced(ix).save()
+    report("index")
+    t_index = time.time()
+
+    if reindex and recs:
+        from .indexing import reindex_notes
+
+        s = load_settings()
+        for lo in range(0, len(recs), IMPORT_BATCH_NOTES):
+            batch = recs[lo:lo + IMPORT_BATCH_NOTES]
+            items = [(r["note_id"], r["title"], _read_body(r["note_id"], r["path"])) for r in batch]
+            stats["chunks"] += reindex_notes(items, s["CHUNK_SIZE"], s["CHUNK_OVERLAP"], s.get("CHUNKER", "fixed"))
+            report("embed", done=lo + len(batch))
+    t_end = time.time()
+    stats["seconds"] = {"files": round(t_files - t0, 3), "index": round(t_index - t_files, 3),
+                        "embed": round(t_end - t_index, 3), "total": round(t_end - t0, 3)}
+    return stats
+
+
+_status: Dict = {"running": False}
+_status_lock = threading.Lock()
+
+
+def start_import(root: str, workers: Optional[int] = None, reindex: bool = True) -> bool:
+    """Run ``import_vault`` on a background thread; False if an import is already running."""
+    with _status_lock:
+        if _status.get("running"):
+            return False
+        _status.clear()
+        _status.update({"running": True, "root": root, "started_at": int(time.time() * 1000)})
+
+    def progress(p: Dict) -> None:
+        with _status_lock:
+            _status["progress"] = {k: v for k, v in p.items() if k != "errors"}
+
+    def run() -> None:
+        try:
+            result, error = import_vault(root, workers, reindex, progress), None
+        except Exception as e:
+            result, error = None, str(e)
+        with _status_lock:
+            _status.update({"running": False, "result": result, "error": error,
+                            "finished_at": int(time.time() * 1000)})
+
+    threading.Thread(target=run, name="vault-import", daemon=True).start()
+    return True
+
+
+def import_status() -> Dict:
+    with _status_lock:
+        return dict(_status)
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description="Import a directory of markdown files as notes.")
+    ap.add_argument("root")
+    ap.add_argument("--workers", type=int, default=None, help="parser/writer processes (default: CPU count)")
+    ap.add_argument("--no-index", action="store_true", help="skip embedding; notes are indexed on next edit")
+    args = ap.parse_args(argv)
+    if not os.path.isdir(args.root):
+        ap.error(f"not a directory: {args.root}")
+
+    def progress(p: Dict) -> None:
+        print(f"[{p['phase']}] {p.get('done', '')} files={p['files']} imported={p['imported']} "
+              f"unchanged={p['unchanged']} failed={p['failed']} chunks={p['chunks']}", flush=True)
+
+    stats = import_vault(args.root, args.workers, not args.no_index, progress)
+    for err in stats["errors"]:
+        print("error:", err)
+    print({k: v for k, v in stats.items() if k != "errors"})
+
+
+if __name__ == "__main__":
+    main()
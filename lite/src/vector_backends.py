@@ -0,0 +1,834 @@
+"""Vector store backends shared by /chat, /search and the indexing code.
+
+``VECTOR_BACKEND`` picks the one place chunk embeddings are written to and
+searched:
+
+- ``flat``: segment store under ``meta/embeddings`` (parquet), copied into
+  the process as one row-normalized NumPy matrix and scored exactly, or
+  through the IVF lists with ``RETRIEVAL_MODE=ann``
+- ``mmap`` (default): the same in-process search over ``meta/embeddings.mmap``,
+  which keeps unit vectors in one raw float32 matrix file plus parquet
+  id/offset sidecars; the file is opened with ``np.memmap`` and scored in
+  place, so startup reads no vectors and processes share the page cache
+- ``chroma``: the Chroma collection under ``CHROMA_DIR``
+
+Notes are stored per chunk and replaced whole; /ingest documents are single
+chunks keyed by their id. When the app starts on a different backend than
+last time, stored vectors are copied over without re-embedding.
+
+    python -m lite.src.vector_backends --bench [--backends flat,mmap,chroma] [--queries 200] [--k 10]
+        [--quantization none,int8,binary]
+    python -m lite.src.vector_backends --copy-from chroma
+"""
+import abc
+import argparse
+import collections
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .quant import QUANTIZATIONS
+from .retrieval import RRF_K, EmbeddingCache, EmbeddingIndex, Scope, mmr, normalize_rows
+from .storage.config import META_DIR, _atomic_write
+from .storage.matrix_store import MatrixStore
+from .storage.segments import SegmentStore, embedding_store
+
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "mmap").strip().lower()
+BACKENDS = ("flat", "mmap", "chroma")
+CHROMA_DIR = os.getenv("CHROMA_DIR", "./lite/data/chroma")
+# Backend the stored vectors were last written to
+STATE_PATH = os.path.join(META_DIR, "vector_backend.json")
+# Chroma rejects very large upserts; bulk writes go in slices of this many chunks
+CHROMA_BATCH = 4096
+CHROMA_PAGE = 1000
+# Notes per batch when copying between backends
+COPY_BATCH_NOTES = 512
+
+NOTES, DOCUMENTS = "notes", "documents"
+
+
+def _doc_meta(doc_id: str) -> Dict:
+    # /ingest ids are "<file name>#<start>-<end>"
+    return {"source": doc_id.rsplit("#", 1)[0]}
+
+
+def _dir_size(root: str) -> int:
+    total = 0
+    for d, _, files in os.walk(root):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(d, f))
+            except OSError:
+                pass
+    return total
+
+
+class VectorBackend(abc.ABC):
+    """Where chunk embeddings are written and searched.
+
+    ``put_notes`` takes (note_id, title, chunks, embeddings) and replaces each
+    note's chunks; ``search`` is the /chat retrieval (note chunks only, MMR
+    diversified) and ``query`` the /search one (notes and documents, by
+    similarity). ``export`` yields stored rows as frames of whole notes so
+    another backend can take them over.
+    """
+
+    name = ""
+
+    @abc.abstractmethod
+    def note_texts(self, note_ids: List[str]) -> Dict[str, List[str]]:
+        """Stored chunk texts of each note in chunk order; notes without chunks are left out."""
+
+    @abc.abstractmethod
+    def stored_vectors(self, note_id: str) -> Dict[int, Tuple[str, list]]:
+        """chunk_index -> (text, embedding) as stored for ``note_id``."""
+
+    @abc.abstractmethod
+    def put_notes(self, notes: List[Tuple[str, str, List[str], list]], updated_at: int,
+                  force: bool = False) -> int:
+        """Replace the chunks of every note; no chunks removes it. Notes whose
+        chunk texts are unchanged are skipped unless ``force``. Returns notes rewritten."""
+
+    @abc.abstractmethod
+    def remove_notes(self, note_ids: List[str]) -> None:
+        ...
+
+    @abc.abstractmethod
+    def note_counts(self) -> Dict[str, int]:
+        """note_id -> stored chunks."""
+
+    @abc.abstractmethod
+    def has_notes(self) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def in_scope(self, allowed: Scope = None, date_start: Optional[int] = None,
+                 date_end: Optional[int] = None) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def search(self, qv, k: int, allowed: Scope = None, date_start: Optional[int] = None,
+               date_end: Optional[int] = None, candidates: int = 64, lambda_: float = 0.7,
+               note_ranks: Optional[Dict[str, int]] = None, nprobe: Optional[int] = None,
+               quantization: Optional[str] = None) -> List[Dict]:
+        """Best note chunks for ``qv`` as [{note_id, chunk_index, text, score}].
+
+        ``quantization`` ("int8"/"binary") scores compact codes first and
+        re-ranks the survivors exactly, where the backend supports it.
+        """
+
+    @abc.abstractmethod
+    def add_documents(self, docs: List[Dict]) -> int:
+        """Store /ingest chunks ({id, text, meta, embedding?}); returns how many were (re)written."""
+
+    @abc.abstractmethod
+    def query(self, qv, k: int = 5, note_ids: Optional[List[str]] = None,
+              quantization: Optional[str] = None) -> List[Dict]:
+        """/search results [{text, meta, distance}]; documents are included when ``note_ids`` is empty."""
+
+    @abc.abstractmethod
+    def export(self, kind: str) -> Iterator[pd.DataFrame]:
+        """Stored rows (note_id, chunk_index, text, embedding, updated_at) in frames of whole notes."""
+
+    def texts(self, kind: str) -> Iterator[str]:
+        """Texts of every stored chunk."""
+        for df in self.export(kind):
+            yield from df["text"]
+
+    @abc.abstractmethod
+    def clear(self, kind: str) -> None:
+        ...
+
+    def side_store(self, root: str) -> SegmentStore:
+        """Empty store a full rebuild fills before ``adopt_notes`` swaps it in."""
+        return SegmentStore(root)
+
+    @abc.abstractmethod
+    def adopt_notes(self, side: SegmentStore, keep=(), skip=(), tag: Optional[str] = None) -> None:
+        """Replace every note with ``side``'s, except notes in ``keep``; ``side`` notes in ``skip`` are left out.
+        Running it again after a crash finishes the job."""
+
+    def compact(self, min_age_s: float, budget=None) -> Dict:
+        """Fold and clean up storage; files younger than ``min_age_s`` are left alone.
+        ``budget`` (``maintenance.IOBudget``) paces the disk work as it goes."""
+        return {}
+
+    def disk_bytes(self) -> int:
+        return 0
+
+    def save_ann(self) -> bool:
+        return False
+
+    def stats(self) -> Dict:
+        return {"backend": self.name}
+
+
+class ResidentBackend(VectorBackend):
+    """Vectors persisted in a segment store and searched in process: over a resident
+    matrix, or for a ``MatrixStore`` over its memory-mapped matrix file as is."""
+
+    def __init__(self, name: str, store: SegmentStore, docs: SegmentStore, ann_path: Optional[str] = None):
+        self.name = name
+        self.store = store
+        self.docs = docs
+        self.cache = EmbeddingCache(store.manifest_path, loader=lambda: self._load(store), ann_path=ann_path,
+                                    stat=store.file_stat)
+        self.doc_cache = EmbeddingCache(docs.manifest_path, loader=lambda: self._load(docs), stat=docs.file_stat)
+        # merges keep the rows: the caches follow them instead of reloading
+        store.on_merge(self.cache.merged)
+        docs.on_merge(self.doc_cache.merged)
+        # serializes store writes so in-place cache patches line up
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load(store: SegmentStore):
+        if isinstance(store, MatrixStore):
+            mapped = store.mapped()
+            if mapped is not None:
+                # scored straight from the mapped file: no copy of the vectors
+                matrix, side = mapped
+                return EmbeddingIndex.from_mapped(matrix, side["row"].to_numpy(), side["note_id"], side["chunk_index"],
+                                                  side["text"], side["updated_at"])
+            # rows spread over several files until the next merge
+            store.maybe_merge()
+        return store.read()
+
+    def note_texts(self, note_ids: List[str]) -> Dict[str, List[str]]:
+        out = {}
+        for nid in note_ids:
+            texts = self.cache.note_texts(nid)
+            if texts:
+                out[nid] = texts
+        return out
+
+    def stored_vectors(self, note_id: str) -> Dict[int, Tuple[str, list]]:
+        df = self.store.read_note(note_id)
+        return {int(ci): (t, e) for ci, t, e in zip(df["chunk_index"], df["text"], df["embedding"])}
+
+    def _put(self, store: SegmentStore, cache: EmbeddingCache, rows: Dict[str, List[Dict]], updated_at: int) -> None:
+        with self._lock:
+            before = cache.file_stat()
+            if isinstance(store, MatrixStore):
+                matrix, side, after = store.put_mapped(rows)
+                cache.extend_mapped(matrix, side["row"].to_numpy(), side["note_id"], side["chunk_index"], side["text"],
+                                    side["updated_at"], removed=list(rows), expected=before, after=after)
+                return
+            after = store.put_notes(rows)
+            # an empty chunk list removes the note from the resident index too
+            cache.upsert_notes([(nid, [r["text"] for r in rs], [r["embedding"] for r in rs]) for nid, rs in rows.items()],
+                               updated_at, expected=before, after=after)
+
+    def put_notes(self, notes, updated_at: int, force: bool = False) -> int:
+        old = {} if force else self.note_texts([n[0] for n in notes])
+        rows: Dict[str, List[Dict]] = {}
+        for nid, _, chunks, embs in notes:
+            chunks = list(chunks)
+            if not chunks:
+                if force or nid in old:
+                    rows[nid] = []
+                continue
+            if not force and old.get(nid) == chunks:
+                continue
+            rows[nid] = [{"note_id": nid, "chunk_index": i, "text": c, "embedding": list(embs[i]),
+                          "updated_at": int(updated_at)} for i, c in enumerate(chunks)]
+        if rows:
+            self._put(self.store, self.cache, rows, updated_at)
+        return len(rows)
+
+    def remove_notes(self, note_ids: List[str]) -> None:
+        with self._lock:
+            before = self.cache.file_stat()
+            after = self.store.delete_notes(note_ids)
+            self.cache.remove_notes(list(note_ids), expected=before, after=after)
+
+    def note_counts(self) -> Dict[str, int]:
+        index = self.cache.get()
+        return dict(collections.Counter(index.note_ids[index.live].tolist()))
+
+    def has_notes(self) -> bool:
+        return len(self.cache.get()) > 0
+
+    def in_scope(self, allowed: Scope = None, date_start: Optional[int] = None,
+                 date_end: Optional[int] = None) -> bool:
+        return self.cache.in_scope(allowed, date_start, date_end)
+
+    def search(self, qv, k: int, allowed: Scope = None, date_start: Optional[int] = None,
+               date_end: Optional[int] = None, candidates: int = 64, lambda_: float = 0.7,
+               note_ranks: Optional[Dict[str, int]] = None, nprobe: Optional[int] = None,
+               quantization: Optional[str] = None) -> List[Dict]:
+        return self.cache.search(qv, k, allowed, date_start, date_end, candidates=candidates, lambda_=lambda_,
+                                 note_ranks=note_ranks, nprobe=nprobe, quantization=quantization)
+
+    def add_documents(self, docs: List[Dict]) -> int:
+        if not docs:
+            return 0
+        index = self.doc_cache.get()
+        # only chunks whose text differs from what is stored
+        docs = [d for d in docs if index.note_texts(d["id"]) != [d["text"]]]
+        if not docs:
+            return 0
+        todo = [i for i, d in enumerate(docs) if d.get("embedding") is None]
+        embs = [d.get("embedding") for d in docs]
+        if todo:
+            from .vectorstore import cached_embed
+
+            for i, e in zip(todo, cached_embed([docs[i]["text"] for i in todo])):
+                embs[i] = e
+        ts = int(time.time() * 1000)
+        rows = {d["id"]: [{"note_id": d["id"], "chunk_index": 0, "text": d["text"], "embedding": list(e),
+                           "updated_at": ts}] for d, e in zip(docs, embs)}
+        self._put(self.docs, self.doc_cache, rows, ts)
+        return len(rows)
+
+    def query(self, qv, k: int = 5, note_ids: Optional[List[str]] = None,
+              quantization: Optional[str] = None) -> List[Dict]:
+        from .storage.notes import note_titles
+
+        k = max(1, int(k))
+        # lambda 1: plain similarity order
+        hits = [(h["score"], h, True) for h in self.cache.search(qv, k, note_ids or None, candidates=k, lambda_=1.0,
+                                                                 quantization=quantization)]
+        if not note_ids:
+            hits += [(h["score"], h, False) for h in self.doc_cache.search(qv, k, candidates=k, lambda_=1.0,
+                                                                           quantization=quantization)]
+        hits = sorted(hits, key=lambda x: x[0], reverse=True)[:k]
+        titles = note_titles([h["note_id"] for _, h, is_note in hits if is_note])
+        out = []
+        for score, h, is_note in hits:
+            meta = {"note_id": h["note_id"], "title": titles.get(h["note_id"], "")} if is_note else _doc_meta(h["note_id"])
+            out.append({"text": h["text"], "meta": meta, "distance": 1.0 - score})
+        return out
+
+    def export(self, kind: str) -> Iterator[pd.DataFrame]:
+        df = (self.store if kind == NOTES else self.docs).read()
+        if df.empty:
+            return
+        ids = df["note_id"].drop_duplicates().tolist()
+        for lo in range(0, len(ids), COPY_BATCH_NOTES):
+            yield df[df["note_id"].isin(ids[lo:lo + COPY_BATCH_NOTES])]
+
+    def texts(self, kind: str) -> Iterator[str]:
+        # from the resident index: no vectors are read
+        index = (self.cache if kind == NOTES else self.doc_cache).get()
+        yield from index.texts[index.live]
+
+    def clear(self, kind: str) -> None:
+        store, cache = (self.store, self.cache) if kind == NOTES else (self.docs, self.doc_cache)
+        with self._lock:
+            store.delete_notes(list(store.manifest()["notes"]))
+            cache.invalidate()
+
+    def side_store(self, root: str) -> SegmentStore:
+        # same segment format as the live store, so adoption only links files
+        return type(self.store)(root)
+
+    def adopt_notes(self, side: SegmentStore, keep=(), skip=(), tag: Optional[str] = None) -> None:
+        with self._lock:
+            if tag is None or self.store.manifest().get("adopted") != tag:
+                self.store.adopt(side, keep=keep, skip=skip, tag=tag)
+            self.cache.invalidate()
+            # IVF lists and centroids belong to the old vectors; retrained in the background
+            if self.cache.ann_path:
+                try:
+                    os.remove(self.cache.ann_path)
+                except FileNotFoundError:
+                    pass
+
+    def compact(self, min_age_s: float, budget=None) -> Dict:
+        out = {"segments_before": 0, "segments_merged": 0, "unreferenced_segments": 0}
+        for store in (self.store, self.docs):
+            out["segments_before"] += len(store.manifest()["segments"])
+            # a merged run can fill the next tier
+            for _ in range(8):
+                n = store.merge(budget=budget)
+                if not n:
+                    break
+                out["segments_merged"] += n
+            out["unreferenced_segments"] += store.sweep(min_age_s)[0]
+        return out
+
+    def disk_bytes(self) -> int:
+        return _dir_size(self.store.root) + _dir_size(self.docs.root)
+
+    def save_ann(self) -> bool:
+        return self.cache.save_ann()
+
+    def stats(self) -> Dict:
+        index, docs = self.cache.get(), self.doc_cache.get()
+        return {"backend": self.name, "note_chunks": len(index), "document_chunks": len(docs),
+                "dim": int(index.matrix.shape[1]) if len(index) else 0,
+                "resident_bytes": sum(int(ix.matrix.nbytes) for ix in (index, docs) if not ix.mapped),
+                # page cache shared by every process mapping the file
+                "mapped_bytes": sum(int(ix.matrix.nbytes) for ix in (index, docs) if ix.mapped),
+                # int8/binary codes built by quantized searches so far
+                "codes_bytes": index.codes_nbytes + docs.codes_nbytes,
+                "disk_bytes": self.disk_bytes()}
+
+
+class ChromaBackend(VectorBackend):
+    """Chunks in a Chroma collection; note chunks are ``note:<note_id>:<i>``, documents keep their id."""
+
+    name = "chroma"
+
+    def __init__(self, path: str = CHROMA_DIR, collection: str = "docs"):
+        self.path = path
+        self._collection_name = collection
+        self._col = None
+        self._lock = threading.Lock()
+
+    @property
+    def collection(self):
+        with self._lock:
+            if self._col is None:
+                import chromadb
+                from chromadb.config import Settings
+
+                client = chromadb.PersistentClient(path=self.path, settings=Settings(allow_reset=False))
+                self._col = client.get_or_create_collection(name=self._collection_name)
+            return self._col
+
+    @staticmethod
+    def _chunk_index(cid: str, meta: Optional[Dict]) -> int:
+        ci = (meta or {}).get("chunk_index")
+        return int(ci) if ci is not None else int(cid.rsplit(":", 1)[1])
+
+    def _get_notes(self, note_ids: List[str], include: List[str]) -> Dict[str, Dict[int, Tuple]]:
+        """note_id -> {chunk_index: (id, document, metadata[, embedding])}."""
+        out: Dict[str, Dict[int, Tuple]] = {}
+        for lo in range(0, len(note_ids), 512):
+            try:
+                got = self.collection.get(where={"note_id": {"$in": note_ids[lo:lo + 512]}}, include=include)
+            except Exception:
+                continue
+            ids = got["ids"]
+            docs = got.get("documents") or [None] * len(ids)
+            metas = got.get("metadatas") or [None] * len(ids)
+            embs = got.get("embeddings")
+            embs = [None] * len(ids) if embs is None else embs
+            for cid, doc, meta, emb in zip(ids, docs, metas, embs):
+                if cid.startswith("note:"):
+                    nid = (meta or {}).get("note_id") or cid[5:].rsplit(":", 1)[0]
+                    out.setdefault(nid, {})[self._chunk_index(cid, meta)] = (cid, doc, meta or {}, emb)
+        return out
+
+    def note_texts(self, note_ids: List[str]) -> Dict[str, List[str]]:
+        got = self._get_notes(list(note_ids), ["documents", "metadatas"])
+        return {nid: [c[i][1] for i in sorted(c)] for nid, c in got.items()}
+
+    def stored_vectors(self, note_id: str) -> Dict[int, Tuple[str, list]]:
+        got = self._get_notes([note_id], ["documents", "metadatas", "embeddings"]).get(note_id, {})
+        return {i: (doc, emb) for i, (_, doc, _, emb) in got.items()}
+
+    def put_notes(self, notes, updated_at: int, force: bool = False) -> int:
+        have = self._get_notes([n[0] for n in notes], ["documents", "metadatas"])
+        up: Tuple[List, List, List, List] = ([], [], [], [])
+        retag: Tuple[List, List] = ([], [])
+        drop: List[str] = []
+        written = 0
+        for nid, title, chunks, embs in notes:
+            title = title or ""
+            cur = have.get(nid, {})
+            drop.extend(cur[i][0] for i in cur if i >= len(chunks))
+            changed = [i for i, c in enumerate(chunks) if force or i not in cur or cur[i][1] != c]
+            if not changed and len(cur) == len(chunks):
+                # same text: a new title (or chunks stored before they carried updated_at) is metadata only
+                for i in range(len(chunks)):
+                    meta = cur[i][2]
+                    if meta.get("title") != title or "updated_at" not in meta:
+                        retag[0].append(cur[i][0])
+                        retag[1].append({"note_id": nid, "title": title, "chunk_index": i,
+                                         "updated_at": int(meta.get("updated_at", updated_at))})
+                continue
+            written += 1
+            changed_set = set(changed)
+            for i, c in enumerate(chunks):
+                meta = {"note_id": nid, "title": title, "chunk_index": i, "updated_at": int(updated_at)}
+                if i in changed_set:
+                    for lst, v in zip(up, (f"note:{nid}:{i}", c, meta, np.asarray(embs[i], dtype=np.float32))):
+                        lst.append(v)
+                else:
+                    retag[0].append(cur[i][0])
+                    retag[1].append(meta)
+        col = self.collection
+        for lo in range(0, len(drop), CHROMA_BATCH):
+            col.delete(ids=drop[lo:lo + CHROMA_BATCH])
+        for lo in range(0, len(retag[0]), CHROMA_BATCH):
+            hi = lo + CHROMA_BATCH
+            col.update(ids=retag[0][lo:hi], metadatas=retag[1][lo:hi])
+        for lo in range(0, len(up[0]), CHROMA_BATCH):
+            hi = lo + CHROMA_BATCH
+            col.upsert(ids=up[0][lo:hi], documents=up[1][lo:hi], metadatas=up[2][lo:hi], embeddings=up[3][lo:hi])
+        return written
+
+    def remove_notes(self, note_ids: List[str]) -> None:
+        note_ids = list(note_ids)
+        for lo in range(0, len(note_ids), 512):
+            try:
+                self.collection.delete(where={"note_id": {"$in": note_ids[lo:lo + 512]}})
+            except Exception:
+                pass
+
+    def _ids(self) -> Iterator[Tuple[str, Optional[Dict]]]:
+        offset = 0
+        while True:
+            got = self.collection.get(include=["metadatas"], limit=CHROMA_PAGE, offset=offset)
+            ids = got.get("ids") or []
+            yield from zip(ids, got.get("metadatas") or [None] * len(ids))
+            if len(ids) < CHROMA_PAGE:
+                return
+            offset += CHROMA_PAGE
+
+    def note_counts(self) -> Dict[str, int]:
+        out: Dict[str, int] = collections.Counter()
+        for cid, meta in self._ids():
+            if cid.startswith("note:"):
+                out[(meta or {}).get("note_id") or cid[5:].rsplit(":", 1)[0]] += 1
+        return dict(out)
+
+    def _where(self, allowed: Scope, date_start: Optional[int], date_end: Optional[int]):
+        """Chroma filter for the scope, or False if nothing can match."""
+        # every note chunk carries updated_at; documents do not and drop out here
+        conds: List[Dict] = [{"updated_at": {"$gte": int(date_start or 0)}}]
+        if date_end:
+            conds.append({"updated_at": {"$lte": int(date_end)}})
+        if isinstance(allowed, np.ndarray):
+            from .storage.scope import ScopeResolver
+
+            allowed = ScopeResolver.ids(allowed)
+            if not allowed:
+                return False
+        if allowed:
+            conds.append({"note_id": {"$in": list(allowed)}})
+        return conds[0] if len(conds) == 1 else {"$and": conds}
+
+    def has_notes(self) -> bool:
+        return bool(self.collection.get(where=self._where(None, None, None), limit=1, include=[])["ids"])
+
+    def in_scope(self, allowed: Scope = None, date_start: Optional[int] = None,
+                 date_end: Optional[int] = None) -> bool:
+        where = self._where(allowed, date_start, date_end)
+        return where is not False and bool(self.collection.get(where=where, limit=1, include=[])["ids"])
+
+    def _query(self, qv, n: int, where) -> Tuple[List[str], List[str], List[Dict], np.ndarray]:
+        res = self.collection.query(query_embeddings=[list(map(float, qv))], n_results=max(1, n), where=where,
+                                    include=["documents", "metadatas", "embeddings"])
+        ids = res["ids"][0]
+        embs = res.get("embeddings")
+        vecs = normalize_rows(np.asarray(embs[0], dtype=np.float32)) if ids else np.zeros((0, 0), dtype=np.float32)
+        return ids, res["documents"][0], [m or {} for m in res["metadatas"][0]], vecs
+
+    def search(self, qv, k: int, allowed: Scope = None, date_start: Optional[int] = None,
+               date_end: Optional[int] = None, candidates: int = 64, lambda_: float = 0.7,
+               note_ranks: Optional[Dict[str, int]] = None, nprobe: Optional[int] = None,
+               quantization: Optional[str] = None) -> List[Dict]:
+        """Chroma's nearest ``candidates`` chunks, rescored and diversified as in the flat backend.
+
+        Keyword hits outside the candidates join with their best chunk. ``nprobe``
+        and ``quantization`` do not apply: Chroma searches its own HNSW graph.
+        """
+        where = self._where(allowed, date_start, date_end)
+        if where is False:
+            return []
+        k = max(1, int(k))
+        ids, docs, metas, vecs = self._query(qv, max(k, int(candidates)), where)
+        if not ids:
+            return []
+        q = normalize_rows(qv)[0]
+        scores = vecs @ q
+        nids = [m.get("note_id") for m in metas]
+        if note_ranks:
+            have = set(nids)
+            missing = [nid for nid in note_ranks if nid not in have]
+            if missing:
+                extra = self._query(qv, min(int(candidates), 4 * len(missing)),
+                                    {"$and": [where, {"note_id": {"$in": missing}}]})
+                seen = set()
+                for cid, doc, meta, vec in zip(*extra):
+                    if meta.get("note_id") not in seen:
+                        # best chunk of each keyword hit
+                        seen.add(meta.get("note_id"))
+                        ids, docs, metas, nids = ids + [cid], docs + [doc], metas + [meta], nids + [meta.get("note_id")]
+                        vecs = np.vstack([vecs, vec])
+                        scores = np.append(scores, vec @ q)
+        order = np.argsort(-scores, kind="stable")
+        vecs, scores = vecs[order], scores[order]
+        rel = scores
+        if note_ranks:
+            vrank = np.arange(1, scores.size + 1, dtype=np.float64)
+            kw = np.array([note_ranks.get(nids[i], 0) for i in order], dtype=np.float64)
+            fused = 1.0 / (RRF_K + vrank) + np.where(kw > 0, 1.0 / (RRF_K + np.maximum(kw, 1)), 0.0)
+            rel = (fused / fused.max()).astype(np.float32)
+        out = []
+        for p in mmr(vecs, rel, k, lambda_):
+            i = int(order[p])
+            out.append({"note_id": nids[i], "chunk_index": self._chunk_index(ids[i], metas[i]), "text": docs[i],
+                        "score": float(scores[p])})
+        return out
+
+    def add_documents(self, docs: List[Dict]) -> int:
+        if not docs:
+            return 0
+        ids = [d["id"] for d in docs]
+        try:
+            got = self.collection.get(ids=ids, include=["documents", "metadatas"])
+            have = {i: (doc, meta) for i, doc, meta in zip(got["ids"], got["documents"], got["metadatas"])}
+        except Exception:
+            have = {}
+        # only send chunks whose text or metadata differs from what Chroma already holds
+        docs = [d for d in docs if have.get(d["id"]) != (d["text"], d.get("meta", {}) or None)]
+        if not docs:
+            return 0
+        texts = [d["text"] for d in docs]
+        metas = [d.get("meta", {}) for d in docs]
+        embs = [d.get("embedding") for d in docs]
+        todo = [i for i, e in enumerate(embs) if e is None]
+        if todo:
+            from .vectorstore import cached_embed
+
+            for i, e in zip(todo, cached_embed([texts[i] for i in todo])):
+                embs[i] = e
+        for lo in range(0, len(docs), CHROMA_BATCH):
+            hi = lo + CHROMA_BATCH
+            self.collection.upsert(ids=[d["id"] for d in docs[lo:hi]], documents=texts[lo:hi], metadatas=metas[lo:hi],
+                                   embeddings=[np.asarray(e, dtype=np.float32) for e in embs[lo:hi]])
+        return len(docs)
+
+    def query(self, qv, k: int = 5, note_ids: Optional[List[str]] = None,
+              quantization: Optional[str] = None) -> List[Dict]:
+        where = {"note_id": {"$in": list(note_ids)}} if note_ids else None
+        res = self.collection.query(query_embeddings=[list(map(float, qv))], n_results=max(1, int(k)), where=where)
+        docs = res.get("documents", [[]])[0]
+        metas = res.get("metadatas", [[]])[0]
+        dists = res.get("distances", [[]])[0]
+        return [{"text": doc, "meta": meta, "distance": dist} for doc, meta, dist in zip(docs, metas, dists)]
+
+    def export(self, kind: str) -> Iterator[pd.DataFrame]:
+        if kind == NOTES:
+            ids = sorted(self.note_counts())
+            for lo in range(0, len(ids), COPY_BATCH_NOTES):
+                got = self._get_notes(ids[lo:lo + COPY_BATCH_NOTES], ["documents", "metadatas", "embeddings"])
+                rows = [{"note_id": nid, "chunk_index": i, "text": doc, "embedding": emb,
+                         "updated_at": int(meta.get("updated_at", 0))}
+                        for nid, chunks in got.items() for i, (_, doc, meta, emb) in sorted(chunks.items())]
+                if rows:
+                    yield pd.DataFrame(rows)
+            return
+        docs = [cid for cid, _ in self._ids() if not cid.startswith("note:")]
+        for lo in range(0, len(docs), CHROMA_PAGE):
+            got = self.collection.get(ids=docs[lo:lo + CHROMA_PAGE], include=["documents", "embeddings"])
+            yield pd.DataFrame({"note_id": got["ids"], "chunk_index": 0, "text": got["documents"],
+                                "embedding": list(got["embeddings"]), "updated_at": 0})
+
+    def clear(self, kind: str) -> None:
+        ids = [cid for cid, _ in self._ids() if cid.startswith("note:") == (kind == NOTES)]
+        for lo in range(0, len(ids), CHROMA_BATCH):
+            self.collection.delete(ids=ids[lo:lo + CHROMA_BATCH])
+
+    def adopt_notes(self, side: SegmentStore, keep=(), skip=(), tag: Optional[str] = None) -> None:
+        from .storage.notes import note_titles
+
+        keep, skip = set(keep), set(skip)
+        built = [nid for nid in side.manifest()["notes"] if nid not in keep and nid not in skip]
+        built_set = set(built)
+        self.remove_notes([nid for nid in self.note_counts() if nid not in keep and nid not in built_set])
+        if not built:
+            return
+        df = side.read()
+        for lo in range(0, len(built), COPY_BATCH_NOTES):
+            ids = built[lo:lo + COPY_BATCH_NOTES]
+            titles = note_titles(ids)
+            part = df[df["note_id"].isin(ids)].sort_values(["note_id", "chunk_index"])
+            for ts, at in part.groupby("updated_at"):
+                notes = [(nid, titles.get(nid, ""), g["text"].tolist(), g["embedding"].tolist())
+                         for nid, g in at.groupby("note_id", sort=False)]
+                self.put_notes(notes, int(ts), force=True)
+
+    def disk_bytes(self) -> int:
+        return _dir_size(self.path)
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, "chunks": int(self.collection.count()), "disk_bytes": self.disk_bytes()}
+
+
+def make_backend(name: str, root: Optional[str] = None, chroma_dir: Optional[str] = None) -> VectorBackend:
+    """A backend over the app's data dirs, or over ``root``/``chroma_dir`` (benchmarks, tests)."""
+    if name == "flat":
+        if root is None:
+            store = embedding_store()
+            return ResidentBackend("flat", store, SegmentStore(os.path.join(META_DIR, "documents")),
+                                   ann_path=os.path.join(META_DIR, "ann_ivf.npz"))
+        return ResidentBackend("flat", SegmentStore(os.path.join(root, "embeddings")),
+                               SegmentStore(os.path.join(root, "documents")), ann_path=os.path.join(root, "ann_ivf.npz"))
+    if name == "mmap":
+        base = META_DIR if root is None else root
+        return ResidentBackend("mmap", MatrixStore(os.path.join(base, "embeddings.mmap")),
+                               MatrixStore(os.path.join(base, "documents.mmap")),
+                               ann_path=os.path.join(base, "ann_ivf.mmap.npz"))
+    if name == "chroma":
+        return ChromaBackend(chroma_dir or (CHROMA_DIR if root is None else os.path.join(root, "chroma")))
+    raise ValueError(f"VECTOR_BACKEND must be one of: {', '.join(BACKENDS)}")
+
+
+_backend: Optional[VectorBackend] = None
+_backend_lock = threading.Lock()
+
+
+def vector_backend() -> VectorBackend:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = make_backend(VECTOR_BACKEND)
+        return _backend
+
+
+def copy_backend(src: VectorBackend, dst: VectorBackend, kind: str) -> int:
+    """Replace ``dst``'s notes or documents with ``src``'s stored vectors. Returns chunks copied."""
+    from .storage.notes import note_titles
+
+    dst.clear(kind)
+    n = 0
+    for df in src.export(kind):
+        if kind == NOTES:
+            titles = note_titles(df["note_id"].drop_duplicates().tolist())
+            df = df.sort_values(["note_id", "chunk_index"])
+            # a note's chunks share one updated_at; keep it for date filters
+            for ts, part in df.groupby("updated_at"):
+                notes = [(nid, titles.get(nid, ""), g["text"].tolist(), g["embedding"].tolist())
+                         for nid, g in part.groupby("note_id", sort=False)]
+                dst.put_notes(notes, int(ts), force=True)
+        else:
+            dst.add_documents([{"id": i, "text": t, "meta": _doc_meta(i), "embedding": e}
+                               for i, t, e in zip(df["note_id"], df["text"], df["embedding"])])
+        n += len(df)
+    return n
+
+
+def _read_state() -> Optional[Dict]:
+    try:
+        with open(STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def auto_migrate() -> Dict[str, int]:
+    """First start on a backend: copy notes and documents over from the previous one. Returns chunks per kind."""
+    state = _read_state()
+    prev = (state or {}).get("backend")
+    if prev == VECTOR_BACKEND:
+        return {}
+    dst = vector_backend()
+    # before backends were pluggable, notes were read from the segment store and documents only lived in Chroma
+    sources = {NOTES: prev, DOCUMENTS: prev} if prev else {NOTES: "flat", DOCUMENTS: "chroma"}
+    counts: Dict[str, int] = {}
+    for kind, name in sources.items():
+        if name == dst.name:
+            continue
+        if name == "chroma" and not os.path.exists(os.path.join(CHROMA_DIR, "chroma.sqlite3")):
+            continue
+        counts[kind] = copy_backend(make_backend(name), dst, kind)
+    _atomic_write(STATE_PATH, json.dumps({"backend": dst.name, "migrated_at": int(time.time() * 1000),
+                                          "from": sources, "chunks": counts}))
+    return counts
+
+
+def benchmark(names: List[str], queries: int = 200, k: int = 10, seed: int = 0,
+              levels: Tuple[str, ...] = ("none",)) -> Dict[str, Dict]:
+    """Copy the configured backend's notes into a scratch instance of each backend and time searches.
+
+    Queries are stored vectors plus noise; recall@k is against exact scoring of all stored vectors.
+    Returns per backend: copy and cold-load seconds, search latency and recall. In-process
+    backends are also run at every quantization level in ``levels`` (as "<backend>+<level>",
+    with the bytes of the codes).
+    """
+    src = vector_backend()
+    frames = list(src.export(NOTES))
+    if not frames:
+        return {}
+    df = pd.concat(frames, ignore_index=True)
+    matrix = normalize_rows(np.vstack([np.asarray(e, dtype=np.float32) for e in df["embedding"]]))
+    keys = list(zip(df["note_id"], df["chunk_index"].astype(int)))
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(matrix.shape[0], size=min(queries, matrix.shape[0]), replace=False)
+    qs = normalize_rows(matrix[picks] + rng.normal(scale=0.05, size=(picks.size, matrix.shape[1])).astype(np.float32))
+    row_of = {key: j for j, key in enumerate(keys)}
+    exact = [matrix @ q for q in qs]
+    # a hit counts if it scores at least the k-th best exact score (ties are interchangeable)
+    kth = [np.sort(e)[-min(k, e.size)] - 1e-5 for e in exact]
+    tmp = tempfile.mkdtemp(prefix="vector-bench-")
+    out: Dict[str, Dict] = {}
+    try:
+        for name in names:
+            t = time.perf_counter()
+            b = make_backend(name, root=os.path.join(tmp, name))
+            copied = copy_backend(src, b, NOTES)
+            copy_s = time.perf_counter() - t
+            if isinstance(b, ResidentBackend):
+                # cold load from disk, as after a restart
+                b.cache.invalidate()
+            t = time.perf_counter()
+            b.has_notes()
+            load_s = time.perf_counter() - t
+            for level in levels if isinstance(b, ResidentBackend) else ("none",):
+                if level != "none":
+                    # codes are built on first use; keep that out of the latencies
+                    b.search(qs[0], k, candidates=k, lambda_=1.0, quantization=level)
+                lat, hit = [], 0
+                for q, e, floor in zip(qs, exact, kth):
+                    t = time.perf_counter()
+                    got = b.search(q, k, candidates=k, lambda_=1.0, quantization=level)
+                    lat.append((time.perf_counter() - t) * 1000)
+                    rows = [row_of.get((h["note_id"], int(h["chunk_index"]))) for h in got]
+                    hit += sum(1 for r in rows if r is not None and e[r] >= floor)
+                st = b.stats()
+                out[name if level == "none" else f"{name}+{level}"] = {
+                    "chunks": copied, "copy_s": round(copy_s, 3), "load_s": round(load_s, 3),
+                    "p50_ms": round(float(np.percentile(lat, 50)), 3),
+                    "p95_ms": round(float(np.percentile(lat, 95)), 3),
+                    f"recall_at_{k}": round(hit / (k * len(qs)), 4), "disk_bytes": st.get("disk_bytes"),
+                    "resident_bytes": st.get("resident_bytes"), "mapped_bytes": st.get("mapped_bytes"),
+                    "codes_bytes": st.get("codes_bytes")}
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return out
+
+
+def main(argv=None) -> None:
+    from .storage.config import ensure_storage_dirs
+
+    ap = argparse.ArgumentParser(description="Benchmark vector backends or copy vectors between them.")
+    ap.add_argument("--bench", action="store_true", help="time searches on scratch copies of the stored notes")
+    ap.add_argument("--backends", default=",".join(BACKENDS), help="backends to benchmark (comma-separated)")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--quantization", default="none",
+                    help=f"levels to run the in-process backends at (comma-separated: {', '.join(QUANTIZATIONS)})")
+    ap.add_argument("--copy-from", choices=BACKENDS, help="replace the configured backend's vectors with this one's")
+    args = ap.parse_args(argv)
+    ensure_storage_dirs()
+    if args.copy_from:
+        dst = vector_backend()
+        if args.copy_from == dst.name:
+            ap.error(f"{args.copy_from} is the configured backend")
+        for kind in (NOTES, DOCUMENTS):
+            print(f"{kind}: {copy_backend(make_backend(args.copy_from), dst, kind)} chunks")
+        _atomic_write(STATE_PATH, json.dumps({"backend": dst.name, "migrated_at": int(time.time() * 1000)}))
+    if args.bench:
+        names = [n for n in args.backends.split(",") if n]
+        levels = tuple(lv for lv in args.quantization.split(",") if lv)
+        bad = [lv for lv in levels if lv not in QUANTIZATIONS]
+        if bad:
+            ap.error(f"unknown quantization: {', '.join(bad)}")
+        print(json.dumps(benchmark(names, args.queries, args.k, levels=levels), indent=2))
+
+
+if __name__ == "__main__":
+    main()
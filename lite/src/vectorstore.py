@@ -1,38 +1,29 @@
-import os
-import chromadb
-from chromadb.config import Settings
 from dotenv import load_dotenv
-from .ollama_client import embed_texts
+from .ollama_client import EMBED_MODEL, embed_query, embed_texts
+from .storage.embed_cache import embed_cache
 
 load_dotenv()
 
-CHROMA_DIR = os.getenv("CHROMA_DIR", "./lite/data/chroma")
-_client = chromadb.PersistentClient(path=CHROMA_DIR, settings=Settings(allow_reset=False))
-_collection = _client.get_or_create_collection(name="docs")
 
+def cached_embed(texts: list) -> list:
+    """embed_texts, skipping chunks whose (model, sha256) is already in the embedding cache."""
+    return embed_cache().embed(EMBED_MODEL, texts, embed_texts)
 
-def add_documents(docs: list):
-    # docs: [{"id": str, "text": str, "meta": dict}]
-    if not docs:
-        return
-    texts = [d["text"] for d in docs]
-    ids = [d["id"] for d in docs]
-    metas = [d.get("meta", {}) for d in docs]
-    embs = embed_texts(texts)
-    _collection.add(ids=ids, documents=texts, metadatas=metas, embeddings=embs)
+
+def add_documents(docs: list) -> int:
+    # docs: [{"id": str, "text": str, "meta": dict}]; returns how many were (re)written
+    from .vector_backends import vector_backend
+
+    return vector_backend().add_documents(docs)
 
 
 def query(q: str, k: int = 5, note_ids: list | None = None):
-    em = embed_texts([q])[0]
-    where = None
-    if note_ids:
-        # Filter by allowed note_ids in metadata
-        where = {"note_id": {"$in": note_ids}}
-    res = _collection.query(query_embeddings=[em], n_results=k, where=where)
-    out = []
-    docs = res.get("documents", [[]])[0]
-    metas = res.get("metadatas", [[]])[0]
-    dists = res.get("distances", [[]])[0]
-    for doc, meta, dist in zip(docs, metas, dists):
-        out.append({"text": doc, "meta": meta, "distance": dist})
-    return out
+    return query_embedding(embed_query(q), k, note_ids)
+
+
+def query_embedding(em: list, k: int = 5, note_ids: list | None = None):
+    # notes (and, unfiltered, /ingest documents) nearest to ``em`` in the configured vector backend
+    from .storage.config import load_settings
+    from .vector_backends import vector_backend
+
+    return vector_backend().query(em, k, note_ids, quantization=load_settings().get("QUANTIZATION", "none"))
@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def clustered_frame():
+    """Factory of embedding frames drawn around 30 cluster centers, three chunks per note."""
+    def make(n=3000, dim=16, seed=0, noise=0.1):
+        rng = np.random.default_rng(seed)
+        centers = rng.normal(size=(30, dim))
+        vecs = centers[rng.integers(0, 30, n)] + noise * rng.normal(size=(n, dim))
+        return pd.DataFrame({
+            "note_id": [f"n{i // 3}" for i in range(n)],
+            "chunk_index": [i % 3 for i in range(n)],
+            "text": [f"t{i}" for i in range(n)],
+            "embedding": list(vecs.astype(np.float32)),
+            "updated_at": [1] * n,
+        })
+
+    return make
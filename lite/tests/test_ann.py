@@ -0,0 +1,50 @@
+import os
+import tempfile
+
+import numpy as np
+
+from lite.src import ann
+from lite.src.retrieval import EmbeddingCache, EmbeddingIndex
+
+
+def test_ivf_search_matches_exact_and_respects_filters(monkeypatch, clustered_frame):
+    monkeypatch.setattr(ann, "ANN_MIN_ROWS", 100)
+    df = clustered_frame()
+    ix = EmbeddingIndex.from_frame(df)
+    ix.attach_ivf(ann.kmeans(ix.matrix, ann.nlist_for(len(ix))))
+    assert (ix.lists >= 0).all()
+    rng = np.random.default_rng(1)
+    agree = 0
+    for q in np.vstack(df["embedding"].to_numpy())[rng.choice(len(df), 50, replace=False)]:
+        exact = ix.search(q, 1, candidates=10)
+        approx = ix.search(q, 1, candidates=10, nprobe=4)
+        agree += exact[0]["text"] == approx[0]["text"]
+    assert agree >= 45
+    # a small allowed set still fills k: probing widens until enough rows are covered
+    allowed = [f"n{i}" for i in range(0, 1000, 97)]
+    hits = ix.search(rng.normal(size=16), 5, mask=ix.mask(allowed), candidates=10, nprobe=1)
+    assert len(hits) == 5 and all(h["note_id"] in allowed for h in hits)
+
+
+def test_incremental_rows_get_lists(clustered_frame):
+    ix = EmbeddingIndex.from_frame(clustered_frame(600))
+    ix.attach_ivf(ann.kmeans(ix.matrix, 8))
+    ix.upsert_note("new", ["a", "b"], np.ones((2, 16), dtype=np.float32), 5)
+    assert (ix.lists[ix.live] >= 0).all()
+
+
+def test_cache_builds_persists_and_reloads_ivf(monkeypatch, clustered_frame):
+    monkeypatch.setattr(ann, "ANN_MIN_ROWS", 100)
+    d = tempfile.mkdtemp()
+    path = os.path.join(d, "manifest.json")
+    open(path, "w").close()
+    df = clustered_frame(1200)
+    cache = EmbeddingCache(path, loader=lambda: df, ann_path=os.path.join(d, "ann_ivf.npz"))
+    cache.search(np.ones(16), 3, nprobe=2)
+    cache._building.join()
+    assert cache.get().ivf is not None
+    assert os.path.exists(cache.ann_path)
+    again = EmbeddingCache(path, loader=lambda: df, ann_path=cache.ann_path)
+    ix = again.get()
+    assert ix.ivf is not None and not ix.ivf_dirty
+    assert np.array_equal(ix.lists, cache.get().lists)
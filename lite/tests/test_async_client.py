@@ -0,0 +1,94 @@
+import asyncio
+import json
+import threading
+
+import httpx
+
+from lite.src import ollama_client as oc
+from lite.src.concurrency import run_cpu
+
+
+def test_achat_and_aembed_use_async_paths(monkeypatch):
+    monkeypatch.setattr(oc, "FAKE_LLM", False)
+    monkeypatch.setattr(oc, "FAKE_EMBED", False)
+    posted = []
+
+    def post(texts, model):
+        posted.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    monkeypatch.setattr(oc, "_batcher", oc.EmbedBatcher(post, batch_size=16, window_ms=50))
+
+    def handler(request):
+        body = json.loads(request.content)
+        return httpx.Response(200, json={"message": {"content": "re: " + body["messages"][-1]["content"]}})
+
+    async def main():
+        monkeypatch.setattr(oc, "_aclient", httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://x"))
+        monkeypatch.setattr(oc, "_aclient_loop", asyncio.get_running_loop())
+        vecs = await asyncio.gather(*(oc.aembed_texts([f"q{i}" * (i + 1)]) for i in range(5)))
+        answers = await asyncio.gather(*(oc.achat([{"role": "user", "content": f"hi {i}"}]) for i in range(20)))
+        return vecs, answers
+
+    threads_before = threading.active_count()
+    vecs, answers = asyncio.run(main())
+    assert [v[0][0] for v in vecs] == [2.0 * (i + 1) for i in range(5)]
+    assert len(posted) < 5
+    assert answers == [f"re: hi {i}" for i in range(20)]
+    # twenty concurrent chats did not spawn a thread each
+    assert threading.active_count() <= threads_before + 2
+
+
+def test_run_cpu_is_bounded():
+    from lite.src import concurrency
+
+    seen = set()
+
+    def work():
+        seen.add(threading.current_thread().name)
+        return 1
+
+    async def main():
+        return await asyncio.gather(*(run_cpu(work) for _ in range(50)))
+
+    assert sum(asyncio.run(main())) == 50
+    assert len(seen) <= concurrency.CPU_WORKERS
+
+
+class _Stream(httpx.AsyncByteStream):
+    def __init__(self, lines):
+        self.lines = lines
+        self.closed = False
+
+    async def __aiter__(self):
+        for line in self.lines:
+            yield (json.dumps(line) + "\n").encode()
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_astream_chat_yields_tokens_and_closes_on_early_exit(monkeypatch):
+    monkeypatch.setattr(oc, "FAKE_LLM", False)
+    parts = [{"message": {"content": t}, "done": False} for t in ("Hel", "lo", " there")]
+    streams = []
+
+    def handler(request):
+        assert json.loads(request.content)["stream"] is True
+        st = _Stream(parts + [{"message": {"content": ""}, "done": True}])
+        streams.append(st)
+        return httpx.Response(200, stream=st)
+
+    async def main():
+        monkeypatch.setattr(oc, "_aclient", httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://x"))
+        monkeypatch.setattr(oc, "_aclient_loop", asyncio.get_running_loop())
+        full = [t async for t in oc.astream_chat([{"role": "user", "content": "hi"}])]
+        gen = oc.astream_chat([{"role": "user", "content": "hi"}])
+        first = await gen.__anext__()
+        await gen.aclose()
+        return full, first
+
+    full, first = asyncio.run(main())
+    assert full == ["Hel", "lo", " there"]
+    assert first == "Hel"
+    assert all(st.closed for st in streams)
@@ -0,0 +1,60 @@
+import math
+import os
+import random
+import tempfile
+from collections import Counter
+
+from lite.src.storage.bm25 import B, K1, BM25Index, tokenize
+
+
+WORDS = ["apple", "pear", "plum", "fig", "kiwi", "lime", "date", "melon", "grape", "mango", "peach", "berry"]
+
+
+def _docs(n=80, seed=11):
+    rng = random.Random(seed)
+    return {f"n{i}": " ".join(rng.choice(WORDS[: 3 + i % 9]) for _ in range(rng.randint(3, 40))) for i in range(n)}
+
+
+def _brute(docs, q, k):
+    tfs = {n: Counter(tokenize(t)) for n, t in docs.items()}
+    avgdl = sum(sum(c.values()) for c in tfs.values()) / len(tfs)
+    scores = {}
+    for t in set(tokenize(q)):
+        df = sum(1 for c in tfs.values() if t in c)
+        if not df:
+            continue
+        idf = math.log(1 + (len(tfs) - df + 0.5) / (df + 0.5))
+        for n, c in tfs.items():
+            if t in c:
+                dl = sum(c.values())
+                scores[n] = scores.get(n, 0.0) + idf * c[t] * (K1 + 1) / (c[t] + K1 * (1 - B + B * dl / avgdl))
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+
+
+def test_pruned_topk_matches_exhaustive_scoring():
+    index = BM25Index(os.path.join(tempfile.mkdtemp(), "bm25.npz"))
+    docs = _docs()
+    for nid, text in docs.items():
+        index.update(nid, "", text, sha=nid)
+    for q in ["apple", "mango peach berry", "fig kiwi apple pear", "unknown"]:
+        got = index.search(q, k=5)
+        want = _brute(docs, q, 5)
+        assert [round(s, 6) for _, s in got] == [round(s, 6) for _, s in want]
+    index.save()
+    reopened = BM25Index(index.path)
+    for q in ["apple", "mango peach berry"]:
+        assert reopened.search(q, k=5) == index.search(q, k=5)
+
+
+def test_updates_remove_old_terms_and_persist_through_a_snapshot():
+    path = os.path.join(tempfile.mkdtemp(), "bm25.npz")
+    index = BM25Index(path)
+    index.update("a", "Groceries", "apple pear", sha="1")
+    index.update("b", "", "apple", sha="2")
+    index.update("a", "Groceries", "plum", sha="3")
+    assert [n for n, _ in index.search("pear", 5)] == []
+    index.remove("b")
+    index.save()
+    reopened = BM25Index(path)
+    assert [n for n, _ in reopened.search("plum groceries apple", 5)] == ["a"]
+    assert reopened.search("plum", 5, allowed={"b"}) == []
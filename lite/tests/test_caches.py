@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+from lite.src import ollama_client as oc
+from lite.src.caches import LRUCache, normalize_query
+
+
+def test_lru_evicts_oldest_and_counts_hits():
+    c = LRUCache(maxsize=2)
+    c.put("a", 1)
+    c.put("b", 2)
+    assert c.get("a") == 1
+    c.put("c", 3)  # evicts b, the least recently used
+    assert c.get("b") is None
+    assert c.get("c") == 3
+    s = c.stats()
+    assert s["size"] == 2 and s["hits"] == 2 and s["misses"] == 1
+
+
+def test_lru_entries_expire():
+    c = LRUCache(maxsize=4, ttl=0.05)
+    c.put("a", 1)
+    time.sleep(0.08)
+    assert c.get("a") is None
+    assert len(c) == 0
+
+
+def test_query_embeddings_are_reused(monkeypatch):
+    monkeypatch.setattr(oc, "FAKE_EMBED", False)
+    calls = []
+
+    def post(texts, model):
+        calls.append(list(texts))
+        return [[1.0, float(len(t))] for t in texts]
+
+    monkeypatch.setattr(oc, "_batcher", oc.EmbedBatcher(post, batch_size=8, window_ms=0))
+    monkeypatch.setattr(oc, "query_embeddings", lambda cache=LRUCache(8): cache)
+    a = oc.embed_query("  what   is  up ", "m")
+    b = asyncio.run(oc.aembed_query("what is up", "m"))
+    assert a == b and calls == [["what is up"]]
+    oc.embed_query("what is up", "other")
+    assert len(calls) == 2
+    assert normalize_query(" a\n b ") == "a b"
+
+
+def test_generation_bump_invalidates_retrieval_results():
+    from lite.src.caches import bump_generation, index_generation, retrieval_cache
+
+    g = index_generation()
+    retrieval_cache().put(("search", "q", g), ["hit"])
+    assert retrieval_cache().get(("search", "q", g)) == ["hit"]
+    assert bump_generation() == g + 1
+    assert retrieval_cache().get(("search", "q", g)) is None
+    assert len(retrieval_cache()) == 0
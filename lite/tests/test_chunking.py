@@ -0,0 +1,67 @@
+import random
+
+from lite.src.storage.chunking import CHUNKERS, chunk_spans, chunk_text, iter_chunks
+
+
+def _doc(seed=7):
+    rnd = random.Random(seed)
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+    secs = []
+    for h in range(10):
+        paras = [" ".join(rnd.choice(words) for _ in range(rnd.randint(10, 60))) for _ in range(rnd.randint(2, 8))]
+        secs.append(f"## Section {h}\n\n" + "\n\n".join(paras))
+    return "\n\n".join(secs) + "\n\n" + " ".join(rnd.choice(words) for _ in range(800))
+
+
+def test_fixed_mode_matches_sliding_window():
+    assert chunk_text("abcdefghij", 4, 1) == ["abcd", "defg", "ghij", "j"]
+    assert chunk_text("abc", 0, 0) == ["abc"]
+
+
+def test_structured_spans_cover_text_and_respect_size():
+    text = _doc()
+    spans = chunk_spans(text, 600, 0, "structured")
+    assert "".join(text[s:e] for s, e in spans) == text
+    for size, overlap in ((600, 0), (600, 80), (300, 50)):
+        assert max(len(c) for c in chunk_text(text, size, overlap, "structured")) <= size
+
+
+def test_structured_chunks_start_at_headings():
+    text = _doc()
+    starts = {s for s, _ in chunk_spans(text, 600, 0, "structured")}
+    heads = [i for i in range(len(text)) if text.startswith("## ", i)]
+    assert all(h in starts for h in heads)
+
+
+def test_local_edit_changes_few_structured_chunks():
+    text = _doc()
+    at = text.index("## Section 1")
+    edited = text[:at] + "one inserted line\n" + text[at:]
+    for mode, bound in (("structured", 2), ("fixed", None)):
+        a = chunk_text(text, 600, 60, mode)
+        b = chunk_text(edited, 600, 60, mode)
+        changed = len(set(b) - set(a))
+        if bound is not None:
+            assert changed <= bound
+        else:
+            assert changed > 5
+
+
+def test_rolling_hash_resyncs_inside_long_paragraph():
+    rnd = random.Random(3)
+    text = " ".join(rnd.choice(["ab", "cde", "fgh", "ijkl", "mn", "opq"]) for _ in range(3000))
+    edited = text[:2000] + " zz " + text[2000:]
+    a = chunk_text(text, 800, 100, "structured")
+    b = chunk_text(edited, 800, 100, "structured")
+    assert len(set(b) - set(a)) <= 2
+
+
+def test_iter_chunks_streams_the_same_spans():
+    text = ("# Title\n\n" + "word " * 300 + "\n\nshort para\n\n") * 20 + "tail " * 500
+    for mode in CHUNKERS:
+        for size in (5, 333, 4096):
+            pieces = [text[i:i + size] for i in range(0, len(text), size)]
+            got = list(iter_chunks(pieces, 400, 50, mode))
+            assert [(s, e) for s, e, _ in got] == chunk_spans(text, 400, 50, mode)
+            assert all(text[s:e] == t for s, e, t in got)
+    assert list(iter_chunks(["ab", "c"], 0, 0)) == [(0, 3, "abc")]
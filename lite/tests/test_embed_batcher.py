@@ -0,0 +1,56 @@
+import threading
+
+from lite.src.ollama_client import EmbedBatcher
+
+
+def _recorder():
+    calls = []
+    lock = threading.Lock()
+
+    def post(texts, model):
+        with lock:
+            calls.append((model, list(texts)))
+        return [[float(len(t)), float(len(model))] for t in texts]
+    return calls, post
+
+
+def test_batches_are_capped_and_results_line_up():
+    calls, post = _recorder()
+    b = EmbedBatcher(post, batch_size=3, window_ms=0)
+    out = b.embed(["a", "bb", "ccc", "dddd", "bb"], "m")
+    assert out == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0], [4.0, 1.0], [2.0, 1.0]]
+    assert [len(t) for _, t in calls] == [3, 1]
+    assert b.embed([], "m") == []
+
+
+def test_concurrent_calls_share_requests():
+    calls, post = _recorder()
+    b = EmbedBatcher(post, batch_size=64, window_ms=200)
+    results = {}
+    start = threading.Barrier(8)
+
+    def worker(i):
+        start.wait()
+        results[i] = b.embed([f"t{i}", "shared"], "m")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) < 8
+    assert sum(len(t) for _, t in calls) == 9
+    assert all(results[i] == [[float(len(f"t{i}")), 1.0], [6.0, 1.0]] for i in range(8))
+
+
+def test_errors_reach_every_caller():
+    def post(texts, model):
+        raise RuntimeError("down")
+
+    b = EmbedBatcher(post, batch_size=4, window_ms=0)
+    try:
+        b.embed(["x"], "m")
+    except RuntimeError as e:
+        assert str(e) == "down"
+    else:
+        raise AssertionError("expected failure")
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from lite.src.storage import embed_cache as ec_mod
+from lite.src.storage.embed_cache import EmbedCache, text_hash
+
+
+def _fake_embed(calls):
+    def fn(texts):
+        calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+    return fn
+
+
+def test_only_unseen_texts_are_embedded():
+    cache = EmbedCache(os.path.join(tempfile.mkdtemp(), "embed_cache"))
+    calls = []
+    first = cache.embed("m", ["aa", "bbb", "aa"], _fake_embed(calls))
+    assert first == [[2.0, 1.0], [3.0, 1.0], [2.0, 1.0]]
+    assert calls == [["aa", "bbb"]]
+    cache.embed("m", ["aa", "bbb", "cccc"], _fake_embed(calls))
+    assert calls[-1] == ["cccc"]
+    # another model never shares vectors
+    cache.embed("other", ["aa"], _fake_embed(calls))
+    assert calls[-1] == ["aa"]
+    s = cache.stats()
+    assert s["entries"] == 4 and s["misses"] == 4 and s["hits"] == 3
+
+
+def test_cache_persists_and_merges_parts_in_the_background(monkeypatch):
+    root = os.path.join(tempfile.mkdtemp(), "embed_cache")
+    cache = EmbedCache(root)
+    monkeypatch.setattr(ec_mod, "MAX_PARTS", 3)
+    merge, merged_on = cache.merge, []
+
+    def recording(*args, **kwargs):
+        merged_on.append(threading.current_thread())
+        return merge(*args, **kwargs)
+
+    monkeypatch.setattr(cache, "merge", recording)
+    for i in range(5):
+        cache.put("m", [f"t{i}"], [[float(i)]])
+        if cache._merging is not None:
+            cache._merging.join()
+    assert merged_on and threading.main_thread() not in merged_on
+    assert cache.stats()["parts"] <= 3
+    calls = []
+    again = EmbedCache(root).embed("m", [f"t{i}" for i in range(5)], _fake_embed(calls))
+    assert calls == []
+    assert again == [[float(i)] for i in range(5)]
+
+
+def test_memory_is_bounded_and_vectors_read_back():
+    root = os.path.join(tempfile.mkdtemp(), "embed_cache")
+    cache = EmbedCache(root, max_bytes=10 * 4 * 4)
+    for lo in range(0, 3000, 500):
+        cache.put("m", [f"t{i}" for i in range(lo, lo + 500)], [[float(i)] * 4 for i in range(lo, lo + 500)])
+    assert cache.stats()["resident_bytes"] <= 10 * 4 * 4
+    got = cache.get("m", ["t7", "t2999", "t1234", "missing"])
+    assert [v.tolist() for v in got[:3]] == [[7.0] * 4, [2999.0] * 4, [1234.0] * 4] and got[3] is None
+    assert all(v.dtype == np.float32 for v in got[:3])
+
+
+def test_merge_prunes_texts_no_chunk_uses():
+    root = os.path.join(tempfile.mkdtemp(), "embed_cache")
+    cache = EmbedCache(root)
+    cache.put("m", ["old", "kept"], [[1.0], [2.0]])
+    cache.put("other", ["kept"], [[3.0]])
+    assert cache.merge(keep={text_hash("kept")}) == 2
+    assert len(cache) == 2 and cache.get("m", ["old"]) == [None]
+    again = EmbedCache(root)
+    assert len(again) == 2 and cache.stats()["parts"] == 1
+    assert [v.tolist() for v in again.get("m", ["kept"]) + again.get("other", ["kept"])] == [[2.0], [3.0]]
+    # nothing left to drop: a single part is not rewritten
+    assert again.merge(keep={text_hash("kept")}) == 0
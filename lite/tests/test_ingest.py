@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+
+from lite.src import ingest as ing
+from lite.src.ingest import IngestJobs
+
+
+TEXT = "héllo wörld, a line of text about ingestion.\n" * 400
+
+
+def _spool(jobs, data=TEXT.encode("utf-8")):
+    job, part = jobs.create("doc.txt", 200, 20, "fixed")
+    with open(part, "wb") as f:
+        f.write(data)
+    return job["job_id"]
+
+
+class Recorder:
+    def __init__(self, fail_after=None):
+        self.ids = []
+        self.fail_after = fail_after
+
+    def __call__(self, docs):
+        if self.fail_after is not None and len(self.ids) >= self.fail_after:
+            raise RuntimeError("ollama down")
+        self.ids.extend(d["id"] for d in docs)
+        return len(docs)
+
+
+def test_job_streams_file_in_batches(monkeypatch):
+    monkeypatch.setattr(ing, "INGEST_BATCH_CHUNKS", 8)
+    monkeypatch.setattr(ing, "READ_BYTES", 1000)  # splits multi-byte characters across reads
+    add = Recorder()
+    jobs = IngestJobs(tempfile.mkdtemp(), add=add)
+    job_id = _spool(jobs)
+    done = jobs.submit(job_id).result(timeout=10)
+    assert done["status"] == "done" and done["progress"] == 1.0
+    assert done["chunks"] == done["written"] == len(add.ids) > 8
+    assert add.ids[0] == "doc.txt#0-200" and len(set(add.ids)) == len(add.ids)
+    assert not os.path.exists(jobs._path(job_id, "src"))
+
+
+def test_failed_job_retries_from_checkpoint(monkeypatch):
+    monkeypatch.setattr(ing, "INGEST_BATCH_CHUNKS", 8)
+    add = Recorder(fail_after=16)
+    jobs = IngestJobs(tempfile.mkdtemp(), add=add)
+    job_id = _spool(jobs)
+    failed = jobs.submit(job_id).result(timeout=10)
+    assert failed["status"] == "failed" and failed["chunks"] == 16
+    add.fail_after = None
+    done = jobs.submit(job_id).result(timeout=10)
+    assert done["status"] == "done" and len(add.ids) == len(set(add.ids)) == done["chunks"]
+
+
+def test_resume_after_crash_skips_stored_chunks(monkeypatch):
+    monkeypatch.setattr(ing, "INGEST_BATCH_CHUNKS", 8)
+    root = tempfile.mkdtemp()
+    first = Recorder()
+    jobs = IngestJobs(root, add=first)
+    job_id = _spool(jobs)
+    total = jobs.submit(job_id).result(timeout=10)["chunks"]
+    # rewind the record as if the process died after 3 batches
+    with open(jobs._path(job_id, "json"), encoding="utf-8") as f:
+        rec = json.load(f)
+    rec.update(status="running", chunks=24)
+    with open(jobs._path(job_id, "json"), "w", encoding="utf-8") as f:
+        json.dump(rec, f)
+    with open(jobs._path(job_id, "src"), "w", encoding="utf-8") as f:
+        f.write(TEXT)
+    interrupted, part = jobs.create("other.txt", 200, 20, "fixed")
+    open(part, "wb").close()
+    again = Recorder()
+    restarted = IngestJobs(root, add=again)
+    assert restarted.resume() == 1
+    done = restarted._futures[job_id].result(timeout=10)
+    assert done["status"] == "done" and done["chunks"] == total
+    assert again.ids == first.ids[24:]
+    # a half-spooled upload is dropped; it was never persisted as a job
+    assert restarted.get(interrupted["job_id"]) is None and not os.path.exists(part)
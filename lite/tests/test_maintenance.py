@@ -0,0 +1,122 @@
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from lite.src.storage import maintenance
+from lite.src.storage.maintenance import IOBudget, remove_stale_files
+from lite.src.storage.segments import SegmentStore
+
+
+def _touch(path, age=0, data=b"x"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    if age:
+        t = time.time() - age
+        os.utime(path, (t, t))
+    return path
+
+
+def test_budget_paces_after_burst():
+    b = IOBudget(1000)
+    t = time.monotonic()
+    b.spend(1000)
+    assert time.monotonic() - t < 0.05
+    b.spend(200)
+    assert b.slept > 0.1 and b.spent == 1200
+    free = IOBudget(0)
+    free.spend(10 ** 9)
+    assert free.slept == 0
+
+
+def test_stale_files_removed_but_recovery_copies_kept(monkeypatch):
+    meta = tempfile.mkdtemp()
+    rebuild = os.path.join(meta, "embeddings.rebuild")
+    monkeypatch.setattr(maintenance, "META_DIR", meta)
+    monkeypatch.setattr("lite.src.storage.rebuild.REBUILD_DIR", rebuild)
+    old = maintenance.STALE_AGE_S * 2
+    pd.DataFrame({"a": [1]}).to_parquet(os.path.join(meta, "groups.parquet"))
+    _touch(os.path.join(meta, "tabs.parquet"), data=b"torn")
+    keep = [
+        _touch(os.path.join(meta, "groups.parquet.tmp")),
+        _touch(os.path.join(meta, "tabs.parquet.bak"), age=old),
+        _touch(os.path.join(meta, "tabs.parquet.journal.bak"), age=old),
+        _touch(os.path.join(meta, "embeddings", "manifest.json.bak"), age=old),
+        _touch(os.path.join(rebuild, "rebuild.json.tmp"), age=old),
+    ]
+    gone = [
+        _touch(os.path.join(meta, "groups.parquet.bak"), age=old),
+        _touch(os.path.join(meta, "groups.parquet.journal.bak"), age=old),
+        _touch(os.path.join(meta, "notes_index.parquet.tmp"), age=old),
+        _touch(os.path.join(meta, "ingest", "abc.part"), age=old),
+        _touch(os.path.join(meta, "old.parquet.journal.bak"), age=old),
+    ]
+    out = remove_stale_files(IOBudget(0))
+    assert out == {"files": len(gone), "bytes": len(gone), "backups_kept": 2}
+    assert all(os.path.exists(p) for p in keep) and not any(os.path.exists(p) for p in gone)
+
+
+def test_sweep_removes_only_old_unreferenced_segments():
+    store = SegmentStore(os.path.join(tempfile.mkdtemp(), "embeddings"))
+    store.put_notes({"a": [{"note_id": "a", "chunk_index": 0, "text": "t", "embedding": [1.0], "updated_at": 1}]})
+    live = store.manifest()["segments"][0]["file"]
+    os.utime(os.path.join(store.root, live), (1, 1))
+    _touch(os.path.join(store.root, "seg-00000009-dead.parquet"), age=maintenance.STALE_AGE_S * 2, data=b"abc")
+    _touch(os.path.join(store.root, "merged-new.parquet"))
+    assert store.sweep(maintenance.STALE_AGE_S) == (1, 3)
+    assert sorted(f for f in os.listdir(store.root) if f.endswith(".parquet")) == sorted([live, "merged-new.parquet"])
+    assert len(store.read()) == 1
+
+
+class _Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def spend(self, n):
+        self.calls.append(int(n))
+
+
+def test_merges_charge_the_budget_per_batch(monkeypatch):
+    from lite.src.storage import embed_cache, matrix_store
+
+    monkeypatch.setattr(SegmentStore, "maybe_merge", lambda self: None)
+    monkeypatch.setattr(matrix_store, "COPY_ROWS", 16)
+    store = matrix_store.MatrixStore(os.path.join(tempfile.mkdtemp(), "embeddings.mmap"))
+    for i in range(4):
+        store.put_notes({f"n{i}": [{"note_id": f"n{i}", "chunk_index": j, "text": "t", "embedding": [1.0] * 8,
+                                    "updated_at": 1} for j in range(40)]})
+    b = _Recorder()
+    store.merge(full=True, budget=b)
+    # 40 rows per segment copied 16 at a time, each read and written
+    assert b.calls.count(2 * 16 * 8 * 4) == 8 and b.calls.count(2 * 8 * 8 * 4) == 4
+
+    monkeypatch.setattr(embed_cache, "ROW_GROUP", 10)
+    ec = embed_cache.EmbedCache(os.path.join(tempfile.mkdtemp(), "embed_cache"))
+    for lo in range(0, 60, 30):
+        ec.put("m", [f"t{i}" for i in range(lo, lo + 30)], [[float(i)] * 4 for i in range(lo, lo + 30)])
+    b = _Recorder()
+    assert ec.merge(budget=b) == 2
+    assert len(b.calls) == 12 and max(b.calls) < sum(b.calls) / 4
+
+
+def test_metadata_folds_are_charged_before_they_run(monkeypatch):
+    from lite.src.storage import journal
+
+    d = tempfile.mkdtemp()
+    tables = [journal.JournaledTable(os.path.join(d, f"t{i}.parquet"), ["k", "v"]) for i in range(2)]
+    for t in tables:
+        t.upsert([{"k": j, "v": "x" * 50} for j in range(20)], key=["k"])
+    monkeypatch.setattr(journal, "_tables", {t.path: t for t in tables})
+    pending = []
+
+    class Checking(_Recorder):
+        def spend(self, n):
+            super().spend(n)
+            pending.append(sum(os.path.exists(t.journal_path) for t in tables))
+
+    b = Checking()
+    assert journal.checkpoint_all(b) == 2
+    # one charge per table, each while its journal is still unfolded
+    assert pending == [2, 1] and all(n > 1000 for n in b.calls)
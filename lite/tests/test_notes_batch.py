@@ -0,0 +1,79 @@
+import os
+import tempfile
+
+import pytest
+
+from lite.src.storage import notes as notes_store
+from lite.src.storage.bm25 import BM25Index
+from lite.src.storage.metadata import SCHEMAS
+from lite.src.storage.sqlite_store import SqliteDB
+from lite.src.storage.trigram import TrigramIndex
+
+
+@pytest.fixture
+def store(monkeypatch):
+    d = tempfile.mkdtemp()
+    db = SqliteDB(os.path.join(d, "metadata.sqlite3"), SCHEMAS)
+    tri, bm = TrigramIndex(os.path.join(d, "tri.npz")), BM25Index(os.path.join(d, "bm25.npz"))
+    monkeypatch.setattr(notes_store, "NOTES_DIR", os.path.join(d, "notes"))
+    monkeypatch.setattr(notes_store, "table", db.table)
+    monkeypatch.setattr(notes_store, "transaction", db.transaction)
+    monkeypatch.setattr(notes_store, "trigram_index", lambda: tri)
+    monkeypatch.setattr(notes_store, "bm25_index", lambda: bm)
+    return db, tri, bm
+
+
+def test_batch_applies_items_in_order(store):
+    db, tri, bm = store
+    a = notes_store.create_note("A", "alpha text")
+    b = notes_store.create_note("B", "beta text")
+    db.table("group_notes").upsert([{"group_id": "g", "note_id": b["id"], "position": 0}], key=["group_id", "note_id"])
+    out = notes_store.apply_batch([
+        {"op": "create", "title": None, "content": "gamma first line\nmore"},
+        {"op": "update", "id": a["id"], "content": "alpha rewritten"},
+        {"op": "update", "id": a["id"], "title": "A2"},
+        {"op": "delete", "id": b["id"]},
+        {"op": "update", "id": b["id"], "title": "gone"},
+        {"op": "update", "id": "missing"},
+    ])
+    res = out["results"]
+    assert [r["ok"] for r in res] == [True, True, True, True, False, False]
+    assert res[0]["title"] == "gamma first line" and res[2]["title"] == "A2"
+    assert out["deleted"] == [b["id"]] and set(out["written"]) == {res[0]["id"], a["id"]}
+    assert notes_store.get_note(a["id"])["content"] == "alpha rewritten"
+    assert notes_store.get_note(a["id"])["title"] == "A2"
+    with pytest.raises(FileNotFoundError):
+        notes_store.get_note(b["id"])
+    assert db.table("group_notes").rows({}) == []
+    assert tri.candidates("rewritten") == {a["id"]} and not tri.candidates("beta")
+    assert [nid for nid, _ in bm.search("gamma", 5)] == [res[0]["id"]]
+
+
+def test_atomic_batch_writes_nothing_on_error(store):
+    db, _, _ = store
+    a = notes_store.create_note("A", "alpha")
+    before = db.table("notes_index").read()
+    out = notes_store.apply_batch([
+        {"op": "update", "id": a["id"], "content": "changed"},
+        {"op": "create", "content": "new"},
+        {"op": "delete", "id": "missing"},
+    ], atomic=True)
+    assert not out["applied"] and [r["ok"] for r in out["results"]] == [False, False, False]
+    assert out["results"][2]["error"].startswith("Note not found")
+    assert db.table("notes_index").read().equals(before)
+    assert notes_store.get_note(a["id"])["content"] == "alpha"
+
+
+def test_keyword_search_resyncs_only_when_the_notes_index_changed(store, monkeypatch):
+    db, tri, bm = store
+    a = notes_store.create_note("A", "alpha text here")
+    notes_store.create_note("B", "beta text")
+    sync, calls = tri.sync, []
+    monkeypatch.setattr(tri, "sync", lambda *args: calls.append(1) or sync(*args))
+    hits = notes_store.search_keyword("alpha")
+    assert [(h["id"], h["title"]) for h in hits] == [(a["id"], "A")]
+    assert notes_store.search_keyword("text") and len(calls) == 1
+    notes_store.update_note(a["id"], None, "gamma text")
+    assert [h["id"] for h in notes_store.search_keyword("gamma")] == [a["id"]]
+    assert len(calls) == 2
+    assert [h["title"] for h in notes_store.search_ranked("gamma")] == ["A"]
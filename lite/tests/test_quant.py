@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from lite.src import quant
+from lite.src.retrieval import EmbeddingIndex
+
+
+@pytest.mark.parametrize("level", ["int8", "binary"])
+def test_quantized_search_reranks_to_exact_results(level, clustered_frame):
+    df = clustered_frame(dim=64, noise=0.5)
+    ix = EmbeddingIndex.from_frame(df)
+    rng = np.random.default_rng(1)
+    found = 0
+    for q in np.vstack(df["embedding"].to_numpy())[rng.choice(len(df), 50, replace=False)]:
+        exact = {h["text"] for h in ix.search(q, 5, candidates=5, lambda_=1.0)}
+        hits = ix.search(q, 5, candidates=5, lambda_=1.0, quantization=level)
+        found += len(exact & {h["text"] for h in hits})
+        # survivors carry exact scores
+        assert np.isclose(hits[0]["score"], float(ix.matrix[int(hits[0]["text"][1:])] @ (q / np.linalg.norm(q))))
+    assert found >= 0.9 * 250
+    codes = ix.codes(level)
+    assert codes.nbytes < ix.matrix.nbytes / (3 if level == "int8" else 30)
+
+
+def test_codes_follow_appends_and_keep_keyword_hits(clustered_frame):
+    ix = EmbeddingIndex.from_frame(clustered_frame(600, dim=64, noise=0.5))
+    q = np.ones(64, dtype=np.float32)
+    ix.search(q, 1, candidates=1, quantization="int8")
+    assert ix.codes("int8").rows == 600
+    ix.upsert_note("new", ["a"], q[None, :], 5)
+    assert ix.search(q, 1, candidates=1, quantization="int8")[0]["note_id"] == "new"
+    # a keyword hit ranked low by the codes still joins the fused candidates
+    far = ix.search(-q, 1, candidates=1, lambda_=1.0)[0]["note_id"]
+    hits = ix.search(q, 2, candidates=2, quantization="binary", note_ranks={far: 1})
+    assert far in {h["note_id"] for h in hits}
+
+
+def test_unknown_level_is_rejected():
+    with pytest.raises(ValueError):
+        quant.Codes("int4", 8)
+
+
+def test_popcount_without_numpy_bitwise_count(monkeypatch):
+    x = np.random.default_rng(0).integers(0, 256, size=(50, 8)).astype(np.uint8)
+    want = np.unpackbits(x, axis=1).reshape(50, 8, 8).sum(axis=2)
+    assert np.array_equal(quant.popcount(x), want)
+    monkeypatch.setattr(quant, "_bitwise_count", None)
+    assert np.array_equal(quant.popcount(x), want)
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from lite.src import vectorstore
+from lite.src.storage import embed_cache as embed_cache_mod
+from lite.src.storage import notes as notes_store
+from lite.src.storage import rebuild
+from lite.src.storage.bm25 import BM25Index
+from lite.src.storage.embed_cache import EmbedCache
+from lite.src.storage.metadata import SCHEMAS
+from lite.src.storage.sqlite_store import SqliteDB
+from lite.src.storage.trigram import TrigramIndex
+from lite.src.vector_backends import make_backend
+
+
+def _vec(text):
+    return list(np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest()[:8], dtype=np.uint8) / 255.0 + 0.01)
+
+
+@pytest.fixture(params=["flat", "mmap"])
+def env(request, monkeypatch):
+    d = tempfile.mkdtemp()
+    db = SqliteDB(os.path.join(d, "metadata.sqlite3"), SCHEMAS)
+    tri, bm = TrigramIndex(os.path.join(d, "tri.npz")), BM25Index(os.path.join(d, "bm25.npz"))
+    monkeypatch.setattr(notes_store, "NOTES_DIR", os.path.join(d, "notes"))
+    monkeypatch.setattr(notes_store, "table", db.table)
+    monkeypatch.setattr(notes_store, "transaction", db.transaction)
+    monkeypatch.setattr(notes_store, "trigram_index", lambda: tri)
+    monkeypatch.setattr(notes_store, "bm25_index", lambda: bm)
+    backend = make_backend(request.param, root=os.path.join(d, "vectors"))
+    settings = {"CHUNK_SIZE": 100, "CHUNK_OVERLAP": 0, "CHUNKER": "fixed"}
+    monkeypatch.setattr(rebuild, "table", db.table)
+    monkeypatch.setattr(rebuild, "vector_backend", lambda: backend)
+    monkeypatch.setattr(rebuild, "load_settings", lambda: dict(settings))
+    monkeypatch.setattr(rebuild, "ensure_storage_dirs", lambda: None)
+    monkeypatch.setattr(rebuild, "REBUILD_BATCH_CHUNKS", 4)
+    monkeypatch.setattr(embed_cache_mod, "_cache", EmbedCache(os.path.join(d, "embed_cache")))
+    embedded = []
+
+    def embed(texts):
+        embedded.extend(texts)
+        return [_vec(t) for t in texts]
+
+    monkeypatch.setattr(vectorstore, "embed_texts", embed)
+    return {"root": os.path.join(d, "rebuild"), "backend": backend, "settings": settings, "embedded": embedded}
+
+
+def _interrupt_after_one_commit(monkeypatch, root):
+    commit, calls = rebuild._commit, []
+
+    def crashing(side, batch):
+        calls.append(list(batch))
+        if len(calls) > 1:
+            raise RuntimeError("killed")
+        return commit(side, batch)
+
+    monkeypatch.setattr(rebuild, "_commit", crashing)
+    with pytest.raises(RuntimeError):
+        rebuild.rebuild_index(workers=1, root=root)
+    monkeypatch.setattr(rebuild, "_commit", commit)
+    return calls[0]
+
+
+def _stored(backend, note_id):
+    return [t for _, (t, _) in sorted(backend.stored_vectors(note_id).items())]
+
+
+def test_interrupted_rebuild_resumes_keeping_live_edits_and_deletes(env, monkeypatch):
+    backend, root = env["backend"], env["root"]
+    ids = [notes_store.create_note(f"N{i}", f"note {i} " + "x" * 150)["id"] for i in range(5)]
+    done = _interrupt_after_one_commit(monkeypatch, root)
+    assert len(done) == 2 and rebuild._read_state(root)["phase"] == "embed"
+    edited, deleted = done
+    # the reindex queue writes edits to the live index while the rebuild is paused
+    notes_store.update_note(edited, None, "edited live")
+    backend.put_notes([(edited, "N", ["edited live"], [_vec("edited live")])], updated_at=1)
+    notes_store.delete_note(deleted)
+    backend.remove_notes([deleted])
+    env["embedded"].clear()
+
+    stats = rebuild.rebuild_index(workers=1, root=root)
+    # the edited note was already committed; the deleted one is no longer listed
+    assert stats["resumed"] == 1 and stats["done"] == stats["notes"] == 4
+    # only the notes not committed before the crash were embedded again
+    assert {t[:7] for t in env["embedded"]} == {f"note {i} " for i in range(2, 5)}
+    assert _stored(backend, edited) == ["edited live"]
+    assert backend.stored_vectors(deleted) == {}
+    for nid in ids[2:]:
+        text = notes_store.get_note(nid)["content"]
+        assert _stored(backend, nid) == [text[:100], text[100:]]
+    assert not os.path.exists(root)
+
+
+def test_changed_settings_restart_the_rebuild(env, monkeypatch):
+    backend, root = env["backend"], env["root"]
+    ids = [notes_store.create_note(f"N{i}", f"note {i} " + "y" * 150)["id"] for i in range(3)]
+    _interrupt_after_one_commit(monkeypatch, root)
+    env["settings"]["CHUNK_SIZE"] = 1000
+
+    stats = rebuild.rebuild_index(workers=1, root=root)
+    assert stats["resumed"] == 0 and stats["done"] == 3
+    assert rebuild._read_state(root) is None
+    for nid in ids:
+        assert _stored(backend, nid) == [notes_store.get_note(nid)["content"]]
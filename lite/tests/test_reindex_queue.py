@@ -0,0 +1,86 @@
+import os
+import tempfile
+import threading
+
+from lite.src import reindex_queue as rq
+from lite.src.reindex_queue import ReindexQueue
+
+
+def _queue(monkeypatch, fn, debounce=30, **kw):
+    monkeypatch.setattr(rq, "_debounce_ms", lambda: debounce)
+    return ReindexQueue(os.path.join(tempfile.mkdtemp(), "queue.json"), reindex=fn, **kw)
+
+
+def test_debounce_coalesces_and_batches(monkeypatch):
+    calls = []
+    q = _queue(monkeypatch, lambda ids: calls.append(sorted(ids)) or len(ids))
+    for _ in range(3):
+        q.enqueue(["a"])
+    q.enqueue(["b", "c"])
+    assert q.wait_idle(5)
+    assert calls == [["a", "b", "c"]]
+    st = q.status()
+    assert st["done"] == 3 and st["chunks"] == 3 and st["pending"] == 0 and st["in_flight"] == []
+
+
+def test_immediate_jumps_queue(monkeypatch):
+    gate, calls = threading.Event(), []
+
+    def fn(ids):
+        gate.wait(5)
+        calls.append(list(ids))
+        return 0
+
+    q = _queue(monkeypatch, fn, debounce=0, workers=1, batch=1)
+    q.enqueue(["first"], immediate=True)
+    q.enqueue(["slow1", "slow2"])
+    q.enqueue(["urgent"], immediate=True)
+    gate.set()
+    assert q.wait_idle(5)
+    assert calls[0] == ["first"] and calls[1] == ["urgent"]
+
+
+def test_pending_survives_restart_and_errors_retry(monkeypatch):
+    path = os.path.join(tempfile.mkdtemp(), "queue.json")
+    monkeypatch.setattr(rq, "_debounce_ms", lambda: 60_000)
+    ReindexQueue(path, reindex=lambda ids: 0).enqueue(["a", "b"])
+    monkeypatch.setattr(rq, "_debounce_ms", lambda: 0)
+    attempts = []
+
+    def flaky(ids):
+        attempts.append(list(ids))
+        # the batch and then each of its notes
+        if len(attempts) <= 3:
+            raise RuntimeError("ollama down")
+        return 1
+
+    q = ReindexQueue(path, reindex=flaky)
+    assert q.resume() == 2 and q.status()["pending"] == 2
+    # due a minute out; force it due now
+    for e in q._pending.values():
+        e["due"] = 0
+    q.enqueue([])
+    assert q.wait_idle(10)
+    st = q.status()
+    assert len(attempts) == 4 and st["done"] == 2 and st["failed"] == 0
+    assert st["last_errors"][0]["error"] == "RuntimeError: ollama down"
+    assert ReindexQueue(path).resume() == 0
+
+
+def test_one_failing_note_does_not_fail_its_batch(monkeypatch):
+    calls = []
+
+    def fn(ids):
+        calls.append(sorted(ids))
+        if "bad" in ids:
+            raise ValueError("unreadable")
+        return len(ids)
+
+    q = _queue(monkeypatch, fn, debounce=0, workers=1)
+    monkeypatch.setattr(rq, "MAX_ATTEMPTS", 1)
+    q.enqueue(["a", "bad", "b"])
+    assert q.wait_idle(5)
+    assert calls[0] == ["a", "b", "bad"] and sorted(calls[1:]) == [["a"], ["b"], ["bad"]]
+    st = q.status()
+    assert st["done"] == 2 and st["chunks"] == 2 and st["failed"] == 1
+    assert st["last_errors"][-1]["note_ids"] == ["bad"] and st["last_errors"][-1]["error"] == "ValueError: unreadable"
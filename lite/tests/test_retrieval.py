@@ -0,0 +1,149 @@
+import math
+import random
+import threading
+
+import numpy as np
+import pandas as pd
+
+from lite.src.retrieval import EmbeddingCache, EmbeddingIndex, mmr, rrf, top_n
+
+
+def _frame(n=200, dim=16, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        rows.append({
+            "note_id": f"n{i % 20}",
+            "chunk_index": i // 20,
+            "text": f"chunk {i}",
+            "embedding": [rng.uniform(-1, 1) for _ in range(dim)],
+            "updated_at": 1000 + i,
+        })
+    return pd.DataFrame(rows)
+
+
+def _cos(a, b):
+    na = math.sqrt(sum(x * x for x in a)) or 1.0
+    nb = math.sqrt(sum(x * x for x in b)) or 1.0
+    return sum(x * y for x, y in zip(a, b)) / (na * nb)
+
+
+def test_scores_match_bruteforce():
+    df = _frame()
+    index = EmbeddingIndex.from_frame(df)
+    q = list(df["embedding"].iloc[3])
+    hits = index.search(q, k=1, candidates=1)
+    expected = max(((_cos(q, r["embedding"]), r["note_id"], r["chunk_index"]) for _, r in df.iterrows()))
+    assert hits[0]["note_id"] == expected[1]
+    assert hits[0]["chunk_index"] == expected[2]
+    assert abs(hits[0]["score"] - expected[0]) < 1e-5
+
+
+def test_top_n_orders_best_first():
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3], dtype=np.float32)
+    assert top_n(scores, 3).tolist() == [1, 3, 2]
+    assert top_n(scores, 10).tolist() == [1, 3, 2, 4, 0]
+
+
+def test_mmr_skips_duplicates():
+    vecs = np.array([[1, 0], [1, 0], [0, 1]], dtype=np.float32)
+    scores = np.array([0.9, 0.9, 0.5], dtype=np.float32)
+    assert mmr(vecs, scores, 2, lambda_=0.5) == [0, 2]
+    assert mmr(vecs, scores, 2, lambda_=1.0) == [0, 1]
+
+
+def test_mask_restricts_notes_and_dates():
+    index = EmbeddingIndex.from_frame(_frame())
+    mask = index.mask(["n1", "n2"], date_start=1050)
+    hits = index.search(index.matrix[0], k=50, mask=mask)
+    assert hits
+    assert {h["note_id"] for h in hits} <= {"n1", "n2"}
+    assert all(h["chunk_index"] >= 2 for h in hits)
+
+
+def test_in_place_updates_replace_and_drop_rows():
+    index = EmbeddingIndex.from_frame(_frame(n=40))
+    before = len(index)
+    index.upsert_note("n1", ["a", "b", "c"], np.eye(3, 16), 5)
+    assert len(index) == before - 2 + 3
+    assert sorted(index.chunk_index[index.live & (index.note_ids == "n1")].tolist()) == [0, 1, 2]
+    index.remove_note("n1")
+    assert len(index) == before - 2
+    hits = index.search(np.eye(1, 16)[0], k=40)
+    assert "n1" not in {h["note_id"] for h in hits}
+    index.compact()
+    assert len(index) == index.matrix.shape[0]
+
+
+def test_snapshot_is_unaffected_by_later_updates():
+    index = EmbeddingIndex.from_frame(_frame(n=40))
+    view = index.snapshot()
+    q = view.matrix[0].copy()
+    index.remove_note("n0")
+    index.upsert_note("n1", ["x"], np.eye(1, 16), 5)
+    index.compact()
+    assert view.search(q, 1, lambda_=1.0, quantization="int8")[0]["note_id"] == "n0"
+    assert "n0" not in {h["note_id"] for h in index.search(q, 5)}
+    assert len(view) == 40 and len(index) == 37
+
+
+def test_reload_serves_the_stale_index_meanwhile(tmp_path):
+    path = tmp_path / "manifest.json"
+    path.write_text("1")
+    started, release = threading.Event(), threading.Event()
+    frames = [_frame(n=40), _frame(n=60)]
+    calls = []
+
+    def loader():
+        if calls:
+            started.set()
+            release.wait(5)
+        calls.append(1)
+        return frames[len(calls) - 1]
+
+    cache = EmbeddingCache(str(path), loader=loader)
+    old = cache.get()
+    path.write_text("22")
+    t = threading.Thread(target=cache.get)
+    t.start()
+    assert started.wait(5)
+    # the reload runs outside the lock: searches go on against the old index
+    assert cache.get() is old and len(cache.search(np.ones(16), 3)) == 3
+    release.set()
+    t.join(5)
+    assert len(cache.get()) == 60 and len(calls) == 2
+
+
+def test_merges_move_the_stat_without_a_reload(tmp_path):
+    path = tmp_path / "manifest.json"
+    path.write_text("1")
+    calls = []
+    cache = EmbeddingCache(str(path), loader=lambda: calls.append(1) or _frame(n=40))
+    index = cache.get()
+    s0, s1, s2 = cache._stat, (1, 1), (2, 2)
+    # a merge reported before the write it followed is patched in
+    cache.merged(s1, s2)
+    cache._patch(s0, lambda ix: None, after=s1)
+    assert cache._stat == s2 and cache._index is index
+    assert len(calls) == 1
+    # rows moved to other files: reloaded in the background
+    cache.merged((3, 3), (4, 4), remapped=True)
+    for t in threading.enumerate():
+        if t.name == "embeddings-reload":
+            t.join(5)
+    assert len(calls) == 2 and cache.get() is not index
+
+
+def test_rrf_fuses_rankings():
+    fused = rrf([["a", "b", "c"], ["c", "a"]])
+    assert [k for k, _ in fused] == ["a", "c", "b"]
+
+
+def test_hybrid_pulls_in_keyword_notes():
+    index = EmbeddingIndex.from_frame(_frame())
+    q = index.matrix[0]
+    plain = index.search(q, k=3)
+    far = min(({h["note_id"] for h in index.search(-q, k=1)}))
+    fused = index.search(q, k=3, note_ranks={far: 1}, lambda_=1.0)
+    assert far not in {h["note_id"] for h in plain}
+    assert far in {h["note_id"] for h in fused}
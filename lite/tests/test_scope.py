@@ -0,0 +1,87 @@
+import os
+import tempfile
+
+import numpy as np
+
+from lite.src.retrieval import EmbeddingIndex
+from lite.src.storage.journal import JournaledTable
+from lite.src.storage.scope import ScopeResolver
+
+
+def _resolver():
+    d = tempfile.mkdtemp()
+    notes = JournaledTable(os.path.join(d, "notes_index.parquet"), ["note_id", "title", "updated_at"])
+    members = JournaledTable(os.path.join(d, "group_notes.parquet"), ["group_id", "note_id"])
+    notes.upsert([{"note_id": f"s{i}", "title": "", "updated_at": 100 + i} for i in range(10)], key=["note_id"])
+    members.upsert([{"group_id": "g1", "note_id": f"s{i}"} for i in range(0, 10, 2)], key=["group_id", "note_id"])
+    members.upsert([{"group_id": "g2", "note_id": "s1"}], key=["group_id", "note_id"])
+    return notes, members, ScopeResolver(notes, members)
+
+
+def _ids(r, **kw):
+    b = r.resolve(**kw)
+    return None if b is None else sorted(ScopeResolver.ids(b))
+
+
+def test_filters_intersect():
+    _, _, r = _resolver()
+    assert r.resolve() is None
+    assert _ids(r, group_ids=["g1", "g2"]) == ["s0", "s1", "s2", "s4", "s6", "s8"]
+    assert _ids(r, group_ids=["g1"], note_ids=["s2", "s3", "s9"]) == ["s2"]
+    assert _ids(r, date_start=103, date_end=106) == ["s3", "s4", "s5", "s6"]
+    assert _ids(r, group_ids=["g1"], date_start=105) == ["s6", "s8"]
+    assert _ids(r, group_ids=["missing"]) == []
+    assert _ids(r, note_ids=["unknown"]) == []
+
+
+def test_follows_journal_writes():
+    notes, members, r = _resolver()
+    assert _ids(r, group_ids=["g2"]) == ["s1"]
+    members.upsert([{"group_id": "g2", "note_id": "s3"}], key=["group_id", "note_id"])
+    members.delete({"group_id": "g2", "note_id": "s1"})
+    notes.upsert([{"note_id": "s3", "title": "", "updated_at": 500}], key=["note_id"])
+    notes.delete({"note_id": "s5"})
+    assert _ids(r, group_ids=["g2"]) == ["s3"]
+    assert _ids(r, date_start=104, date_end=109) == ["s4", "s6", "s7", "s8", "s9"]
+    assert _ids(r, date_start=400) == ["s3"]
+    members.delete({"group_id": "g1"})
+    assert _ids(r, group_ids=["g1"]) == []
+    # a checkpoint or an unexpected op forces a rebuild with the same answer
+    notes.checkpoint()
+    members.update({"note_id": "s3"}, {"group_id": "g1"})
+    assert _ids(r, group_ids=["g1"]) == ["s3"]
+    assert _ids(r, date_start=400) == ["s3"]
+
+
+def test_index_mask_with_bitmap():
+    _, _, r = _resolver()
+    rng = np.random.default_rng(0)
+    ids = [f"s{i % 10}" for i in range(40)]
+    idx = EmbeddingIndex(ids, [i // 10 for i in range(40)], [""] * 40, [0] * 40, rng.normal(size=(40, 8)))
+    bitmap = r.resolve(group_ids=["g2"])
+    m = idx.mask(bitmap)
+    assert m.sum() == 4 and set(np.asarray(ids)[m]) == {"s1"}
+    assert (m == idx.mask(["s1"])).all()
+    # ordinals allocated after the bitmap was built are outside the scope
+    idx.upsert_note("late", ["x"], rng.normal(size=(1, 8)), 0)
+    assert not idx.mask(bitmap)[-1]
+
+
+def test_chat_dates_follow_the_note_not_its_chunks(monkeypatch):
+    from lite.src import app, vector_backends
+    from lite.src.storage import notes as notes_store
+
+    notes, _, r = _resolver()
+    backend = vector_backends.make_backend("flat", root=tempfile.mkdtemp())
+    rng = np.random.default_rng(0)
+    # s5's chunks were written long before its last edit, which left their text unchanged
+    backend.put_notes([("s5", "", ["five"], rng.normal(size=(1, 8))), ("s9", "", ["nine"], rng.normal(size=(1, 8)))],
+                      updated_at=1)
+    monkeypatch.setattr(vector_backends, "vector_backend", lambda: backend)
+    monkeypatch.setattr(app, "load_settings", lambda: {})
+    monkeypatch.setattr(notes_store, "note_titles", lambda ids: {})
+    body = app.ChatIn(prompt="q", date_start=103, date_end=106)
+    allowed = r.resolve(date_start=103, date_end=106)
+    assert app._chat_state(allowed) == "ok"
+    _, citations = app._chat_context(body, allowed, np.ones(8, dtype=np.float32))
+    assert [c["note_id"] for c in citations] == ["s5"]
@@ -0,0 +1,136 @@
+import os
+import tempfile
+
+import pytest
+
+from lite.src.storage.segments import SegmentStore
+from lite.src.storage import segments
+
+
+def _rows(note_id, n, ts=1):
+    return [
+        {"note_id": note_id, "chunk_index": i, "text": f"{note_id}-{i}", "embedding": [float(i), 1.0], "updated_at": ts}
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def no_background_merge(monkeypatch):
+    monkeypatch.setattr(SegmentStore, "maybe_merge", lambda self: None)
+
+
+def test_put_replace_and_delete_notes(no_background_merge):
+    store = SegmentStore(os.path.join(tempfile.mkdtemp(), "embeddings"))
+    store.put_notes({"a": _rows("a", 3), "b": _rows("b", 2)})
+    store.put_notes({"a": _rows("a", 1, ts=2)})
+    store.delete_notes(["b"])
+    df = store.read()
+    assert sorted(df["text"].tolist()) == ["a-0"]
+    assert df["updated_at"].tolist() == [2]
+    m = store.manifest()
+    assert len(m["segments"]) == 2
+    assert "b" in m["tombstones"] and "b" not in m["notes"]
+    assert store.read_note("a")["text"].tolist() == ["a-0"]
+
+
+def test_merge_keeps_live_rows_and_retires_segments(no_background_merge):
+    root = os.path.join(tempfile.mkdtemp(), "embeddings")
+    store = SegmentStore(root)
+    for i in range(5):
+        store.put_notes({f"n{i}": _rows(f"n{i}", 2)})
+    store.put_notes({"n0": _rows("n0", 1, ts=9)})
+    store.delete_notes(["n1"])
+    before = store.read().sort_values(["note_id", "chunk_index"]).reset_index(drop=True)
+    assert store.merge() == 6
+    m = store.manifest()
+    assert len(m["segments"]) == 1 and not m["tombstones"]
+    files = [f for f in os.listdir(root) if f.endswith(".parquet")]
+    assert files == [m["segments"][0]["file"]]
+    after = store.read().sort_values(["note_id", "chunk_index"]).reset_index(drop=True)
+    assert after[["note_id", "chunk_index", "text"]].equals(before[["note_id", "chunk_index", "text"]])
+
+
+def test_background_merge_is_triggered(monkeypatch):
+    monkeypatch.setattr(segments, "TIER_WIDTH", 2)
+    store = SegmentStore(os.path.join(tempfile.mkdtemp(), "embeddings"))
+    for i in range(4):
+        store.put_notes({f"n{i}": _rows(f"n{i}", 1)})
+    if store._merging is not None:
+        store._merging.join()
+    assert len(store.manifest()["segments"]) <= 2
+    assert len(store.read()) == 4
+
+
+def test_adopt_swaps_in_other_store_keeping_fresh_notes():
+    d = tempfile.mkdtemp()
+    live, side = SegmentStore(os.path.join(d, "embeddings")), SegmentStore(os.path.join(d, "side"))
+    live.put_notes({"a": _rows("a", 3), "b": _rows("b", 3), "gone": _rows("gone", 1)})
+    side.put_notes({"a": _rows("a", 1, ts=5), "b": _rows("b", 1, ts=5), "c": _rows("c", 1, ts=5)})
+    live.put_notes({"b": _rows("b", 2, ts=7)})
+    live.adopt(side, keep=["b"], skip=["c"], tag="r1")
+    df = live.read().sort_values(["note_id", "chunk_index"])
+    assert list(zip(df["note_id"], df["updated_at"])) == [("a", 5), ("b", 7), ("b", 7)]
+    m = live.manifest()
+    assert m["adopted"] == "r1" and set(m["notes"]) == {"a", "b"}
+    # the side store is left intact; the old segment holding only dead rows is gone
+    assert len(side.read()) == 3
+    assert len([f for f in os.listdir(live.root) if f.endswith(".parquet")]) == 2
+
+
+def test_tiered_merge_keeps_edit_cost_off_the_base_segment(monkeypatch):
+    store = SegmentStore(os.path.join(tempfile.mkdtemp(), "embeddings"))
+    store.put_notes({f"n{i}": _rows(f"n{i}", 2) for i in range(2000)})
+    base = store.manifest()["segments"][0]["file"]
+    base_bytes = os.path.getsize(store._segment_path(base))
+    merged = []
+    write = SegmentStore._write_segment
+
+    def counted(self, name, df, m):
+        extra = write(self, name, df, m)
+        if name.startswith("merged-"):
+            merged.append(os.path.getsize(self._segment_path(name)))
+        return extra
+
+    monkeypatch.setattr(SegmentStore, "_write_segment", counted)
+    for i in range(40):
+        store.put_notes({f"n{i}": _rows(f"n{i}", 2, ts=2)})
+        if store._merging is not None:
+            store._merging.join()
+    # only the small edit segments were merged; the base was never rewritten
+    assert merged and base in {s["file"] for s in store.manifest()["segments"]}
+    assert sum(merged) / 40 < 0.05 * base_bytes
+    assert len(store.manifest()["segments"]) < 10
+    # once most of its notes are rewritten elsewhere the base is compacted on its own
+    store.put_notes({f"n{i}": _rows(f"n{i}", 2, ts=3) for i in range(1200)})
+    store.merge()
+    assert base not in {s["file"] for s in store.manifest()["segments"]}
+    assert len(store.read()) == 4000
+
+
+def test_writes_append_manifest_deltas_instead_of_rewriting_it(no_background_merge):
+    root = os.path.join(tempfile.mkdtemp(), "embeddings")
+    store = SegmentStore(root)
+    store.put_notes({f"n{i}": _rows(f"n{i}", 1) for i in range(500)})
+    assert store.fold() and not store.fold()
+    base = os.stat(store.manifest_path)
+    store.put_notes({"n1": _rows("n1", 2, ts=2)})
+    store.delete_notes(["n2"])
+    store.put_notes({"x": _rows("x", 1), "n3": []})
+    # the manifest with every note is left alone; each write added one short journal line
+    after = os.stat(store.manifest_path)
+    assert (after.st_mtime_ns, after.st_size) == (base.st_mtime_ns, base.st_size)
+    assert os.path.getsize(store.journal_path) < 2000
+    m = store.manifest()
+    assert SegmentStore(root).manifest() == m
+    assert "n2" in m["tombstones"] and "n3" in m["tombstones"] and "x" in m["notes"]
+    # another process's appends are picked up
+    SegmentStore(root).put_notes({"y": _rows("y", 1)})
+    assert "y" in store.manifest()["notes"] and len(store.read()) == 501
+    # a merge folds the journal; lines left behind by a crash right after the swap are not replayed
+    journal = open(store.journal_path, "rb").read()
+    assert store.merge(full=True)
+    assert not os.path.exists(store.journal_path)
+    with open(store.journal_path, "wb") as f:
+        f.write(journal)
+    assert SegmentStore(root).manifest() == store.manifest()
+    assert len(SegmentStore(root).read()) == 501
@@ -0,0 +1,88 @@
+import os
+import tempfile
+
+from lite.src.storage.journal import JournaledTable
+from lite.src.storage.metadata import SCHEMAS
+from lite.src.storage.migrate import parquet_to_sqlite, sqlite_to_parquet
+from lite.src.storage.sqlite_store import SqliteDB
+
+
+OPS = [
+    {"op": "upsert", "key": ["group_id", "note_id"], "rows": [
+        {"group_id": "g1", "note_id": "a", "position": 0, "added_at": 1},
+        {"group_id": "g1", "note_id": "b", "position": 1, "added_at": 1},
+        {"group_id": "g2", "note_id": "a", "position": 0, "added_at": 2},
+    ]},
+    {"op": "upsert", "key": ["group_id", "note_id"], "rows": [{"group_id": "g1", "note_id": "a", "position": 5, "added_at": 3}]},
+    {"op": "update", "match": {"group_id": "g2"}, "set": {"position": 9}},
+    {"op": "update", "match": {"missing": 1}, "set": {"position": 7}},
+    {"op": "delete", "match": {"group_id": "g1", "note_id": "b"}},
+]
+
+
+def _db(d=None):
+    return SqliteDB(os.path.join(d or tempfile.mkdtemp(), "metadata.sqlite3"), SCHEMAS)
+
+
+def _sorted(rows):
+    return sorted(rows, key=lambda r: (r["group_id"], r["note_id"]))
+
+
+def test_ops_match_parquet_journal():
+    d = tempfile.mkdtemp()
+    jt = JournaledTable(os.path.join(d, "group_notes.parquet"), SCHEMAS["group_notes"]["columns"])
+    st = _db(d).table("group_notes")
+    for t in (jt, st):
+        t.append(OPS)
+    assert _sorted(st.rows({})) == _sorted(jt.rows({}))
+    assert [r["group_id"] for r in st.rows({"note_id": "a"})] == ["g2", "g1"]
+    assert st.rows({"note_id": ["b", "zz"]}) == [] and st.rows({"missing": 1}) == []
+    assert len(st.read()) == 2 and list(st.read().columns) == SCHEMAS["group_notes"]["columns"]
+
+
+def test_transaction_rolls_back_and_notifies_on_commit():
+    db = _db()
+    t = db.table("notes_index")
+    seen = []
+    t.subscribe(lambda before, after, ops: seen.append((before, after, ops)))
+    t.upsert([{"note_id": "a", "title": "A", "updated_at": 1}], key=["note_id"])
+    assert len(seen) == 1 and seen[0][1] == t.version()
+    try:
+        with db.transaction():
+            t.delete({"note_id": "a"})
+            db.table("groups").upsert([{"group_id": "g", "name": "G"}], key=["group_id"])
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    assert [r["title"] for r in t.rows({"note_id": "a"})] == ["A"]
+    assert db.table("groups").rows({}) == [] and len(seen) == 1
+    with db.transaction():
+        t.update({"note_id": "a"}, {"title": "B"})
+        assert len(seen) == 1
+    assert len(seen) == 2 and seen[1][2][0]["op"] == "update"
+    # another connection's commit changes the version
+    v = t.version()
+    other = SqliteDB(db.path, SCHEMAS)
+    other.table("notes_index").delete({"note_id": "a"})
+    assert t.version() != v and t.rows({}) == []
+
+
+def test_migration_round_trip():
+    d = tempfile.mkdtemp()
+    notes = JournaledTable(os.path.join(d, "notes_index.parquet"), SCHEMAS["notes_index"]["columns"])
+    notes.upsert([{"note_id": f"n{i}", "title": f"T{i}", "path": "p", "updated_at": i, "size": 1, "sha256": ""}
+                  for i in range(5)], key=["note_id"])
+    notes.checkpoint()
+    notes.delete({"note_id": "n4"})  # still only in the journal
+    groups = JournaledTable(os.path.join(d, "groups.parquet"))
+    groups.upsert([{"id": "g1", "name": "legacy"}], key=["id"])
+    db = _db(d)
+    counts = parquet_to_sqlite(db, d)
+    assert counts["notes_index"] == 4 and counts["tabs"] == 0
+    assert db.table("groups").rows({"group_id": "g1"})[0]["name"] == "legacy"
+    db.table("notes_index").update({"note_id": "n0"}, {"title": "changed"})
+    sqlite_to_parquet(db, d)
+    assert not os.path.exists(notes.journal_path)
+    back = JournaledTable(notes.path).read()
+    assert sorted(back["note_id"]) == ["n0", "n1", "n2", "n3"]
+    assert back.set_index("note_id").loc["n0", "title"] == "changed"
@@ -0,0 +1,78 @@
+import os
+import random
+import tempfile
+
+from lite.src.storage.trigram import TrigramIndex
+
+
+WORDS = ["alpha", "beta", "gamma", "delta", "Kappa", "lambda", "sigma", "omega", "zeta"]
+
+
+def _corpus(n=60, seed=3):
+    rng = random.Random(seed)
+    return {f"n{i}": (f"Title {i}", " ".join(rng.choice(WORDS) for _ in range(12))) for i in range(n)}
+
+
+def test_candidates_cover_every_substring_match():
+    path = os.path.join(tempfile.mkdtemp(), "trigrams.npz")
+    index = TrigramIndex(path)
+    docs = _corpus()
+    for nid, (title, body) in docs.items():
+        index.update(nid, title, body, sha=nid)
+    for q in ["kappa sig", "title 1", "mbda", "ta ze", "nomatch"]:
+        expected = {n for n, (t, b) in docs.items() if q in b.lower() or q in t.lower()}
+        cands = index.candidates(q)
+        assert expected <= cands
+    assert index.candidates("ab") is None
+
+
+def test_updates_and_removals_persist_through_a_snapshot():
+    path = os.path.join(tempfile.mkdtemp(), "trigrams.npz")
+    index = TrigramIndex(path)
+    index.update("a", "First", "hello world", sha="1")
+    index.update("b", "Second", "hello there", sha="2")
+    index.update("a", "First", "goodbye", sha="3")
+    index.remove("b")
+    assert index.candidates("hello") == set()
+    assert index.save() and not index.save()
+    reopened = TrigramIndex(path)
+    assert reopened.candidates("goodbye") == {"a"}
+    assert reopened.candidates("hello") == set()
+
+
+def test_sync_backfills_notes_missing_from_index():
+    path = os.path.join(tempfile.mkdtemp(), "trigrams.npz")
+    index = TrigramIndex(path)
+    index.update("gone", "Old", "stale text", sha="0")
+    bodies = {"x": "written elsewhere", "y": "another body"}
+    index.sync(1, [("x", "X", "sx"), ("y", "Y", "sy")], lambda nid: bodies[nid])
+    assert index.candidates("elsewhere") == {"x"}
+    assert index.candidates("stale") == set()
+
+
+def test_reopened_index_rereads_only_notes_changed_after_the_snapshot():
+    path = os.path.join(tempfile.mkdtemp(), "trigrams.npz")
+    index = TrigramIndex(path)
+    docs = _corpus()
+    for nid, (title, body) in docs.items():
+        index.update(nid, title, body, sha=nid)
+    index.save()
+    # edited and removed after the snapshot, e.g. before a crash
+    docs["n1"] = ("Title 1", "rewritten kappa text")
+    del docs["n2"]
+    reopened, read = TrigramIndex(path), []
+
+    def body(nid):
+        read.append(nid)
+        return docs[nid][1]
+
+    rows = [(nid, t, "edited" if nid == "n1" else nid) for nid, (t, _) in docs.items()]
+    reopened.sync(1, rows, body)
+    assert read == ["n1"]
+    for q in ["kappa sig", "title 1", "rewritten", "mbda"]:
+        expected = {n for n, (t, b) in docs.items() if q in b.lower() or q in t.lower()}
+        assert expected <= reopened.candidates(q)
+    assert "n2" not in reopened.candidates("title 2")
+    # loaded postings take new notes too
+    reopened.update("new", "", "kappa sigma", sha="x")
+    assert "new" in reopened.candidates("kappa sig")
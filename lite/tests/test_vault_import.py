@@ -0,0 +1,63 @@
+import os
+import tempfile
+
+from lite.src.storage.notes import _split_frontmatter
+from lite.src.storage.vault_import import _frontmatter, _prepare, _vault_id, scan_vault, vault_path
+
+
+def _write(root, rel, text):
+    p = os.path.join(root, rel)
+    os.makedirs(os.path.dirname(p), exist_ok=True)
+    with open(p, "w", encoding="utf-8") as f:
+        f.write(text)
+    return p
+
+
+def test_scan_skips_hidden_and_other_files():
+    v = tempfile.mkdtemp()
+    for rel in ("a.md", "sub/b.markdown", "sub/c.txt", "img.png", ".obsidian/app.md", ".hidden.md"):
+        _write(v, rel, "x")
+    assert [os.path.relpath(p, v) for p in scan_vault(v)] == ["a.md", os.path.join("sub", "b.markdown"),
+                                                              os.path.join("sub", "c.txt")]
+
+
+def test_only_flat_frontmatter_is_split_off():
+    meta, body = _frontmatter("---\ntitle: Hello: world\nauthor: me\n---\nbody\n")
+    assert meta == {"title": "Hello: world", "author": "me"} and body == "body\n"
+    rich = "---\ntags:\n  - a\n---\nbody\n"
+    assert _frontmatter(rich) == ({}, rich)
+
+
+def test_prepare_writes_note_and_skips_unchanged():
+    v, notes = tempfile.mkdtemp(), tempfile.mkdtemp()
+    src = _write(v, "Daily/2024-01-01.md", "---\nmood: ok\n---\n# Day\n\ntext\n")
+    nid = _vault_id(src)
+    assert nid == _vault_id(os.path.join(v, "Daily", "..", "Daily", "2024-01-01.md"))
+    dest = os.path.join(notes, f"{nid}.md")
+    rec = _prepare((src, nid, dest, None, None))
+    assert rec["title"] == "2024-01-01" and not rec["unchanged"]
+    with open(dest, encoding="utf-8") as f:
+        meta, body = _split_frontmatter(f.read())
+    assert meta == {"id": nid, "title": "2024-01-01", "mood": "ok"} and body == "# Day\n\ntext\n"
+    again = _prepare((src, nid, dest, rec["sha256"], rec["title"]))
+    assert again["unchanged"]
+
+
+def test_crlf_frontmatter_is_split_off():
+    meta, body = _frontmatter("---\r\ntitle: Hi\r\nmood: ok\r\n---\r\nbody\r\n")
+    assert meta == {"title": "Hi", "mood": "ok"} and body == "body\r\n"
+    rich = "---\r\ntags:\r\n  - a\r\n---\r\nbody\r\n"
+    assert _frontmatter(rich) == ({}, rich)
+
+
+def test_vault_path_stays_inside_the_root():
+    root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(root, "work"))
+    real = os.path.realpath(root)
+    assert vault_path("work", root) == os.path.join(real, "work")
+    assert vault_path(os.path.join(root, "work"), root) == os.path.join(real, "work")
+    assert vault_path("../etc", root) is None and vault_path("/etc", root) is None
+    os.symlink("/etc", os.path.join(root, "out"))
+    assert vault_path("out", root) is None
+    # without a configured root nothing is allowed
+    assert vault_path("work", "") is None
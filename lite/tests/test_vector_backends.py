@@ -0,0 +1,195 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pytest
+
+from lite.src import vector_backends
+from lite.src.storage import notes as notes_store
+from lite.src.storage.matrix_store import MatrixStore
+from lite.src.vector_backends import NOTES, copy_backend, make_backend
+
+
+def _vec(seed, dim=8):
+    return np.random.default_rng(seed).normal(size=dim).astype(np.float32).tolist()
+
+
+@pytest.fixture(autouse=True)
+def _titles(monkeypatch):
+    monkeypatch.setattr(notes_store, "note_titles", lambda ids: {nid: nid.upper() for nid in ids})
+
+
+def _unit(v):
+    v = np.asarray(v, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_matrix_store_shares_one_mapped_file_and_merges(monkeypatch):
+    monkeypatch.setattr(MatrixStore, "maybe_merge", lambda self: None)
+    store = MatrixStore(os.path.join(tempfile.mkdtemp(), "embeddings.mmap"))
+    store.put_notes({"a": [{"note_id": "a", "chunk_index": i, "text": f"a{i}", "embedding": _vec(i), "updated_at": 1}
+                           for i in range(3)]})
+    store.put_notes({"b": [{"note_id": "b", "chunk_index": 0, "text": "b0", "embedding": _vec(9), "updated_at": 2}]})
+    store.delete_notes(["a"])
+    m = store.manifest()
+    assert {s["matrix"] for s in m["segments"]} == {m["matrix"]}
+    matrix, side = store.mapped()
+    assert isinstance(matrix, np.memmap) and matrix.shape == (4, 8)
+    assert side["row"].tolist() == [3] and np.allclose(matrix[3], _unit(_vec(9)))
+    # the dead sidecar is dropped; the vectors stay where they are
+    assert store.merge() == 1
+    assert store.mapped()[0].shape == (4, 8) and store.mapped()[1]["row"].tolist() == [3]
+    assert store.merge(full=True) == 1
+    df = store.read()
+    assert df["text"].tolist() == ["b0"]
+    assert np.allclose(df["embedding"].iloc[0], _unit(_vec(9)))
+    # the rewrite leaves one sidecar over a fresh file holding only the live row
+    assert sorted(f for f in os.listdir(store.root) if not f.startswith("manifest")) == sorted(
+        store._files(store.manifest()["segments"][0]))
+    assert store.mapped()[0].shape == (1, 8)
+
+
+def _rows(note, n, seed, t=1):
+    return {note: [{"note_id": note, "chunk_index": i, "text": f"{note}{i}", "embedding": _vec(seed + i),
+                    "updated_at": t} for i in range(n)]}
+
+
+def test_matrix_rewrite_does_not_block_writers(monkeypatch):
+    monkeypatch.setattr(MatrixStore, "maybe_merge", lambda self: None)
+    store = MatrixStore(os.path.join(tempfile.mkdtemp(), "embeddings.mmap"))
+    for i in range(4):
+        store.put_notes(_rows(f"n{i}", 2, 10 * i))
+    copy = store._copy_live
+    landed = []
+
+    def copy_then_write(*args):
+        out = copy(*args)
+        if not landed:
+            # writers keep going while the live rows are copied
+            t = threading.Thread(target=lambda: store.put_notes({**_rows("n1", 1, 70, 2), **_rows("n9", 1, 90, 2)}))
+            t.start()
+            t.join(5)
+            landed.append(not t.is_alive())
+        return out
+
+    monkeypatch.setattr(store, "_copy_live", copy_then_write)
+    assert store.merge(full=True) == 5 and landed == [True]
+    matrix, side = store.mapped()
+    # the writes landing during the copy were carried over to the new file (after
+    # the two rows of n1 copied before its edit)
+    assert matrix.shape == (10, 8) and len(store.manifest()["segments"]) == 2
+    df = store.read().sort_values(["note_id", "chunk_index"])
+    assert df["text"].tolist() == ["n00", "n01", "n10", "n20", "n21", "n30", "n31", "n90"]
+    assert np.allclose(np.vstack(df["embedding"].to_numpy())[2], _unit(_vec(70)))
+
+
+def test_matrix_adopt_rewrites_the_other_stores_rows_into_one_file():
+    store = MatrixStore(os.path.join(tempfile.mkdtemp(), "embeddings.mmap"))
+    side = MatrixStore(os.path.join(tempfile.mkdtemp(), "side.mmap"))
+    store.put_notes(_rows("a", 1, 0))
+    side.put_notes(_rows("b", 2, 10))
+    store.adopt(side, keep=["a"])
+    m = store.manifest()
+    assert {s["matrix"] for s in m["segments"]} == {m["matrix"]}
+    matrix, rows = store.mapped()
+    assert matrix.shape == (3, 8) and sorted(rows["text"]) == ["a0", "b0", "b1"]
+
+
+def test_failed_removals_are_retried_by_sweep(monkeypatch):
+    monkeypatch.setattr(MatrixStore, "maybe_merge", lambda self: None)
+    store = MatrixStore(os.path.join(tempfile.mkdtemp(), "embeddings.mmap"))
+    store.put_notes(_rows("a", 2, 0))
+    store.put_notes(_rows("a", 2, 5))
+    old = store.manifest()["matrix"]
+    remove = os.remove
+
+    def locked(path):
+        # a file still mapped elsewhere cannot be removed on Windows
+        if path.endswith(".f32"):
+            raise PermissionError(path)
+        remove(path)
+
+    monkeypatch.setattr(os, "remove", locked)
+    store.merge(full=True)
+    assert store.pending_removals() == [old] and os.path.exists(store._segment_path(old))
+    assert store.sweep()[0] == 0
+    monkeypatch.setattr(os, "remove", remove)
+    assert store.sweep()[0] == 1
+    assert store.pending_removals() == [] and not os.path.exists(store._segment_path(old))
+
+
+def test_mmap_backend_scores_the_mapped_file_in_place():
+    b = make_backend("mmap", root=tempfile.mkdtemp())
+    b.put_notes([(f"n{i}", "", [f"n{i}"], [_vec(i)]) for i in range(3)], 100)
+    b.cache.invalidate()
+    index = b.cache.get()
+    assert index.mapped and isinstance(index.matrix, np.memmap)
+    # edits append to the file and extend the same mapped index
+    b.put_notes([("n1", "", ["n1 new"], [_vec(7)]), ("n3", "", ["n3"], [_vec(8)])], 200)
+    assert b.cache.get() is index and index.mapped and len(index) == 4
+    assert b.search(_vec(7), 1)[0]["text"] == "n1 new"
+    b.remove_notes(["n0"])
+    assert b.cache.get() is index and sorted(b.note_counts()) == ["n1", "n2", "n3"]
+
+
+@pytest.mark.parametrize("name", ["flat", "mmap"])
+def test_resident_backend_writes_once_and_serves_both_endpoints(name):
+    b = make_backend(name, root=tempfile.mkdtemp())
+    notes = [(f"n{i}", "", [f"n{i} c{j}" for j in range(2)], [_vec(10 * i + j) for j in range(2)]) for i in range(4)]
+    assert b.put_notes(notes, 100) == 4
+    # unchanged chunk texts are not rewritten
+    assert b.put_notes(notes[:1], 200) == 0
+    assert b.note_counts() == {f"n{i}": 2 for i in range(4)}
+    hits = b.search(_vec(21), 1)
+    assert (hits[0]["note_id"], hits[0]["chunk_index"]) == ("n2", 1)
+    assert b.search(_vec(21), 3, ["n0"])[0]["note_id"] == "n0"
+    assert not b.in_scope(None, date_start=101)
+    assert b.add_documents([{"id": "f.txt#0-5", "text": "doc", "embedding": _vec(99)}]) == 1
+    assert b.add_documents([{"id": "f.txt#0-5", "text": "doc", "embedding": _vec(99)}]) == 0
+    res = b.query(_vec(99), 2)
+    assert res[0]["meta"] == {"source": "f.txt"} and res[0]["distance"] < 1e-5
+    # a note filter leaves documents out
+    assert [r["meta"] for r in b.query(_vec(99), 2, ["n3"])] == [{"note_id": "n3", "title": "N3"}] * 2
+    b.put_notes([("n1", "", [], [])], 300)
+    b.remove_notes(["n2"])
+    assert sorted(b.note_counts()) == ["n0", "n3"]
+    assert b.has_notes()
+
+
+@pytest.mark.parametrize("name", ["flat", "mmap"])
+def test_merges_keep_the_loaded_index(name, monkeypatch):
+    monkeypatch.setattr(vector_backends.SegmentStore, "maybe_merge", lambda self: None)
+    b = make_backend(name, root=tempfile.mkdtemp())
+    for i in range(6):
+        b.put_notes([(f"n{i}", "", [f"n{i}"], [_vec(i)])], 100 + i)
+    index = b.cache.get()
+    assert b.store.merge() > 0
+    assert b.cache.get() is index
+    b.put_notes([("n1", "", ["n1 new"], [_vec(7)])], 200)
+    assert b.cache.get() is index and b.search(_vec(7), 1)[0]["text"] == "n1 new"
+    if name == "mmap":
+        # a rewrite moves the rows to a new file: the index is reloaded in the background
+        b.store.merge(full=True)
+        for t in threading.enumerate():
+            if t.name == "embeddings-reload":
+                t.join(5)
+        assert b.cache.get() is not index and b.search(_vec(7), 1)[0]["text"] == "n1 new"
+
+
+def test_copy_between_backends_keeps_vectors_and_dates():
+    root = tempfile.mkdtemp()
+    src, dst = make_backend("flat", root=os.path.join(root, "a")), make_backend("mmap", root=os.path.join(root, "b"))
+    src.put_notes([("x", "", ["x0", "x1"], [_vec(1), _vec(2)])], 111)
+    src.put_notes([("y", "", ["y0"], [_vec(3)])], 222)
+    dst.put_notes([("stale", "", ["s"], [_vec(4)])], 1)
+    assert copy_backend(src, dst, NOTES) == 3
+    assert dst.note_counts() == {"x": 2, "y": 1}
+    assert dst.search(_vec(2), 1)[0]["chunk_index"] == 1
+    assert dst.in_scope(["x"], date_start=111, date_end=111) and not dst.in_scope(["x"], date_start=112)
+    assert dst.stored_vectors("y")[0][0] == "y0"
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        vector_backends.make_backend("faiss")